@@ -1,91 +1,51 @@
 import pandas as pd
-import numpy as np
-import MetaTrader5 as mt5
-from ta.volatility import BollingerBands
-from ta.trend import SMAIndicator
-import time
+from bbma_core import MT5Connection, SignalEngine
+from bbma_store import BarStore
 
-# --- Connect to MetaTrader 5 ---
-mt5.initialize()
-
-# --- User Input for Currency Pair ---
-symbol = input("Enter currency pair (e.g., EURUSD): ").strip().upper()
-timeframes = {
-    'M1': mt5.TIMEFRAME_M1,
-    'M5': mt5.TIMEFRAME_M5,
-    'M15': mt5.TIMEFRAME_M15,
-    'H1': mt5.TIMEFRAME_H1,
-    'H4': mt5.TIMEFRAME_H4,
-    'D1': mt5.TIMEFRAME_D1
-}
 num_candles = 1000  # Fetch 1000 Candles for Live Updates
+verify_interval = 60  # Cycles between drift checks against terminal-native bars (0 disables)
+wake_mode = 'bar_close'  # 'bar_close' wakes right after each M1 close (server time); 'tick' polls for new ticks
+data_hub = None  # Name of a running bbma_hub.py to read bars and ticks from (None polls the terminal directly)
+
+
+# --- Function to Report Drift Between Derived and Terminal-Native Bars ---
+def check_drift(engine):
+    for tf_name, mismatches in engine.check_drift().items():
+        print(f"Warning: {tf_name} bars drifted from terminal data at {len(mismatches)} points, e.g. {mismatches[0]}")
+
+
+def main():
+    # --- Connect to MetaTrader 5 ---
+    with MT5Connection(hub=data_hub) as mt5:
+        # --- User Input for Currency Pair ---
+        symbol = input("Enter currency pair (e.g., EURUSD): ").strip().upper()
+
+        # --- Signal Engine (M5..D1 Resampled From One M1 Fetch, One Streaming BBMA per Timeframe) ---
+        engine = SignalEngine(mt5, symbol, mt5.timeframes(), capacity=num_candles,
+                              bar_store=BarStore('data/bars'), wake_mode=wake_mode)
+        cycle = 0
 
-# --- Function to Fetch Latest Data ---
-def fetch_data(timeframe):
-    data = mt5.copy_rates_from_pos(symbol, timeframe, 0, num_candles)
-    df = pd.DataFrame(data)
-    df['time'] = pd.to_datetime(df['time'], unit='s')
-    df.set_index('time', inplace=True)
-    return df
+        # --- Real-Time Multi-Timeframe Analysis ---
+        while True:
+            timestamp = pd.Timestamp.now()
+            cycle += 1
 
-# --- Function to Perform BBMA Analysis ---
-def analyze_bbma(df):
-    bb = BollingerBands(close=df['close'], window=20, window_dev=2)
-    df['BB_Upper'] = bb.bollinger_hband()
-    df['BB_Lower'] = bb.bollinger_lband()
-    df['Mid_BB'] = bb.bollinger_mavg()
-    df['MA5_High'] = SMAIndicator(df['close'], window=5).sma_indicator()
-    df['MA10_High'] = SMAIndicator(df['close'], window=10).sma_indicator()
+            engine.update()  # Only timeframes whose bar closed since the last wake-up commit new bars
+            signals = engine.signals()
+            final_decision = engine.decision()
+            take_profit_suggestions = engine.take_profits()
 
-    df['Reentry'] = ((df['close'] < df['BB_Upper']) & (df['close'] > df['MA5_High'])) | \
-                    ((df['close'] > df['BB_Lower']) & (df['close'] < df['MA5_High']))
-    df['Momentum'] = ((df['close'] > df['BB_Upper']) & (df['close'].shift(1) < df['BB_Upper'])) | \
-                     ((df['close'] < df['BB_Lower']) & (df['close'].shift(1) > df['BB_Lower']))
+            print("\n========================================")
+            print(f"Timestamp: {timestamp}")
+            print(f"Signals: {signals}")
+            print(f"\nFinal Decision: {final_decision}")
+            print(f"Suggested Take Profit Points: {take_profit_suggestions}")
+            print(f"Signal latency: {engine.scheduler.mark_signal():.2f}s after bar close")
+            if verify_interval and cycle % verify_interval == 0:
+                check_drift(engine)
 
-    df['Signal'] = 'Hold'
-    df['Take_Profit'] = np.nan
-    
-    df.loc[df['Reentry'] & (df['Momentum']), 'Signal'] = 'Buy'
-    df.loc[df['Signal'] == 'Buy', 'Take_Profit'] = df['close'] + (df['BB_Upper'] - df['Mid_BB'])
-    
-    df.loc[df['Reentry'] & (~df['Momentum']), 'Signal'] = 'Sell'
-    df.loc[df['Signal'] == 'Sell', 'Take_Profit'] = df['close'] - (df['Mid_BB'] - df['BB_Lower'])
-    
-    return df
+            engine.scheduler.wait()
 
-# --- Real-Time Multi-Timeframe Analysis ---
-while True:
-    signals = {}
-    tp_values = {}
-    timestamp = pd.Timestamp.now()
-    
-    for tf_name, tf_value in timeframes.items():
-        df = fetch_data(tf_value)
-        df = analyze_bbma(df)
-        latest_signal = df[['close', 'Signal', 'Take_Profit']].tail(1)
-        signals[tf_name] = latest_signal['Signal'].values[0]
-        tp_values[tf_name] = round(latest_signal['Take_Profit'].values[0], 5) if not np.isnan(latest_signal['Take_Profit'].values[0]) else None
-    
-    if all(sig == 'Buy' for sig in signals.values()):
-        final_decision = 'BUY'
-    elif all(sig == 'Sell' for sig in signals.values()):
-        final_decision = 'SELL'
-    else:
-        final_decision = 'HOLD'
-    
-    take_profit_suggestions = {
-        'TP1 (M1)': tp_values.get('M1', None),
-        'TP2 (M15)': tp_values.get('M15', None),
-        'TP3 (H1)': tp_values.get('H1', None)
-    }
-    
-    print("\n========================================")
-    print(f"Timestamp: {timestamp}")
-    print(f"Signals: {signals}")
-    print(f"\nFinal Decision: {final_decision}")
-    print(f"Suggested Take Profit Points: {take_profit_suggestions}")
-    
-    time.sleep(60)
 
-# --- Shutdown MT5 Connection (Never Reached in Loop, but Useful for Debugging) ---
-mt5.shutdown()
+if __name__ == '__main__':
+    main()
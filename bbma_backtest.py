@@ -0,0 +1,197 @@
+"""Vectorized historical backtester for the BBMA signal rules.
+
+Indicators and signals come from single NumPy passes over the whole
+history (bbma_vector). Trades are simulated one position at a time, like
+learn_trade.py. Each entry fills at the next bar's open. The stop loss is
+the opposite band of the last closed M15 bar. The take profit is either
+that bar's near band (learn_trade.py) or the signal bar's Take_Profit
+(analisa_bbma.py). Exits are resolved intrabar on M1 high/low.
+
+Usage: python bbma_backtest.py EURUSD_M1.npy [--rules signal|filtered] [--tp m15_band|take_profit]
+       python bbma_backtest.py --symbol EURUSD [--store data/bars] [--start 2023-01-01] [--end 2024-01-01]
+"""
+import argparse
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from bbma_cache import as_rates, timeframe_seconds
+from bbma_resample import closed_bar_index, resample_rates
+from bbma_store import BarStore
+from bbma_vector import BUY, SELL, HOLD, bbma_signals, filtered_signals
+
+M1, M15 = 1, 15  # MetaTrader 5 timeframe constants
+EXIT_TP, EXIT_SL, EXIT_END = 1, 2, 3
+EXIT_NAMES = {EXIT_TP: 'tp', EXIT_SL: 'sl', EXIT_END: 'end'}
+
+TRADE_DTYPE = np.dtype([
+    ('entry_time', '<i8'),
+    ('exit_time', '<i8'),
+    ('direction', 'i1'),
+    ('entry', '<f8'),
+    ('exit', '<f8'),
+    ('tp', '<f8'),
+    ('sl', '<f8'),
+    ('pnl', '<f8'),
+    ('reason', 'i1'),
+])
+
+
+# --- Signal Series for the Whole History ---
+def signal_series(rates, rules='signal', lookback=1000, stride=60):
+    if rules == 'filtered':
+        result = filtered_signals(rates['high'], rates['low'], rates['close'], lookback=lookback, stride=stride)
+        return result['Filtered_Signal'], result['Take_Profit']
+    result = bbma_signals(rates['close'])
+    return result['Signal'], result['Take_Profit']
+
+
+def m15_bands(rates, base_timeframe=M1):
+    # BB_Upper/BB_Lower of the last closed M15 bar as seen from each base bar
+    m15 = resample_rates(rates, M15)
+    bands = bbma_signals(m15['close'])
+    idx = closed_bar_index(m15['time'], timeframe_seconds(M15), rates['time'], timeframe_seconds(base_timeframe))
+    upper = np.where(idx >= 0, bands['BB_Upper'][idx], np.nan)
+    lower = np.where(idx >= 0, bands['BB_Lower'][idx], np.nan)
+    return upper, lower
+
+
+# --- Intrabar Exit Resolution ---
+def find_exit(rates, start, direction, tp, sl, spread_price, ambiguous='sl'):
+    # Scans forward in doubling chunks for the first bar touching TP or SL. Bar prices are
+    # bid, so a short position exits on ask (bid + spread). A bar that opens beyond a level
+    # fills at its open; when one bar touches both levels, `ambiguous` decides:
+    # 'sl' (pessimistic), 'tp' (optimistic) or 'nearest' (level closer to the open first).
+    n = len(rates)
+    j = start
+    size = 64
+    ask_shift = spread_price if direction == SELL else 0.0
+    while j < n:
+        high = rates['high'][j:j + size] + ask_shift
+        low = rates['low'][j:j + size] + ask_shift
+        if direction == BUY:
+            tp_hit, sl_hit = high >= tp, low <= sl
+        else:
+            tp_hit, sl_hit = low <= tp, high >= sl
+        hit = tp_hit | sl_hit
+        if hit.any():
+            k = int(hit.argmax())
+            bar = j + k
+            bar_open = rates['open'][bar] + ask_shift
+            take = bool(tp_hit[k])
+            if tp_hit[k] and sl_hit[k]:
+                if ambiguous == 'nearest':
+                    take = abs(tp - bar_open) < abs(sl - bar_open)
+                else:
+                    take = ambiguous == 'tp'
+            level = tp if take else sl
+            if (direction == BUY) == take:  # Level above the entry: a gap up fills at the open
+                price = max(level, bar_open)
+            else:
+                price = min(level, bar_open)
+            return bar, price, EXIT_TP if take else EXIT_SL
+        j += size
+        size = min(size * 2, 65536)
+    return n - 1, rates['close'][n - 1] + ask_shift, EXIT_END
+
+
+# --- Trade Simulation (One Open Position at a Time) ---
+def simulate(rates, signals, take_profit, upper, lower, tp_mode='m15_band', point=0.0, ambiguous='sl'):
+    n = len(rates)
+    candidates = np.flatnonzero(signals[:-1] != HOLD)
+    trades = []
+    cursor = 0
+    while True:
+        k = np.searchsorted(candidates, cursor)
+        if k >= len(candidates):
+            break
+        i = candidates[k]
+        cursor = i + 1
+        direction = int(signals[i])
+        entry_bar = i + 1
+        spread_price = rates['spread'][entry_bar] * point
+        if direction == BUY:
+            entry = rates['open'][entry_bar] + spread_price
+            tp = upper[i] if tp_mode == 'm15_band' else take_profit[i]
+            sl = lower[i]
+            valid = tp > entry and sl < entry
+        else:
+            entry = rates['open'][entry_bar]
+            tp = lower[i] if tp_mode == 'm15_band' else take_profit[i]
+            sl = upper[i]
+            valid = tp < entry and sl > entry
+        if not valid:  # Missing bands, or stops on the wrong side of the fill (the broker would reject them)
+            continue
+        exit_bar, price, reason = find_exit(rates, entry_bar, direction, tp, sl, spread_price, ambiguous)
+        trades.append((rates['time'][entry_bar], rates['time'][exit_bar], direction, entry, price,
+                       tp, sl, direction * (price - entry), reason))
+        cursor = exit_bar
+    return np.array(trades, dtype=TRADE_DTYPE)
+
+
+def summarize(trades):
+    pnl = trades['pnl']
+    equity = np.cumsum(pnl)
+    drawdown = np.maximum.accumulate(np.r_[0.0, equity])[1:] - equity
+    gains, losses = pnl[pnl > 0].sum(), -pnl[pnl < 0].sum()
+    return {
+        'trades': len(trades),
+        'wins': int((pnl > 0).sum()),
+        'win_rate': float((pnl > 0).mean()) if len(pnl) else 0.0,
+        'total_pnl': float(equity[-1]) if len(pnl) else 0.0,
+        'avg_pnl': float(pnl.mean()) if len(pnl) else 0.0,
+        'profit_factor': float(gains / losses) if losses else None,  # Undefined without a losing trade
+        'max_drawdown': float(drawdown.max()) if len(pnl) else 0.0,
+        'tp_exits': int((trades['reason'] == EXIT_TP).sum()),
+        'sl_exits': int((trades['reason'] == EXIT_SL).sum()),
+    }
+
+
+def run_backtest(rates, rules='signal', tp_mode='m15_band', point=0.0, ambiguous='sl', lookback=1000, stride=60, signals=None):
+    # `rates` are M1 bars; pass `signals` to backtest another signal series on the same bars
+    rates = as_rates(rates)
+    started = time.perf_counter()
+    own_signals, take_profit = signal_series(rates, rules, lookback, stride)
+    signals = own_signals if signals is None else signals
+    upper, lower = m15_bands(rates)
+    trades = simulate(rates, signals, take_profit, upper, lower, tp_mode, point, ambiguous)
+    report = summarize(trades)
+    report['bars'] = len(rates)
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return trades, report
+
+
+def load_rates(path=None, symbol=None, store='data/bars', start=None, end=None):
+    # M1 bars from the bar store (`start`/`end` as YYYY-MM-DD, server time) or from a numpy.save file
+    if symbol:
+        start, end = (None if value is None else int(datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp())
+                      for value in (start, end))
+        return BarStore(store).rates(symbol.upper(), M1, start, end)
+    return np.load(path, mmap_mode='r')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the BBMA signal rules on M1 history.")
+    parser.add_argument('path', nargs='?', help="M1 rates saved with numpy.save (fields as returned by copy_rates_*)")
+    parser.add_argument('--symbol', help="Read M1 bars for this symbol from the bar store instead of a file")
+    parser.add_argument('--store', default='data/bars', help="Bar store root directory")
+    parser.add_argument('--start', help="First date to test (YYYY-MM-DD, server time)")
+    parser.add_argument('--end', help="Date to stop before (YYYY-MM-DD, server time)")
+    parser.add_argument('--rules', choices=['signal', 'filtered'], default='signal')
+    parser.add_argument('--tp', choices=['m15_band', 'take_profit'], default='m15_band')
+    parser.add_argument('--point', type=float, default=0.0, help="Symbol point size; enables spread costs")
+    parser.add_argument('--ambiguous', choices=['sl', 'tp', 'nearest'], default='sl')
+    parser.add_argument('--stride', type=int, default=60, help="Bars between filter threshold updates")
+    args = parser.parse_args()
+
+    if not (args.path or args.symbol):
+        parser.error("either a rates file or --symbol is required")
+    rates = load_rates(args.path, args.symbol, args.store, args.start, args.end)
+    trades, report = run_backtest(rates, args.rules, args.tp, args.point, args.ambiguous, stride=args.stride)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""Benchmarks for the hot paths, run against the offline fake terminal.
+
+Cases (each at every bar count and symbol count requested):
+  fetch    initial BarCache load and the per-cycle delta fetch (fetch_data)
+  analyze  BBMA indicators and signals over a whole history: vectorized, streaming and pandas (analyze_bbma)
+  cycle    one live MTF cycle: M1 delta fetch, local resampling and per-timeframe stream updates
+  retrain  first model fit and an incremental update on a trade log of that many rows (retrain_model)
+
+Results are written to data/bench/<timestamp>.json. The previous run in the
+same directory (or --compare FILE) is printed alongside for comparison.
+
+Usage: python bbma_bench.py [--sizes 1000,100000,10000000] [--symbols 1,10] [--cases fetch,analyze,cycle,retrain]
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+import bbma_fakemt5
+from bbma_cache import BarCache
+from bbma_core import analyze_bbma, default_timeframes, rates_frame
+from bbma_learn import TRADE_RECORD_DTYPE, IncrementalTrainer, TradeLog
+from bbma_quantile import RegimeFilter
+from bbma_resample import Resampler
+from bbma_scheduler import BarCloseScheduler
+from bbma_stream import BBMAStream
+from bbma_vector import bbma_signals, filtered_signals
+
+SYMBOLS = ['EURUSD', 'GBPUSD', 'USDJPY', 'AUDUSD', 'USDCAD', 'USDCHF', 'NZDUSD', 'EURGBP', 'EURJPY', 'GBPJPY',
+           'XAUUSD', 'XAGUSD', 'BTCUSD', 'ETHUSD', 'EURCHF', 'AUDJPY', 'CADJPY', 'CHFJPY', 'EURAUD', 'GBPAUD']
+MAX_BARS = {'fetch': 1000000, 'cycle': 100000, 'stream': 100000, 'pandas': 1000000, 'retrain': 100000}  # Larger sizes are skipped
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def symbol_names(count):
+    return [SYMBOLS[i] if i < len(SYMBOLS) else f"SYM{i:03d}" for i in range(count)]
+
+
+def fake_terminal(latency, symbols, bars, future=64):
+    # A fresh fake terminal behind the bbma_fakemt5 module, which the cases use as `mt5`
+    bbma_fakemt5.configure(symbols=symbols, bars=bars, future=future, latency=latency)
+    return bbma_fakemt5
+
+
+# --- Cases (each returns [(name, seconds, items processed)]) ---
+def bench_fetch(bars, symbols, repeat, latency):
+    names = symbol_names(symbols)
+    mt5 = bbma_fakemt5
+    timings = []
+
+    def initial():
+        fake_terminal(latency, names, bars)
+        cache = BarCache(mt5, capacity=bars)
+        for symbol in names:
+            cache.update(symbol, mt5.TIMEFRAME_M1)
+        return cache
+
+    timings.append(('fetch.initial', best_of(initial, repeat), bars * symbols))
+    cache = initial()
+    cycles = 20
+
+    def delta():
+        for _ in range(cycles):
+            mt5.advance()
+            for symbol in names:
+                cache.update(symbol, mt5.TIMEFRAME_M1)
+
+    timings.append(('fetch.delta', delta_seconds(delta, cycles), symbols))
+    return timings
+
+
+def delta_seconds(fn, cycles):
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) / cycles
+
+
+def bench_analyze(bars, symbols, repeat, latency):
+    rates = bbma_fakemt5.synthetic_rates(bars, 1577836800)
+    timings = [
+        ('analyze.vector', best_of(lambda: bbma_signals(rates['close']), repeat), bars),
+        ('analyze.filtered', best_of(lambda: filtered_signals(rates['high'], rates['low'], rates['close'], stride=60), repeat), bars),
+    ]
+    if bars <= MAX_BARS['stream']:
+        timings.append(('analyze.stream', best_of(lambda: BBMAStream().sync(rates), repeat), bars))
+        timings.append(('analyze.stream_regime', best_of(lambda: BBMAStream(reentry='Mid_BB', regime=RegimeFilter(20 * 1440)).sync(rates), repeat), bars))
+    if bars <= MAX_BARS['pandas']:
+        timings.append(('analyze.pandas', best_of(lambda: analyze_bbma(rates_frame(rates), reentry='Mid_BB', filters=True), repeat), bars))
+    return timings
+
+
+def bench_cycle(bars, symbols, repeat, latency):
+    names = symbol_names(symbols)
+    mt5 = fake_terminal(latency, names, bars)
+    timeframes = default_timeframes(mt5)
+    cache = BarCache(mt5, capacity=min(bars, 1000))  # Same window as the live scripts; `bars` is the terminal history
+    loops = []
+    for symbol in names:
+        loops.append((Resampler(cache, symbol, timeframes, mt5.TIMEFRAME_M1),
+                      BarCloseScheduler(mt5, symbol, timeframes),
+                      {name: BBMAStream() for name in timeframes}))
+
+    def cycle():
+        for resampler, scheduler, streams in loops:
+            rates = resampler.update()
+            for name in timeframes:
+                if scheduler.changed(name, rates[name]):
+                    streams[name].sync(rates[name])
+
+    started = time.perf_counter()
+    cycle()
+    timings = [('cycle.first', time.perf_counter() - started, symbols * len(timeframes))]
+    cycles = 20
+
+    def steady():
+        for _ in range(cycles):
+            mt5.advance()
+            cycle()
+
+    timings.append(('cycle.steady', delta_seconds(steady, cycles), symbols * len(timeframes)))
+    return timings
+
+
+def bench_retrain(bars, symbols, repeat, latency):
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as root:
+        log = TradeLog(os.path.join(root, 'trades.bin'))
+        entry = 1.1 + rng.normal(0, 0.01, bars)
+        records = np.zeros(bars, dtype=TRADE_RECORD_DTYPE)
+        records['entry'], records['tp'], records['sl'] = entry, entry + 0.001, entry - 0.001
+        records['win'] = rng.random(bars) > 0.5
+        with open(log.path, 'ab') as f:
+            f.write(records.tobytes())
+        trainer = IncrementalTrainer(os.path.join(root, 'model.joblib'), log)
+        started = time.perf_counter()
+        trainer.update()
+        timings = [('retrain.full', time.perf_counter() - started, min(bars, trainer.refit_window))]
+        timings.append(('retrain.idle', best_of(trainer.update, repeat), 0))
+
+        def incremental():
+            for i in range(10):
+                log.append(0, i, 1, 1.1, 1.101, 1.099, i % 2)
+            trainer.update()
+
+        timings.append(('retrain.incremental', best_of(incremental, repeat), min(trainer.window, bars)))
+    return timings
+
+
+CASES = {'fetch': bench_fetch, 'analyze': bench_analyze, 'cycle': bench_cycle, 'retrain': bench_retrain}
+PER_SYMBOL = {'fetch', 'cycle'}  # Cases repeated for every symbol count
+
+
+# --- Results ---
+def previous_results(out_dir):
+    paths = sorted(glob.glob(os.path.join(out_dir, '*.json')))
+    return paths[-1] if paths else None
+
+
+def print_results(results, baseline=None):
+    before = {}
+    if baseline:
+        with open(baseline) as f:
+            before = {(r['case'], r['bars'], r['symbols']): r['seconds'] for r in json.load(f)['results']}
+        print(f"Compared with {baseline}")
+    print(f"{'case':<22}{'bars':>10}{'symbols':>9}{'seconds':>12}{'us/item':>10}{'change':>9}")
+    for r in results:
+        old = before.get((r['case'], r['bars'], r['symbols']))
+        change = f"{(r['seconds'] / old - 1) * 100:+.0f}%" if old else '-'
+        per_bar = f"{r['seconds'] / r['processed'] * 1e6:.3f}" if r['processed'] else '-'
+        print(f"{r['case']:<22}{r['bars']:>10}{r['symbols']:>9}{r['seconds']:>12.6f}{per_bar:>10}{change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fetch, analysis, live cycle and retraining offline.")
+    parser.add_argument('--sizes', default='1000,100000,10000000', help="Comma-separated bar counts")
+    parser.add_argument('--symbols', default='1,10', help="Comma-separated symbol counts (fetch and cycle cases)")
+    parser.add_argument('--cases', default=','.join(CASES))
+    parser.add_argument('--repeat', type=int, default=3, help="Timed repetitions; the best is kept")
+    parser.add_argument('--latency', type=float, default=0.0, help="Simulated terminal latency per call (seconds)")
+    parser.add_argument('--out', default='data/bench', help="Directory for result files")
+    parser.add_argument('--compare', help="Result file to compare with (default: the latest in --out)")
+    args = parser.parse_args()
+
+    sizes = [int(value) for value in args.sizes.split(',')]
+    symbol_counts = [int(value) for value in args.symbols.split(',')]
+    results = []
+    for case in args.cases.split(','):
+        for bars in sizes:
+            if bars > MAX_BARS.get(case, bars):
+                print(f"{case}: skipping {bars} bars (limit {MAX_BARS[case]})")
+                continue
+            for symbols in symbol_counts if case in PER_SYMBOL else [1]:
+                for name, seconds, processed in CASES[case](bars, symbols, args.repeat, args.latency):
+                    results.append({'case': name, 'bars': bars, 'symbols': symbols,
+                                    'seconds': seconds, 'processed': processed})
+                    print(f"{name} bars={bars} symbols={symbols}: {seconds:.6f}s", flush=True)
+
+    os.makedirs(args.out, exist_ok=True)
+    baseline = args.compare or previous_results(args.out)
+    path = os.path.join(args.out, f"{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, 'w') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.platform(),
+            'latency': args.latency,
+            'results': results,
+        }, f, indent=1)
+    print()
+    print_results(results, baseline)
+    print(f"Saved {path}")
+
+
+if __name__ == '__main__':
+    main()
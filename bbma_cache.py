@@ -0,0 +1,193 @@
+"""Per-(symbol, timeframe) bar cache with delta fetches from MetaTrader 5.
+
+Each key owns a preallocated ring buffer. After the initial load only the
+last few bars are requested from the terminal: the forming bar is
+overwritten in place and newly closed bars are appended. `bars()` hands out
+zero-copy views that stay valid until the next update of that key.
+"""
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Same layout as the structured array returned by mt5.copy_rates_*
+RATE_DTYPE = np.dtype([
+    ('time', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('tick_volume', '<u8'),
+    ('spread', '<i4'),
+    ('real_volume', '<u8'),
+])
+
+# MetaTrader 5 TIMEFRAME_* constants, for code that runs without the terminal package
+TIMEFRAMES = {'M1': 1, 'M5': 5, 'M15': 15, 'M30': 30, 'H1': 0x4001, 'H4': 0x4004, 'D1': 0x4018}
+
+
+# --- Timeframe Length in Seconds (Decoded from the MT5 Constant) ---
+def timeframe_seconds(timeframe):
+    # MT5 encodes minutes as the plain count, hours with 0x4000, weeks with 0x8000
+    # and months with 0xC000 (e.g. TIMEFRAME_H4 == 0x4004, TIMEFRAME_D1 == 0x4018)
+    kind = timeframe & 0xC000
+    count = timeframe & 0x3FFF
+    if kind == 0:
+        return count * 60
+    if kind == 0x4000:
+        return count * 3600
+    if kind == 0x8000:
+        return count * 7 * 86400
+    return count * 30 * 86400  # Months are approximated as 30 days
+
+
+def timeframe_name(timeframe):
+    # 'M1', 'H4', 'D1', ... as used for the `timeframes` dicts and on-disk paths
+    seconds = timeframe_seconds(timeframe)
+    kind = timeframe & 0xC000
+    if kind == 0xC000:
+        return f"MN{timeframe & 0x3FFF}"
+    if kind == 0x8000:
+        return f"W{timeframe & 0x3FFF}"
+    if seconds % 86400 == 0:
+        return f"D{seconds // 86400}"
+    if seconds % 3600 == 0:
+        return f"H{seconds // 3600}"
+    return f"M{seconds // 60}"
+
+
+def as_rates(data):
+    # Normalise terminal output (or any record array with the same fields) to RATE_DTYPE
+    if data is None:
+        return np.empty(0, dtype=RATE_DTYPE)
+    data = np.asarray(data)
+    if data.dtype == RATE_DTYPE:
+        return data
+    rates = np.zeros(len(data), dtype=RATE_DTYPE)
+    for name in RATE_DTYPE.names:
+        if name in data.dtype.names:
+            rates[name] = data[name]
+    return rates
+
+
+# --- Mirrored Ring Buffer (Every Slot Is Written Twice So the Tail Is Always Contiguous) ---
+class BarRing:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buf = np.zeros(2 * capacity, dtype=RATE_DTYPE)
+        self.end = 0  # Next slot to write
+        self.size = 0
+
+    def _write(self, slots, rows):
+        self.buf[slots] = rows
+        self.buf[slots + self.capacity] = rows
+
+    def append(self, rows):
+        rows = rows[-self.capacity:]
+        slots = (self.end + np.arange(len(rows))) % self.capacity
+        self._write(slots, rows)
+        self.end = (self.end + len(rows)) % self.capacity
+        self.size = min(self.size + len(rows), self.capacity)
+
+    def overwrite_last(self, row):
+        slot = (self.end - 1) % self.capacity
+        self.buf[slot] = row
+        self.buf[slot + self.capacity] = row
+
+    def last_time(self):
+        if self.size == 0:
+            return None
+        return int(self.buf['time'][(self.end - 1) % self.capacity])
+
+    def view(self):
+        start = (self.end - self.size) % self.capacity
+        return self.buf[start:start + self.size]
+
+
+# --- Bar Cache ---
+class BarCache:
+    def __init__(self, mt5, capacity=1000, overlap=2, bar_store=None):
+        self.mt5 = mt5
+        self.capacity = capacity
+        self.overlap = overlap  # Bars re-requested per delta fetch (forming bar + the one that may have just closed)
+        self.bar_store = bar_store  # Optional BarStore that receives every bar once it has closed
+        self.rings = {}
+
+    def store(self, symbol, timeframe, data):
+        # Merge bars into the ring; returns how many new bars were appended
+        rates = as_rates(data)
+        if len(rates) == 0:
+            return 0
+        key = (symbol, timeframe)
+        ring = self.rings.get(key)
+        if ring is None:
+            ring = self.rings[key] = BarRing(self.capacity)
+        last_time = ring.last_time()
+        if last_time is None:
+            ring.append(rates)
+            appended = len(rates)
+        else:
+            times = rates['time']
+            same = np.flatnonzero(times == last_time)
+            if len(same):
+                ring.overwrite_last(rates[same[-1]])
+            newer = rates[times > last_time]
+            if len(newer):
+                ring.append(newer)
+            appended = len(newer)
+        if self.bar_store is not None and appended:
+            # Everything before the (new) forming bar has closed; the store skips bars it already has
+            self.persist(symbol, timeframe, ring.view()[-(appended + 1):-1] if last_time is not None else ring.view()[:-1])
+        return appended
+
+    def persist(self, symbol, timeframe, closed):
+        # Bars closed while nothing was storing them (a restart, a stall longer than the ring) are
+        # fetched from the terminal first; if that fails nothing is appended, so the next close retries
+        if len(closed) == 0:
+            return 0
+        series = self.bar_store.series(symbol, timeframe)
+        series.refresh()
+        last = series.last_time()
+        first = int(closed['time'][0])
+        if last is not None and first - last > timeframe_seconds(timeframe):
+            missing = self.mt5.copy_rates_range(symbol, timeframe, datetime.fromtimestamp(last + 1, tz=timezone.utc),
+                                                datetime.fromtimestamp(first - 1, tz=timezone.utc))
+            if missing is None:
+                print(f"{datetime.now():%H:%M:%S} Bar store: no {symbol} {timeframe_name(timeframe)} bars "
+                      f"between {last} and {first} from the terminal; not appending")
+                return 0
+            series.append(as_rates(missing))
+        return series.append(closed)
+
+    def update(self, symbol, timeframe):
+        ring = self.rings.get((symbol, timeframe))
+        last_time = None if ring is None else ring.last_time()
+        if last_time is None:
+            return self.store(symbol, timeframe, self.mt5.copy_rates_from_pos(symbol, timeframe, 0, self.capacity))
+
+        data = self.mt5.copy_rates_from_pos(symbol, timeframe, 0, self.overlap)
+        if data is None or len(data) == 0:
+            return 0
+        oldest = int(data['time'][0])
+        if oldest > last_time:
+            # More bars closed than the overlap covers; fetch just enough to bridge the gap
+            missing = (int(data['time'][-1]) - last_time) // timeframe_seconds(timeframe) + self.overlap
+            data = self.mt5.copy_rates_from_pos(symbol, timeframe, 0, min(missing, self.capacity))
+        return self.store(symbol, timeframe, data)
+
+    def bars(self, symbol, timeframe):
+        ring = self.rings.get((symbol, timeframe))
+        if ring is None:
+            return np.empty(0, dtype=RATE_DTYPE)
+        return ring.view()
+
+    def fetch(self, symbol, timeframe):
+        self.update(symbol, timeframe)
+        return self.bars(symbol, timeframe)
+
+    def frame(self, symbol, timeframe):
+        # DataFrame copy of the cached bars (no terminal call) for pandas-based analysis
+        import pandas as pd
+        df = pd.DataFrame(self.bars(symbol, timeframe))
+        df['time'] = pd.to_datetime(df['time'], unit='s')
+        df.set_index('time', inplace=True)
+        return df
@@ -0,0 +1,197 @@
+"""Cached, time-indexed economic calendar for the news filter.
+
+The ForexFactory calendar page is parsed once into structured events
+(UTC time, currency, impact, title) and saved to a JSON cache that is
+refreshed after `ttl` seconds. Queries such as "is there a high-impact
+event for this symbol's currencies within +/-N minutes" are answered from
+sorted per-currency time lists with bisect. Passing `html_path` parses a
+saved page instead of going to the network.
+"""
+import bisect
+import json
+import os
+import re
+import time
+from datetime import datetime, timezone
+
+CALENDAR_URL = "https://www.forexfactory.com/calendar"
+MONTHS = {name: i for i, name in enumerate(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+                                             'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], start=1)}
+
+
+# --- Page Parsing ---
+def _cell(row, *classes):
+    for name in classes:
+        cell = row.find("td", class_=name)
+        if cell is not None:
+            return cell
+    return None
+
+
+def _text(cell):
+    return cell.get_text(" ", strip=True) if cell is not None else ''
+
+
+def _impact(cell):
+    # Older pages carry a 'high' class, newer ones an icon--ff-impact-red span titled "High Impact Expected"
+    markup = str(cell).lower() if cell is not None else ''
+    if 'high' in markup or 'impact-red' in markup:
+        return 'high'
+    if 'medium' in markup or 'impact-ora' in markup:
+        return 'medium'
+    if 'low' in markup or 'impact-yel' in markup:
+        return 'low'
+    return 'none'
+
+
+def _nearest_year(month, day, reference):
+    # The page shows no year; pick the one that puts the date closest to when it was fetched
+    candidates = []
+    for year in (reference.year - 1, reference.year, reference.year + 1):
+        try:
+            candidates.append(datetime(year, month, day))
+        except ValueError:
+            continue
+    return min(candidates, key=lambda d: abs(d - reference.replace(tzinfo=None)))
+
+
+def parse_calendar(html, reference=None, source_tz='America/New_York'):
+    # Returns events sorted by time; rows without a clock time (All Day, Tentative) are skipped
+    from bs4 import BeautifulSoup
+    from zoneinfo import ZoneInfo
+
+    tz = ZoneInfo(source_tz)
+    reference = reference or datetime.now(timezone.utc)
+    soup = BeautifulSoup(html, "html.parser")
+    events = []
+    day = None
+    clock = None
+    for row in soup.find_all("tr", class_="calendar__row"):
+        date_text = _text(_cell(row, "calendar__date", "date"))
+        match = re.search(r'([A-Z][a-z]{2})\s*(\d{1,2})$', date_text)
+        if match and match.group(1) in MONTHS:
+            day = _nearest_year(MONTHS[match.group(1)], int(match.group(2)), reference)
+            clock = None
+        time_text = _text(_cell(row, "calendar__time", "time")).lower()
+        if time_text:
+            clock = time_text  # Blank time cells repeat the previous row's time
+        currency = _text(_cell(row, "calendar__currency", "currency")).upper()
+        title = _text(_cell(row, "calendar__event", "event"))
+        if day is None or not currency or not clock:
+            continue
+        match = re.match(r'(\d{1,2}):(\d{2})(am|pm)', clock)
+        if not match:
+            continue
+        hour = int(match.group(1)) % 12 + (12 if match.group(3) == 'pm' else 0)
+        local = day.replace(hour=hour, minute=int(match.group(2)), tzinfo=tz)
+        events.append({
+            'time': int(local.timestamp()),
+            'currency': currency,
+            'impact': _impact(_cell(row, "calendar__impact", "impact")),
+            'title': title,
+        })
+    events.sort(key=lambda event: event['time'])
+    return events
+
+
+def symbol_currencies(symbol):
+    # 'EURUSD' -> {'EUR', 'USD', 'ALL'}; broker suffixes such as 'EURUSDm' are ignored
+    letters = re.sub(r'[^A-Za-z]', '', symbol).upper()
+    currencies = {'ALL'}
+    if len(letters) >= 6:
+        currencies.update((letters[:3], letters[3:6]))
+    else:
+        currencies.add(letters)
+    return currencies
+
+
+# --- Calendar with Disk Cache and Per-Currency Time Index ---
+class EconomicCalendar:
+    def __init__(self, cache_path='data/calendar_cache.json', ttl=6 * 3600, source_tz='America/New_York',
+                 html_path=None, url=CALENDAR_URL, timeout=10):
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.source_tz = source_tz
+        self.html_path = html_path  # Parse this saved page instead of downloading (offline use)
+        self.url = url
+        self.timeout = timeout
+        self.events = []
+        self.fetched_at = None
+        self.index = {}
+
+    def _build_index(self):
+        self.index = {}
+        for event in self.events:
+            times, items = self.index.setdefault((event['currency'], event['impact']), ([], []))
+            times.append(event['time'])
+            items.append(event)
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return False
+        with open(self.cache_path) as f:
+            cached = json.load(f)
+        self.events = cached['events']
+        self.fetched_at = cached['fetched_at']
+        return True
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        tmp = self.cache_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'fetched_at': self.fetched_at, 'events': self.events}, f)
+        os.replace(tmp, self.cache_path)
+
+    def _download(self):
+        import requests
+        response = requests.get(self.url, headers={"User-Agent": "Mozilla/5.0"}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+    def refresh(self, force=False, now=None):
+        now = time.time() if now is None else now
+        if self.html_path:
+            if self.fetched_at is None or force:
+                with open(self.html_path, 'rb') as f:
+                    self.events = parse_calendar(f.read(), datetime.fromtimestamp(os.path.getmtime(self.html_path), timezone.utc), self.source_tz)
+                self.fetched_at = now
+                self._build_index()
+            return self.events
+        if not force and self.fetched_at is not None and now - self.fetched_at < self.ttl:
+            return self.events
+        if not force and self._load_cache() and now - self.fetched_at < self.ttl:
+            self._build_index()
+            return self.events
+        try:
+            self.events = parse_calendar(self._download(), datetime.fromtimestamp(now, timezone.utc), self.source_tz)
+            self.fetched_at = now
+            self._save_cache()
+        except Exception as e:
+            # Keep serving the stale events rather than failing the trading loop
+            print(f"Calendar refresh failed ({e}); using {len(self.events)} cached events")
+            self.fetched_at = now - self.ttl + min(self.ttl, 300)  # Retry in at most 5 minutes
+        self._build_index()
+        return self.events
+
+    def events_near(self, symbol, minutes=30, now=None, impact='high'):
+        # Events for the symbol's currencies within +/- `minutes` of `now` (UTC seconds)
+        now = time.time() if now is None else now
+        self.refresh(now=now)
+        window = minutes * 60
+        found = []
+        for currency in symbol_currencies(symbol):
+            times, items = self.index.get((currency, impact), ([], []))
+            lo = bisect.bisect_left(times, now - window)
+            hi = bisect.bisect_right(times, now + window)
+            found.extend(items[lo:hi])
+        return sorted(found, key=lambda event: event['time'])
+
+    def has_event(self, symbol, minutes=30, now=None, impact='high'):
+        return bool(self.events_near(symbol, minutes, now, impact))
+
+
+def format_event(event):
+    stamp = datetime.fromtimestamp(event['time'], timezone.utc)
+    return f"{stamp:%Y-%m-%d %H:%M} UTC - {event['currency']}: {event['title']}"
@@ -0,0 +1,223 @@
+"""Historical multi-timeframe consensus over M1 history in one vectorized pass.
+
+The live scripts compute the all-timeframes-agree decision (BUY/SELL/HOLD)
+only for the current bar. This module computes it for every M1 bar of the
+history at once:
+  - each timeframe is resampled from the M1 bars and its signal series is
+    computed once (bbma_vector);
+  - every series is aligned on the M1 timeline with an as-of join on the
+    latest higher-timeframe bar that had closed when the M1 bar closed, so
+    no bar sees a higher-timeframe close from its future;
+  - consensus() over the stacked, aligned codes gives the decision series.
+The report covers how often the timeframes agreed and the forward returns
+after each agreement. It also checks the Take_Profit suggestions (TP1 M1,
+TP2 M15, TP3 H1): distance from the close, side, and how often and how
+fast each was reached.
+
+Usage: python bbma_consensus.py EURUSD_M1.npy [--rules signal|filtered] [--horizons 15,60,240] [--tp-horizon 1440]
+       python bbma_consensus.py --symbol EURUSD [--store data/bars] [--start 2023-01-01] [--out consensus.npy]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from bbma_backtest import M1, load_rates
+from bbma_cache import TIMEFRAMES, as_rates, timeframe_seconds
+from bbma_core import TAKE_PROFIT_TIMEFRAMES, TIMEFRAME_NAMES
+from bbma_resample import closed_bar_index, resample_rates
+from bbma_vector import BUY, SELL, HOLD, SIGNAL_NAMES, bbma_signals, consensus, filtered_signals
+
+
+# --- Per-Timeframe Signal Series on the M1 Timeline ---
+def timeframe_signals(bars, timeframe, rules='signal', regime_days=20, stride=60):
+    # 'signal' re-enters against MA5_High (analisa_bbma_mtf.py, learn_trade.py); 'filtered' is
+    # bbma_signal.py's Filtered_Signal, with thresholds over `regime_days` trading days of bars
+    if rules == 'filtered':
+        lookback = max(int(regime_days * 86400 // timeframe_seconds(timeframe)), 1)
+        result = filtered_signals(bars['high'], bars['low'], bars['close'], lookback=lookback, stride=min(stride, lookback))
+        return result['Filtered_Signal'], result['Take_Profit']
+    result = bbma_signals(bars['close'])
+    return result['Signal'], result['Take_Profit']
+
+
+def consensus_series(rates, names=TIMEFRAME_NAMES, rules='signal', regime_days=20, stride=60):
+    # Per M1 bar: each timeframe's code from its latest closed bar, their consensus, and the
+    # Take_Profit suggestions of the TAKE_PROFIT_TIMEFRAMES that are in `names`
+    rates = as_rates(rates)
+    names = sorted(names, key=lambda name: timeframe_seconds(TIMEFRAMES[name]))
+    fields = [('time', '<i8')] + [(name, 'i1') for name in names] + [('Decision', 'i1')]
+    take_profits = {label: name for label, name in TAKE_PROFIT_TIMEFRAMES.items() if name in names}
+    fields += [(label, '<f8') for label in take_profits]
+    out = np.zeros(len(rates), dtype=fields)
+    out['time'] = rates['time']
+    tp_values = {}
+    for name in names:
+        timeframe = TIMEFRAMES[name]
+        bars = rates if timeframe == M1 else resample_rates(rates, timeframe)
+        signal, take_profit = timeframe_signals(bars, timeframe, rules, regime_days, stride)
+        if timeframe == M1:
+            out[name] = signal
+            tp_values[name] = take_profit
+            continue
+        index = closed_bar_index(bars['time'], timeframe_seconds(timeframe), rates['time'], timeframe_seconds(M1))
+        closed = index >= 0
+        out[name] = np.where(closed, signal[np.maximum(index, 0)], HOLD)
+        tp_values[name] = np.where(closed, take_profit[np.maximum(index, 0)], np.nan)
+    out['Decision'] = consensus(np.stack([out[name] for name in names]))
+    for label, name in take_profits.items():
+        out[label] = tp_values[name]
+    return out
+
+
+# --- Agreement Statistics ---
+def agreement_runs(decision):
+    # Start index, length and code of every run of consecutive equal decisions other than HOLD
+    decision = np.asarray(decision)
+    if not len(decision):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8)
+    starts = np.flatnonzero(np.r_[True, decision[1:] != decision[:-1]])
+    lengths = np.diff(np.r_[starts, len(decision)])
+    codes = decision[starts]
+    keep = codes != HOLD
+    return starts[keep], lengths[keep], codes[keep]
+
+
+def forward_returns(close, events, directions, horizon):
+    # Close-to-close move `horizon` M1 bars after each event, signed by its direction (NaN past the end)
+    close = np.asarray(close, dtype=np.float64)
+    ahead = events + horizon
+    inside = ahead < len(close)
+    moves = np.full(len(events), np.nan)
+    moves[inside] = directions[inside] * (close[ahead[inside]] - close[events[inside]])
+    return moves
+
+
+def first_touch(rates, events, directions, levels, horizon, chunk_rows=4096):
+    # M1 bars after each event until the high (BUY) or low (SELL) first reached its level within
+    # `horizon` bars, or -1; levels on the wrong side of the event's close never count
+    n = len(rates)
+    pad = np.full(horizon, np.nan)
+    highs = np.lib.stride_tricks.sliding_window_view(np.r_[rates['high'], pad], horizon)
+    lows = np.lib.stride_tricks.sliding_window_view(np.r_[rates['low'], pad], horizon)
+    bars = np.full(len(events), -1, dtype=np.int64)
+    for i in range(0, len(events), chunk_rows):
+        rows = slice(i, i + chunk_rows)
+        start = np.minimum(events[rows] + 1, n)
+        level = levels[rows][:, None]
+        with np.errstate(invalid='ignore'):
+            touched = np.where(directions[rows][:, None] == BUY, highs[start] >= level, lows[start] <= level)
+        hit = touched.any(axis=1)
+        bars[rows] = np.where(hit, touched.argmax(axis=1) + 1, -1)
+    return bars
+
+
+def summarize_moves(moves, point=0.0):
+    moves = moves[~np.isnan(moves)]
+    scale = 1.0 / point if point else 1.0
+    return {
+        'count': len(moves),
+        'mean': float(moves.mean() * scale) if len(moves) else None,
+        'median': float(np.median(moves) * scale) if len(moves) else None,
+        'positive': float((moves > 0).mean()) if len(moves) else None,
+    }
+
+
+def take_profit_stats(rates, series, events, directions, horizon=1440, point=0.0):
+    close = rates['close'][events]
+    scale = 1.0 / point if point else 1.0
+    stats = {}
+    for label in TAKE_PROFIT_TIMEFRAMES:
+        if label not in series.dtype.names:
+            continue
+        levels = series[label][events]
+        distance = directions * (levels - close)
+        valid = distance > 0
+        bars = first_touch(rates, events[valid], directions[valid], levels[valid], horizon)
+        hit = bars >= 0
+        stats[label] = {
+            'suggested': int((~np.isnan(levels)).sum()),
+            'right_side': int(valid.sum()),
+            'median_distance': float(np.median(distance[valid]) * scale) if valid.any() else None,
+            'hit_rate': float(hit.mean()) if len(hit) else None,
+            'median_bars_to_hit': float(np.median(bars[hit])) if hit.any() else None,
+        }
+    return stats
+
+
+def consensus_report(rates, series, horizons=(15, 60, 240), tp_horizon=1440, events='first', point=0.0):
+    # `events` is 'first' (first bar of each agreement run) or 'all' (every agreeing bar)
+    rates = as_rates(rates)
+    decision = series['Decision']
+    starts, lengths, codes = agreement_runs(decision)
+    if events == 'first':
+        at, directions = starts, codes.astype(np.int64)
+    else:
+        at = np.flatnonzero(decision != HOLD)
+        directions = decision[at].astype(np.int64)
+    report = {
+        'bars': len(series),
+        'agreeing_bars': {SIGNAL_NAMES[code]: int((decision == code).sum()) for code in (BUY, SELL)},
+        'agreement_rate': float((decision != HOLD).mean()) if len(decision) else 0.0,
+        'runs': {SIGNAL_NAMES[code]: int((codes == code).sum()) for code in (BUY, SELL)},
+        'mean_run_bars': float(lengths.mean()) if len(lengths) else None,
+        'events': len(at),
+    }
+    for horizon in horizons:
+        for code in (BUY, SELL):
+            mask = directions == code
+            moves = forward_returns(rates['close'], at[mask], directions[mask], horizon)
+            report[f"forward_{horizon}_{SIGNAL_NAMES[code].lower()}"] = summarize_moves(moves, point)
+    report['take_profit'] = take_profit_stats(rates, series, at, directions, tp_horizon, point)
+    return report
+
+
+def run_consensus(rates, names=TIMEFRAME_NAMES, rules='signal', horizons=(15, 60, 240), tp_horizon=1440,
+                  events='first', point=0.0, regime_days=20, stride=60):
+    rates = as_rates(rates)
+    started = time.perf_counter()
+    series = consensus_series(rates, names, rules, regime_days, stride)
+    report = consensus_report(rates, series, horizons, tp_horizon, events, point)
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return series, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Historical multi-timeframe BBMA consensus over M1 history.")
+    parser.add_argument('path', nargs='?', help="M1 rates saved with numpy.save (fields as returned by copy_rates_*)")
+    parser.add_argument('--symbol', help="Read M1 bars for this symbol from the bar store instead of a file")
+    parser.add_argument('--store', default='data/bars', help="Bar store root directory")
+    parser.add_argument('--start', help="First date to analyze (YYYY-MM-DD, server time)")
+    parser.add_argument('--end', help="Date to stop before (YYYY-MM-DD, server time)")
+    parser.add_argument('--timeframes', default=','.join(TIMEFRAME_NAMES), help="Comma-separated timeframes that must all agree")
+    parser.add_argument('--rules', choices=['signal', 'filtered'], default='signal')
+    parser.add_argument('--horizons', default='15,60,240', help="Comma-separated M1 bars for the forward returns")
+    parser.add_argument('--tp-horizon', type=int, default=1440, help="M1 bars a Take_Profit has to be reached in")
+    parser.add_argument('--events', choices=['first', 'all'], default='first', help="First bar of each agreement run, or every agreeing bar")
+    parser.add_argument('--point', type=float, default=0.0, help="Symbol point size; reports moves in points instead of price")
+    parser.add_argument('--regime-days', type=int, default=20, help="Trading days behind the filtered rules' thresholds")
+    parser.add_argument('--out', help="Save the per-bar consensus series here with numpy.save")
+    args = parser.parse_args()
+
+    if not (args.path or args.symbol):
+        parser.error("either a rates file or --symbol is required")
+    names = [name.strip().upper() for name in args.timeframes.split(',') if name.strip()]
+    unknown = [name for name in names if name not in TIMEFRAMES]
+    if unknown:
+        parser.error(f"unknown timeframes: {', '.join(unknown)}")
+    horizons = [int(value) for value in args.horizons.split(',') if value.strip()]
+    rates = load_rates(args.path, args.symbol, args.store, args.start, args.end)
+    series, report = run_consensus(rates, names, args.rules, horizons, args.tp_horizon, args.events, args.point, args.regime_days)
+    if args.out:
+        np.save(args.out, series)
+    for key, value in report.items():
+        if isinstance(value, dict) and all(isinstance(item, dict) for item in value.values()):
+            print(f"{key}:")
+            for label, item in value.items():
+                print(f"  {label}: {item}")
+        else:
+            print(f"{key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""Shared BBMA logic for the live scripts, importable without side effects.
+
+Importing this module connects to nothing, asks for no input and loads only
+numpy and the bbma_* helpers. pandas and ta are imported by the pandas
+functions on first use, MetaTrader5 when a connection is opened. xgboost
+(bbma_learn) and bs4/requests (bbma_calendar) are likewise imported only by
+the code that needs them, so a signal-only worker starts in a fraction of a
+second and can run inside another service.
+
+  MT5Connection          explicit terminal connection (or data hub feed), usable wherever `mt5` is expected;
+                         its calls are serialized, so threads can share it
+  SignalEngine           bar cache, resampler, streaming BBMA and scheduler for one symbol
+  analyze_bbma           pandas BBMA analysis (the scripts' former copies, selected by options)
+  fetch_data             last N bars of one timeframe as a DataFrame
+  consensus_decision     the all-timeframes-agree BUY/SELL/HOLD rule
+  take_profit_suggestions  TP1 (M1), TP2 (M15) and TP3 (H1)
+"""
+import functools
+import math
+import threading
+
+from bbma_cache import BarCache, as_rates, timeframe_seconds
+from bbma_quantile import RegimeFilter
+from bbma_resample import Resampler, resample_rates
+from bbma_scheduler import BarCloseScheduler
+from bbma_stream import BBMAStream
+
+TIMEFRAME_NAMES = ('M1', 'M5', 'M15', 'H1', 'H4', 'D1')
+TAKE_PROFIT_TIMEFRAMES = {'TP1 (M1)': 'M1', 'TP2 (M15)': 'M15', 'TP3 (H1)': 'H1'}
+
+
+def default_timeframes(mt5, names=TIMEFRAME_NAMES):
+    return {name: getattr(mt5, f"TIMEFRAME_{name}") for name in names}
+
+
+# --- Terminal Connection ---
+class MT5Connection:
+    def __init__(self, backend=None, hub=None, **options):
+        self.backend = backend  # Module with the MetaTrader5 API (e.g. bbma_fakemt5); imported on connect() when None
+        self.hub = hub  # Name of a running bbma_hub: bars and ticks come from it, the terminal only serves other calls
+        self.options = options  # Passed to initialize(): path, login, password, server, timeout, portable
+        self.connected = False
+        # The MetaTrader5 package is not thread-safe: calls from every thread (engine, order router,
+        # position monitor) go through this lock one at a time
+        self.lock = threading.RLock()
+        self.calls = {}
+
+    def connect(self):
+        self.calls.clear()
+        if self.hub is not None:
+            from bbma_hub import HubFeed
+            if not isinstance(self.backend, HubFeed):
+                self.backend = HubFeed(self.hub, backend=self.backend)
+        elif self.backend is None:
+            import MetaTrader5
+            self.backend = MetaTrader5
+        with self.lock:
+            initialized = self.backend.initialize(**self.options)
+        if not initialized:
+            raise ConnectionError(f"MetaTrader 5 initialize failed: {self.backend.last_error()}")
+        self.connected = True
+        return self
+
+    def close(self):
+        if self.connected:
+            self.connected = False
+            with self.lock:
+                self.backend.shutdown()
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __getattr__(self, name):
+        # Terminal functions and constants (copy_rates_from_pos, TIMEFRAME_M1, ...) come from the backend
+        backend = self.__dict__.get('backend')
+        if backend is None:
+            raise AttributeError(f"{name} is not available before connect()")
+        call = self.calls.get(name)
+        if call is None:
+            value = getattr(backend, name)
+            if not callable(value):
+                return value
+            call = self.calls[name] = self._locked(value)
+        return call
+
+    def _locked(self, function):
+        lock = self.lock
+
+        @functools.wraps(function)
+        def call(*args, **kwargs):
+            with lock:
+                return function(*args, **kwargs)
+        return call
+
+    def timeframes(self, names=TIMEFRAME_NAMES):
+        return default_timeframes(self, names)
+
+
+# --- pandas Analysis ---
+def rates_frame(rates):
+    import pandas as pd
+    df = pd.DataFrame(as_rates(rates))
+    df['time'] = pd.to_datetime(df['time'], unit='s')
+    df.set_index('time', inplace=True)
+    return df
+
+
+def fetch_data(mt5, symbol, timeframe, count=1000):
+    # One-off fetch straight from the terminal; live loops should read through a BarCache instead
+    return rates_frame(mt5.copy_rates_from_pos(symbol, timeframe, 0, count))
+
+
+def analyze_bbma(df, reentry='MA5_High', filters=False):
+    # `reentry` is the line the close re-enters against: 'MA5_High' (analisa_bbma, learn_trade)
+    # or 'Mid_BB' (bbma_signal). `filters` adds SMA200, ATR, Trending, Ranging and Filtered_Signal.
+    import numpy as np
+    from ta.trend import SMAIndicator
+    from ta.volatility import AverageTrueRange, BollingerBands
+
+    bb = BollingerBands(close=df['close'], window=20, window_dev=2)
+    df['BB_Upper'] = bb.bollinger_hband()
+    df['BB_Lower'] = bb.bollinger_lband()
+    df['Mid_BB'] = bb.bollinger_mavg()
+    df['MA5_High'] = SMAIndicator(df['close'], window=5).sma_indicator()
+    df['MA10_High'] = SMAIndicator(df['close'], window=10).sma_indicator()
+
+    ref = df[reentry]
+    df['Reentry'] = ((df['close'] < df['BB_Upper']) & (df['close'] > ref)) | \
+                    ((df['close'] > df['BB_Lower']) & (df['close'] < ref))
+    df['Momentum'] = ((df['close'] > df['BB_Upper']) & (df['close'].shift(1) < df['BB_Upper'])) | \
+                     ((df['close'] < df['BB_Lower']) & (df['close'].shift(1) > df['BB_Lower']))
+
+    df['Signal'] = 'Hold'
+    df['Take_Profit'] = np.nan
+
+    df.loc[df['Reentry'] & (df['Momentum']), 'Signal'] = 'Buy'
+    df.loc[df['Signal'] == 'Buy', 'Take_Profit'] = df['close'] + (df['BB_Upper'] - df['Mid_BB'])
+
+    df.loc[df['Reentry'] & (~df['Momentum']), 'Signal'] = 'Sell'
+    df.loc[df['Signal'] == 'Sell', 'Take_Profit'] = df['close'] - (df['Mid_BB'] - df['BB_Lower'])
+
+    if filters:
+        df['SMA200'] = SMAIndicator(df['close'], window=200).sma_indicator()
+        df['ATR'] = AverageTrueRange(df['high'], df['low'], df['close'], window=14).average_true_range()
+        df['Trending'] = df['close'] > df['SMA200']
+        df['Ranging'] = df['BB_Upper'] - df['BB_Lower'] < df['BB_Upper'].median()
+
+        df['Filtered_Signal'] = df['Signal']
+        df.loc[df['Ranging'], 'Filtered_Signal'] = 'Hold'  # Avoid trading in ranging market
+        df.loc[df['ATR'] > df['ATR'].quantile(0.9), 'Filtered_Signal'] = 'Hold'  # Avoid high volatility
+
+    return df
+
+
+# --- Multi-Timeframe Consensus ---
+def consensus_decision(signals):
+    # BUY/SELL only when every timeframe agrees
+    values = list(signals.values())
+    if values and all(sig == 'Buy' for sig in values):
+        return 'BUY'
+    if values and all(sig == 'Sell' for sig in values):
+        return 'SELL'
+    return 'HOLD'
+
+
+def take_profit_suggestions(take_profits, digits=5):
+    suggestions = {}
+    for label, tf_name in TAKE_PROFIT_TIMEFRAMES.items():
+        value = take_profits.get(tf_name)
+        suggestions[label] = None if value is None or math.isnan(value) else round(float(value), digits)
+    return suggestions
+
+
+# --- Live Signal Engine (One Symbol) ---
+class SignalEngine:
+    def __init__(self, mt5, symbol, timeframes=None, capacity=1000, bar_store=None, reentry='MA5_High',
+                 wake_mode='bar_close', streaming=True, regime_days=None, regime_estimator='window'):
+        self.mt5 = mt5
+        self.symbol = symbol
+        self.timeframes = default_timeframes(mt5) if timeframes is None else dict(timeframes)
+        self.base_timeframe = min(self.timeframes.values(), key=timeframe_seconds)
+        # Only bars newer than the last cached one are requested; closed bars go to `bar_store`
+        self.cache = BarCache(mt5, capacity=capacity, bar_store=bar_store)
+        # Several timeframes are built locally from the single base-timeframe fetch
+        self.resampler = Resampler(self.cache, symbol, self.timeframes, self.base_timeframe) if len(self.timeframes) > 1 else None
+        # streaming=False leaves the analysis to the caller (e.g. analyze_bbma on frame()).
+        # regime_days adds Filtered_Signal, with thresholds over that many trading days of each timeframe.
+        self.lookbacks = {name: max(int(regime_days * 86400 // timeframe_seconds(tf)), 1)
+                          for name, tf in self.timeframes.items()} if regime_days else {}
+        self.streams = {name: BBMAStream(reentry=reentry, regime=RegimeFilter(self.lookbacks[name], estimator=regime_estimator)
+                                         if regime_days else None)
+                        for name in self.timeframes} if streaming else {}
+        self.scheduler = BarCloseScheduler(mt5, symbol, self.timeframes, mode=wake_mode)
+        self.rows = {}  # Latest analysis row per timeframe
+
+    def seed(self, warmup=200):
+        # Before the first update: replay closed bars from the bar store so the regime thresholds
+        # start from their full lookback instead of the fetched window; returns bars pushed per timeframe.
+        # Higher timeframes are resampled from the stored base bars with the resampler's session offset,
+        # so the seeded bars are built exactly like the live ones; their own stored series only grow while
+        # a process runs (and may be native or resampled bars), so they can lag or differ from the base.
+        store = self.cache.bar_store
+        if store is None or not self.lookbacks or not self.streams:
+            return {}
+        base_seconds = timeframe_seconds(self.base_timeframe)
+        ratios = {name: timeframe_seconds(tf) // base_seconds for name, tf in self.timeframes.items()}
+        base = store.series(self.symbol, self.base_timeframe).tail(
+            max((self.lookbacks[name] + warmup + 2) * ratios[name] for name in self.streams))
+        offset = self.resampler.session_offset if self.resampler else 0
+        pushed = {}
+        for name, stream in self.streams.items():
+            timeframe = self.timeframes[name]
+            if timeframe == self.base_timeframe:
+                history = base[-(self.lookbacks[name] + warmup):]
+            else:
+                # The first and last buckets may be cut short by the tail and by the end of the store
+                bars = base[-(self.lookbacks[name] + warmup + 2) * ratios[name]:]
+                history = resample_rates(bars, timeframe, offset)[1:-1]
+            for bar in history:
+                stream.push(bar)
+            pushed[name] = len(history)
+        return pushed
+
+    def fetch(self):
+        if self.resampler is None:
+            return {name: self.cache.fetch(self.symbol, tf) for name, tf in self.timeframes.items()}
+        return self.resampler.update()
+
+    def frame(self, tf_name):
+        # DataFrame copy of the cached bars of one timeframe (no terminal call)
+        return self.cache.frame(self.symbol, self.timeframes[tf_name])
+
+    def analyze(self, rates):
+        # Timeframes whose bar closed since the last call (from the scheduler's wake-ups) commit their new
+        # closed bars; the others only re-evaluate the forming bar. Returns bars pushed per timeframe.
+        closed = self.scheduler.take_closed()
+        pushed = {}
+        for name, stream in self.streams.items():
+            bars = rates[name]
+            if not self.scheduler.changed(name, bars):
+                pass
+            elif closed is None or name in closed or self._behind(stream, bars):
+                before = stream.bars_pushed
+                stream.sync(bars)
+                pushed[name] = stream.bars_pushed - before
+            else:
+                stream.peek(bars[-1])
+            self.rows[name] = stream.last_row
+        return pushed
+
+    @staticmethod
+    def _behind(stream, bars):
+        # A closed bar the stream has not committed, e.g. when the server clock estimate missed a boundary
+        return stream.last_time is None or (len(bars) > 1 and bars['time'][-2] > stream.last_time)
+
+    def update(self):
+        self.analyze(self.fetch())
+        return self.rows
+
+    def signals(self, column='Signal'):
+        return {name: row[column] for name, row in self.rows.items()}
+
+    def decision(self):
+        return consensus_decision(self.signals())
+
+    def take_profits(self):
+        return take_profit_suggestions(self.signals('Take_Profit'))
+
+    def check_drift(self):
+        # {timeframe: mismatches} between locally derived and terminal-native bars
+        return self.resampler.verify_all() if self.resampler else {}
@@ -0,0 +1,92 @@
+"""Incremental deal-history sync with local position and magic indexes.
+
+DealSync keeps a cursor (time and ticket of the newest deal seen) and asks
+the terminal only for deals from that time on. Deals are indexed by
+position ticket and magic number. Per-position aggregates (direction, entry
+and exit prices, net profit, open volume, close reason) are updated as
+each deal arrives, so trade outcomes are dictionary lookups.
+"""
+import time
+
+# MetaTrader 5 deal constants, so this module does not need the terminal package
+DEAL_TYPE_BUY, DEAL_TYPE_SELL = 0, 1
+DEAL_ENTRY_IN, DEAL_ENTRY_OUT, DEAL_ENTRY_INOUT, DEAL_ENTRY_OUT_BY = 0, 1, 2, 3
+DEAL_REASON_SL, DEAL_REASON_TP, DEAL_REASON_SO = 4, 5, 6
+CLOSE_REASONS = {DEAL_REASON_SL: 'sl', DEAL_REASON_TP: 'tp', DEAL_REASON_SO: 'stop_out'}
+
+
+class DealSync:
+    def __init__(self, mt5, since=None, magic=None, horizon=2 * 86400):
+        self.mt5 = mt5
+        self.magic = magic  # Only index deals with this magic number (None keeps all)
+        self.horizon = horizon  # Deal times are server time, which can run ahead of UTC
+        self.last_time = int(time.time() - 86400) if since is None else int(since)
+        self.last_ticket = 0
+        self.deals_by_ticket = {}
+        self.deals_by_position = {}
+        self.positions_by_magic = {}
+        self.outcomes = {}
+
+    def sync(self):
+        # Fetch deals at or after the cursor; returns outcomes of positions that closed in this batch
+        deals = self.mt5.history_deals_get(self.last_time, int(time.time() + self.horizon))
+        if not deals:
+            return []
+        closed = []
+        for deal in sorted(deals, key=lambda d: (d.time_msc, d.ticket)):
+            if deal.ticket in self.deals_by_ticket:
+                continue  # The cursor second is fetched again on every sync
+            self.deals_by_ticket[deal.ticket] = deal
+            if (deal.time, deal.ticket) > (self.last_time, self.last_ticket):
+                self.last_time, self.last_ticket = deal.time, deal.ticket
+            if deal.type not in (DEAL_TYPE_BUY, DEAL_TYPE_SELL):
+                continue  # Balance, credit and other non-trade deals
+            if self.magic is not None and deal.magic != self.magic and deal.position_id not in self.outcomes:
+                continue
+            if self._apply(deal):
+                closed.append(self.outcomes[deal.position_id])
+        return closed
+
+    def _apply(self, deal):
+        # Fold one deal into its position's outcome; True when this deal closed the position
+        position = deal.position_id
+        self.deals_by_position.setdefault(position, []).append(deal)
+        outcome = self.outcomes.get(position)
+        if outcome is None:
+            outcome = self.outcomes[position] = {
+                'position': position, 'symbol': deal.symbol, 'magic': deal.magic, 'direction': 0,
+                'entry_price': None, 'exit_price': None, 'open_time': None, 'close_time': None,
+                'volume': 0.0, 'open_volume': 0.0, 'profit': 0.0, 'closed': False, 'win': None, 'reason': None,
+            }
+            self.positions_by_magic.setdefault(deal.magic, set()).add(position)
+        outcome['profit'] += deal.profit + deal.swap + deal.commission + getattr(deal, 'fee', 0.0)
+        if deal.entry == DEAL_ENTRY_IN:
+            if outcome['entry_price'] is None:
+                outcome['direction'] = 1 if deal.type == DEAL_TYPE_BUY else -1
+                outcome['open_time'] = deal.time
+                outcome['entry_price'] = deal.price
+            else:  # Scaling in: volume-weighted entry
+                total = outcome['open_volume'] + deal.volume
+                outcome['entry_price'] = (outcome['entry_price'] * outcome['open_volume'] + deal.price * deal.volume) / total
+            outcome['volume'] += deal.volume
+            outcome['open_volume'] += deal.volume
+            return False
+        outcome['open_volume'] -= deal.volume
+        outcome['exit_price'] = deal.price
+        outcome['close_time'] = deal.time
+        outcome['reason'] = CLOSE_REASONS.get(deal.reason, 'manual')
+        if deal.entry == DEAL_ENTRY_INOUT or outcome['open_volume'] > 1e-9:
+            return False  # Partial close or reversal: the position stays open
+        outcome['closed'] = True
+        outcome['win'] = outcome['profit'] > 0
+        return True
+
+    # --- Lookups ---
+    def outcome(self, position):
+        return self.outcomes.get(position)
+
+    def deals(self, position):
+        return self.deals_by_position.get(position, [])
+
+    def positions(self, magic):
+        return self.positions_by_magic.get(magic, set())
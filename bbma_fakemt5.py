@@ -0,0 +1,395 @@
+"""Offline stand-in for the MetaTrader5 package.
+
+Serves synthetic (random-walk) or recorded M1 bars through the same calls
+the scripts use: initialize, copy_rates_from_pos, copy_rates_range,
+symbol_info(_tick), symbols_get, order_send, order_check, positions_get,
+history_deals_get and last_error. Higher timeframes are resampled from M1.
+Market orders fill at ask/bid, and TP/SL are settled against later bars,
+which produces the deals DealSync reads. Every call can be slowed down by
+a configurable latency to mimic the terminal's IPC cost.
+
+In 'realtime' mode one M1 bar appears per wall-clock minute (for running
+the live scripts). Otherwise the visible history only moves on advance()
+(for benchmarks and replays).
+
+Usage: python bbma_fakemt5.py learn_trade.py   (runs a script with `import MetaTrader5` served by this module)
+"""
+import runpy
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from bbma_cache import RATE_DTYPE, timeframe_seconds
+from bbma_resample import resample_rates
+
+TIMEFRAME_M1, TIMEFRAME_M2, TIMEFRAME_M3, TIMEFRAME_M4, TIMEFRAME_M5 = 1, 2, 3, 4, 5
+TIMEFRAME_M6, TIMEFRAME_M10, TIMEFRAME_M12, TIMEFRAME_M15, TIMEFRAME_M20, TIMEFRAME_M30 = 6, 10, 12, 15, 20, 30
+TIMEFRAME_H1, TIMEFRAME_H2, TIMEFRAME_H3, TIMEFRAME_H4 = 0x4001, 0x4002, 0x4003, 0x4004
+TIMEFRAME_H6, TIMEFRAME_H8, TIMEFRAME_H12, TIMEFRAME_D1 = 0x4006, 0x4008, 0x400C, 0x4018
+TIMEFRAME_W1, TIMEFRAME_MN1 = 0x8001, 0xC001
+ORDER_TYPE_BUY, ORDER_TYPE_SELL = 0, 1
+ORDER_FILLING_FOK, ORDER_FILLING_IOC, ORDER_FILLING_RETURN = 0, 1, 2
+SYMBOL_FILLING_FOK, SYMBOL_FILLING_IOC = 1, 2
+TRADE_ACTION_DEAL, TRADE_ACTION_SLTP = 1, 6
+DEAL_TYPE_BUY, DEAL_TYPE_SELL = 0, 1
+DEAL_ENTRY_IN, DEAL_ENTRY_OUT = 0, 1
+DEAL_REASON_EXPERT, DEAL_REASON_SL, DEAL_REASON_TP = 3, 4, 5
+TRADE_RETCODE_REQUOTE = 10004
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_INVALID = 10013
+TRADE_RETCODE_INVALID_STOPS = 10016
+TRADE_RETCODE_INVALID_FILL = 10030
+TRADE_RETCODE_POSITION_CLOSED = 10036
+
+Tick = namedtuple('Tick', 'time bid ask last volume time_msc flags volume_real')
+SymbolInfo = namedtuple('SymbolInfo', 'name visible point digits spread trade_contract_size volume_min volume_max '
+                                      'volume_step filling_mode trade_stops_level bid ask')
+TradePosition = namedtuple('TradePosition', 'ticket time type magic identifier volume price_open sl tp '
+                                            'price_current profit symbol comment')
+TradeDeal = namedtuple('TradeDeal', 'ticket order time time_msc type entry magic position_id reason volume price '
+                                    'commission swap profit fee symbol comment external_id')
+OrderSendResult = namedtuple('OrderSendResult', 'retcode deal order volume price bid ask comment request_id '
+                                                'retcode_external request')
+OrderCheckResult = namedtuple('OrderCheckResult', 'retcode balance equity profit margin margin_free margin_level '
+                                                  'comment request')
+AccountInfo = namedtuple('AccountInfo', 'login balance equity margin margin_free currency leverage')
+
+
+def _seconds(value):
+    return int(value.timestamp()) if isinstance(value, datetime) else int(value)
+
+
+# --- Synthetic M1 History ---
+def synthetic_rates(count, start_time, seed=0, price=1.1, volatility=2e-4, spread=10):
+    # Geometric random walk of closes; opens continue from the previous close
+    rng = np.random.default_rng(seed)
+    close = price * np.exp(np.cumsum(rng.normal(0.0, volatility, count)))
+    rates = np.zeros(count, dtype=RATE_DTYPE)
+    rates['time'] = start_time + np.arange(count, dtype=np.int64) * 60
+    rates['open'] = np.r_[price, close[:-1]]
+    rates['close'] = close
+    wick = np.abs(rng.normal(0.0, volatility * 0.5, (2, count))) * close
+    rates['high'] = np.maximum(rates['open'], close) + wick[0]
+    rates['low'] = np.minimum(rates['open'], close) - wick[1]
+    rates['tick_volume'] = rng.integers(1, 200, count)
+    rates['spread'] = spread
+    return rates
+
+
+# --- Fake Terminal ---
+class FakeTerminal:
+    def __init__(self, symbols=('EURUSD',), bars=100000, future=1440, realtime=False, latency=0.0, rates=None,
+                 point=1e-5, digits=5, spread=10, contract_size=100000, filling_mode=SYMBOL_FILLING_FOK | SYMBOL_FILLING_IOC,
+                 requote_rate=0.0, balance=10000.0, seed=0, clock=time.time, sleep=time.sleep):
+        self.recorded = dict(rates or {})  # {symbol: M1 rates} served instead of synthetic data
+        self.symbols = list(symbols) + [symbol for symbol in self.recorded if symbol not in symbols]
+        self.bars = bars  # Visible M1 history per symbol at start
+        self.future = future  # Extra bars revealed by advance() or the passing of time
+        self.realtime = realtime
+        self.latency = latency  # Seconds per call, or {call name: seconds}
+        self.point = point
+        self.digits = digits
+        self.spread = spread
+        self.contract_size = contract_size
+        self.filling_mode = filling_mode
+        self.requote_rate = requote_rate
+        self.balance = balance
+        self.seed = seed
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = np.random.default_rng(seed)
+        self.anchor = int(clock()) // 60 * 60 if realtime else 1577836800  # Time of the last visible bar at start
+        self.data = {}
+        self.position = {}
+        self.open_positions = {}
+        self.deals = []
+        self.next_ticket = 1000
+        self.error = (1, 'Success')
+        self.calls = {}
+
+    def _call(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        delay = self.latency.get(name, 0.0) if isinstance(self.latency, dict) else self.latency
+        if delay:
+            self.sleep(delay)
+
+    def _m1(self, symbol):
+        if symbol not in self.data:
+            if symbol in self.recorded:
+                self.data[symbol] = np.asarray(self.recorded[symbol], dtype=RATE_DTYPE)
+                self.position[symbol] = max(len(self.data[symbol]) - self.future, 1)
+            else:
+                seed = self.seed + sum(ord(c) * 31 ** i for i, c in enumerate(symbol)) % 100003
+                start = self.anchor - (self.bars - 1) * 60
+                self.data[symbol] = synthetic_rates(self.bars + self.future, start, seed, spread=self.spread)
+                self.position[symbol] = self.bars
+        return self.data[symbol]
+
+    def visible(self, symbol):
+        # Number of M1 bars the terminal currently shows for the symbol (the last one is forming)
+        data = self._m1(symbol)
+        if self.realtime:
+            return int(min(len(data), max((int(self.clock()) - int(data['time'][0])) // 60 + 1, 1)))
+        return self.position[symbol]
+
+    def advance(self, bars=1, symbol=None):
+        # Reveal the next `bars` M1 bars (replay mode); returns False once the data runs out
+        moved = True
+        for name in [symbol] if symbol else list(self.data) or self.symbols:
+            data = self._m1(name)
+            self.position[name] = min(self.position[name] + bars, len(data))
+            moved = moved and self.position[name] < len(data)
+        self._settle()
+        return moved
+
+    def _visible_m1(self, symbol):
+        # M1 bars the terminal shows now, the last one forming (bbma_replay swaps in the recorded forming bar)
+        return self._m1(symbol)[:self.visible(symbol)]
+
+    def _rates(self, symbol, timeframe, last_count=None):
+        # Visible bars of a timeframe; with `last_count` only enough M1 history is resampled for that many bars
+        m1 = self._visible_m1(symbol)
+        if timeframe == TIMEFRAME_M1:
+            return m1
+        ratio = timeframe_seconds(timeframe) // 60
+        visible = len(m1)
+        if last_count is not None:
+            m1 = m1[-(last_count + 1) * ratio:]
+        out = resample_rates(m1, timeframe)
+        return out[1:] if last_count is not None and len(m1) < visible else out
+
+    # --- Connection ---
+    def initialize(self, *args, **kwargs):
+        self._call('initialize')
+        return True
+
+    def shutdown(self):
+        self._call('shutdown')
+
+    def last_error(self):
+        return self.error
+
+    # --- Market Data ---
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        self._call('copy_rates_from_pos')
+        rates = self._rates(symbol, timeframe, start_pos + count)
+        end = len(rates) - start_pos
+        return rates[max(end - count, 0):max(end, 0)].copy()
+
+    def copy_rates_range(self, symbol, timeframe, date_from, date_to):
+        self._call('copy_rates_range')
+        rates = self._rates(symbol, timeframe)
+        lo = np.searchsorted(rates['time'], _seconds(date_from), side='left')
+        hi = np.searchsorted(rates['time'], _seconds(date_to), side='right')
+        return rates[lo:hi].copy()
+
+    def copy_rates_from(self, symbol, timeframe, date_from, count):
+        self._call('copy_rates_from')
+        rates = self._rates(symbol, timeframe)
+        end = np.searchsorted(rates['time'], _seconds(date_from), side='right')
+        return rates[max(end - count, 0):end].copy()
+
+    def _quote(self, symbol):
+        bar = self._visible_m1(symbol)[-1]
+        bid = round(float(bar['close']), self.digits)
+        return bar, bid, round(bid + self.spread * self.point, self.digits)
+
+    def symbol_info_tick(self, symbol):
+        self._call('symbol_info_tick')
+        self._settle()
+        bar, bid, ask = self._quote(symbol)
+        now = self.clock() if self.realtime else int(bar['time']) + 59
+        return Tick(int(now), bid, ask, 0.0, 0, int(now * 1000), 6, 0.0)
+
+    def symbol_info(self, symbol):
+        self._call('symbol_info')
+        _, bid, ask = self._quote(symbol)
+        return SymbolInfo(symbol, True, self.point, self.digits, self.spread, self.contract_size,
+                          0.01, 100.0, 0.01, self.filling_mode, 0, bid, ask)
+
+    def symbols_get(self, group=None):
+        self._call('symbols_get')
+        return tuple(self.symbol_info(symbol) for symbol in self.symbols)
+
+    def account_info(self):
+        self._call('account_info')
+        return AccountInfo(1, self.balance, self.balance, 0.0, self.balance, 'USD', 100)
+
+    # --- Trading ---
+    def _new_ticket(self):
+        self.next_ticket += 1
+        return self.next_ticket
+
+    def _validate(self, request):
+        # retcode for a request that cannot be filled, or None
+        symbol = request.get('symbol')
+        if request.get('action') == TRADE_ACTION_SLTP:
+            return None if request.get('position') in self.open_positions else TRADE_RETCODE_POSITION_CLOSED
+        if request.get('action') != TRADE_ACTION_DEAL or symbol not in self.symbols:
+            return TRADE_RETCODE_INVALID
+        filling = request.get('type_filling', ORDER_FILLING_FOK)
+        if filling != ORDER_FILLING_RETURN and not self.filling_mode & {ORDER_FILLING_FOK: SYMBOL_FILLING_FOK,
+                                                                         ORDER_FILLING_IOC: SYMBOL_FILLING_IOC}.get(filling, 0):
+            return TRADE_RETCODE_INVALID_FILL
+        if 'position' in request:
+            return None
+        _, bid, ask = self._quote(symbol)
+        sl, tp = request.get('sl') or 0.0, request.get('tp') or 0.0
+        if request['type'] == ORDER_TYPE_BUY and ((sl and sl >= bid) or (tp and tp <= bid)):
+            return TRADE_RETCODE_INVALID_STOPS
+        if request['type'] == ORDER_TYPE_SELL and ((sl and sl <= ask) or (tp and tp >= ask)):
+            return TRADE_RETCODE_INVALID_STOPS
+        return None
+
+    def order_check(self, request):
+        self._call('order_check')
+        retcode = self._validate(request)
+        return OrderCheckResult(0 if retcode is None else retcode, self.balance, self.balance, 0.0, 0.0,
+                                self.balance, 0.0, 'Done' if retcode is None else 'Rejected', request)
+
+    def order_send(self, request):
+        self._call('order_send')
+        self._settle()
+        retcode = self._validate(request)
+        if request.get('position') in self.open_positions:
+            symbol = self.open_positions[request['position']]['symbol']
+        else:
+            symbol = request.get('symbol')
+        bid = ask = 0.0
+        if symbol in self.symbols:
+            _, bid, ask = self._quote(symbol)
+        if retcode is None and request['action'] == TRADE_ACTION_DEAL:
+            price = ask if request['type'] == ORDER_TYPE_BUY else bid
+            if self.requote_rate and self.rng.random() < self.requote_rate:
+                retcode = TRADE_RETCODE_REQUOTE
+            elif request.get('price') and abs(request['price'] - price) > request.get('deviation', 0) * self.point + 1e-12:
+                retcode = TRADE_RETCODE_REQUOTE
+        if retcode is not None:
+            self.error = (-2, f'Rejected with retcode {retcode}')
+            return OrderSendResult(retcode, 0, 0, 0.0, 0.0, bid, ask, 'Rejected', 0, 0, request)
+        if request['action'] == TRADE_ACTION_SLTP:
+            self.open_positions[request['position']].update(sl=request.get('sl', 0.0), tp=request.get('tp', 0.0))
+            return OrderSendResult(TRADE_RETCODE_DONE, 0, 0, 0.0, 0.0, bid, ask, 'Done', 0, 0, request)
+        ticket = self._new_ticket()
+        bar = self._m1(symbol)[self.visible(symbol) - 1]
+        if 'position' in request:
+            position = self.open_positions[request['position']]
+            price = bid if position['type'] == ORDER_TYPE_BUY else ask
+            self._close(request['position'], int(bar['time']), price, DEAL_REASON_EXPERT)
+        else:
+            price = ask if request['type'] == ORDER_TYPE_BUY else bid
+            self.open_positions[ticket] = {
+                'ticket': ticket, 'symbol': symbol, 'type': request['type'], 'volume': request['volume'],
+                'price': price, 'sl': request.get('sl') or 0.0, 'tp': request.get('tp') or 0.0,
+                'magic': request.get('magic', 0), 'comment': request.get('comment', ''),
+                'time': int(bar['time']), 'checked': self.visible(symbol),
+            }
+            self._deal(ticket, int(bar['time']), request['type'], DEAL_ENTRY_IN, DEAL_REASON_EXPERT,
+                       self.open_positions[ticket], price, 0.0)
+        return OrderSendResult(TRADE_RETCODE_DONE, self.deals[-1].ticket, ticket, request['volume'], price, bid, ask,
+                               'Request executed', 0, 0, request)
+
+    def _deal(self, position_id, t, deal_type, entry, reason, position, price, profit):
+        self.deals.append(TradeDeal(self._new_ticket(), position_id, t, t * 1000 + len(self.deals) % 1000, deal_type,
+                                    entry, position['magic'], position_id, reason, position['volume'], price,
+                                    0.0, 0.0, profit, 0.0, position['symbol'], position['comment'], ''))
+
+    def _close(self, ticket, t, price, reason):
+        position = self.open_positions.pop(ticket)
+        direction = 1 if position['type'] == ORDER_TYPE_BUY else -1
+        profit = round(direction * (price - position['price']) * position['volume'] * self.contract_size, 2)
+        self.balance += profit
+        self._deal(ticket, t, ORDER_TYPE_SELL if direction == 1 else ORDER_TYPE_BUY, DEAL_ENTRY_OUT, reason,
+                   position, price, profit)
+
+    def _settle(self):
+        # Close positions whose TP or SL was touched by bars that became visible since the last check.
+        # The forming bar is checked again next time, as its range can still grow.
+        for ticket, position in list(self.open_positions.items()):
+            data = self._visible_m1(position['symbol'])
+            bars = data[position['checked']:]
+            position['checked'] = max(len(data) - 1, position['checked'])
+            buy = position['type'] == ORDER_TYPE_BUY
+            ask_shift = 0.0 if buy else self.spread * self.point
+            high, low = bars['high'] + ask_shift, bars['low'] + ask_shift
+            sl_hit = (low <= position['sl']) if buy else (high >= position['sl'])
+            tp_hit = (high >= position['tp']) if buy else (low <= position['tp'])
+            sl_hit &= position['sl'] > 0
+            tp_hit &= position['tp'] > 0
+            hit = np.flatnonzero(sl_hit | tp_hit)
+            if len(hit):
+                k = hit[0]
+                reason = DEAL_REASON_SL if sl_hit[k] else DEAL_REASON_TP  # Pessimistic when both are touched
+                self._close(ticket, int(bars['time'][k]), position['sl'] if sl_hit[k] else position['tp'], reason)
+
+    def positions_get(self, symbol=None, ticket=None, group=None):
+        self._call('positions_get')
+        self._settle()
+        out = []
+        for position in self.open_positions.values():
+            if (symbol and position['symbol'] != symbol) or (ticket and position['ticket'] != ticket):
+                continue
+            _, bid, ask = self._quote(position['symbol'])
+            direction = 1 if position['type'] == ORDER_TYPE_BUY else -1
+            current = bid if direction == 1 else ask
+            out.append(TradePosition(position['ticket'], position['time'], position['type'], position['magic'],
+                                     position['ticket'], position['volume'], position['price'], position['sl'],
+                                     position['tp'], current,
+                                     round(direction * (current - position['price']) * position['volume'] * self.contract_size, 2),
+                                     position['symbol'], position['comment']))
+        return tuple(out)
+
+    def positions_total(self):
+        return len(self.positions_get())
+
+    def history_deals_get(self, date_from=None, date_to=None, group=None, ticket=None, position=None):
+        self._call('history_deals_get')
+        self._settle()
+        if ticket is not None:
+            return tuple(d for d in self.deals if d.ticket == ticket)
+        if position is not None:
+            return tuple(d for d in self.deals if d.position_id == position)
+        lo, hi = _seconds(date_from), _seconds(date_to)
+        return tuple(d for d in self.deals if lo <= d.time <= hi)
+
+
+# --- Module-Level API (import bbma_fakemt5 as mt5, or install() it as MetaTrader5) ---
+terminal = FakeTerminal()
+
+
+def configure(**kwargs):
+    # Replace the terminal behind the module-level functions; returns it
+    global terminal
+    terminal = FakeTerminal(**kwargs)
+    return terminal
+
+
+def install(**kwargs):
+    # Make `import MetaTrader5` return this module
+    if kwargs:
+        configure(**kwargs)
+    sys.modules['MetaTrader5'] = sys.modules[__name__]
+    return terminal
+
+
+def __getattr__(name):
+    if name.startswith('_'):
+        raise AttributeError(name)
+    return getattr(terminal, name)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(2)
+    install(realtime=True)
+    script = sys.argv[1]
+    sys.argv = sys.argv[1:]
+    runpy.run_path(script, run_name='__main__')
+
+
+if __name__ == '__main__':
+    main()
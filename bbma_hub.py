@@ -0,0 +1,504 @@
+"""Market-data hub: one terminal connection serving bars and ticks to many processes.
+
+The hub process polls each symbol once per interval. M1 bars are
+delta-fetched into a BarCache, and the other timeframes are resampled from
+them, as in SignalEngine. The latest tick is polled as well. Everything is
+published into one shared-memory block:
+  header   layout, write position of the event ring, heartbeat
+  series   per symbol/timeframe, the latest `capacity` bars
+  ticks    per symbol, the latest tick
+  events   a ring of every bar update and every new tick, in order
+There is one writer and no lock. Each bar window, tick and event slot has
+a sequence number that is odd while it is being written (a seqlock).
+Readers copy, check that the number did not change, and retry if it did.
+A reader that falls a whole ring behind skips to the oldest event left.
+
+HubFeed is the subscriber. For the hub's symbols it serves
+copy_rates_from_pos, copy_rates_from, copy_rates_range and
+symbol_info_tick from shared memory, so it stands in for the MetaTrader5
+module (MT5Connection(hub=...) in the scripts). Any other call
+(symbol_info, order_send, ...) opens the process's own terminal connection
+on first use, so only scripts that trade hold one. events() and wait()
+follow the event ring for consumers that react to every update. Once the
+hub has not polled for a few intervals, or has shut down, the reads it
+serves return None with last_error set, so no subscriber acts on frozen
+data. A poll that raises is logged and the hub keeps polling.
+
+Subscribers wake `grace` seconds after a bar close, so the hub's
+--interval should stay below BarCloseScheduler.grace (0.25s).
+
+Usage: python bbma_hub.py EURUSD XAUUSD [--timeframes M1,M5,M15,H1,H4,D1] [--interval 0.1] [--name bbma_hub]
+"""
+import argparse
+import os
+import time
+from collections import namedtuple
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from bbma_cache import RATE_DTYPE, TIMEFRAMES, timeframe_name
+from bbma_core import TIMEFRAME_NAMES, MT5Connection, SignalEngine
+
+DEFAULT_NAME = 'bbma_hub'
+MAGIC = 0x4242_4D41_4855_4201
+VERSION = 1
+EVENT_BAR, EVENT_TICK = 1, 2
+
+HEADER_DTYPE = np.dtype([
+    ('magic', '<u8'),
+    ('version', '<u4'),
+    ('symbols', '<u4'),
+    ('series', '<u4'),
+    ('capacity', '<u4'),
+    ('slots', '<u8'),
+    ('head', '<u8'),  # Events written so far; the next one goes to slot head % slots
+    ('heartbeat', '<f8'),  # Local time of the last completed poll
+    ('interval', '<f8'),
+    ('pid', '<i8'),
+])
+SERIES_DTYPE = np.dtype([('seq', '<u8'), ('symbol', 'S32'), ('timeframe', '<u4'), ('count', '<u4'), ('updated', '<f8')])
+TICK_FIELDS = [('time', '<i8'), ('bid', '<f8'), ('ask', '<f8'), ('last', '<f8'), ('volume', '<u8'),
+               ('time_msc', '<i8'), ('flags', '<u4'), ('volume_real', '<f8')]
+TICK_DTYPE = np.dtype([('seq', '<u8'), ('symbol', 'S32')] + TICK_FIELDS)
+# One layout for both kinds: a bar event fills the rate fields and `index` is the series,
+# a tick event fills the tick fields and `index` is the symbol
+EVENT_DTYPE = np.dtype([('seq', '<u8'), ('kind', '<u4'), ('index', '<u4')]
+                       + [(name, RATE_DTYPE.fields[name][0]) for name in RATE_DTYPE.names]
+                       + [field for field in TICK_FIELDS if field[0] != 'time'])
+
+Tick = namedtuple('Tick', 'time bid ask last volume time_msc flags volume_real')
+
+
+def _layout(symbols, series, capacity, slots):
+    # {part: (dtype, shape, offset)} and the total size; every part starts on a 64-byte boundary
+    parts = [('header', HEADER_DTYPE, (1,)), ('series', SERIES_DTYPE, (series,)), ('ticks', TICK_DTYPE, (symbols,)),
+             ('bars', RATE_DTYPE, (series, capacity)), ('events', EVENT_DTYPE, (slots,))]
+    plan = {}
+    size = 0
+    for key, dtype, shape in parts:
+        plan[key] = (dtype, shape, size)
+        size += (dtype.itemsize * int(np.prod(shape)) + 63) // 64 * 64
+    return plan, size
+
+
+def _views(buf, plan):
+    return {key: np.ndarray(shape, dtype, buf, offset) for key, (dtype, shape, offset) in plan.items()}
+
+
+def _forget(shm):
+    # Only the hub may unlink the block; on POSIX the resource tracker would do it when an attached process exits
+    if os.name == 'posix':
+        resource_tracker.unregister(shm._name, 'shared_memory')
+
+
+def _alive(pid):
+    # Whether a process with this pid exists. On Windows the block only outlives its
+    # last handle, so finding one at all means its hub is still running.
+    if os.name != 'posix':
+        return True
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _seconds(value):
+    return int(value.timestamp()) if isinstance(value, datetime) else int(value)
+
+
+# --- Publisher (the Only Process Polling the Terminal) ---
+class DataHub:
+    def __init__(self, mt5, symbols, timeframes=None, name=DEFAULT_NAME, capacity=1000, slots=1 << 16, bar_store=None):
+        self.mt5 = mt5
+        self.name = name
+        self.capacity = capacity
+        self.slots = slots
+        self.timeframes = {tf_name: getattr(mt5, f"TIMEFRAME_{tf_name}") for tf_name in timeframes or TIMEFRAME_NAMES}
+        # streaming=False: the engine is only used for its delta fetch and local resampling
+        self.engines = {symbol: SignalEngine(mt5, symbol, self.timeframes, capacity=capacity, bar_store=bar_store,
+                                             streaming=False) for symbol in symbols}
+        self.symbol_index = {symbol: i for i, symbol in enumerate(symbols)}
+        self.series_index = {}
+        for symbol in symbols:
+            for tf_name in self.timeframes:
+                self.series_index[symbol, tf_name] = len(self.series_index)
+        plan, size = _layout(len(symbols), len(self.series_index), capacity, slots)
+        self.shm = self._create(size)
+        self.views = _views(self.shm.buf, plan)
+        self.header = self.views['header']
+        self.header[0] = (MAGIC, VERSION, len(symbols), len(self.series_index), capacity, slots, 0, 0.0, 0.0, os.getpid())
+        for (symbol, tf_name), i in self.series_index.items():
+            self.views['series'][i] = (0, symbol.encode(), self.timeframes[tf_name], 0, 0.0)
+        for symbol, i in self.symbol_index.items():
+            self.views['ticks']['symbol'][i] = symbol.encode()
+        self.last_bar = {}  # Series index -> (time, high, low, close, tick_volume) of the newest published bar
+        self.last_tick = {}
+        self.polls = 0
+        self.errors = 0  # Polls that raised
+
+    def _create(self, size):
+        try:
+            return shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        except FileExistsError:
+            pass
+        # Left behind by a hub that did not shut down cleanly (POSIX keeps it), unless that hub's process
+        # is still there: it may not have polled yet, or may be stuck, and its subscribers are attached
+        stale = shared_memory.SharedMemory(name=self.name)
+        header = np.ndarray((1,), HEADER_DTYPE, stale.buf)
+        beat, pid = float(header['heartbeat'][0]), int(header['pid'][0])
+        del header
+        stale.close()
+        if _alive(pid):
+            _forget(stale)
+            state = f"last polled {time.time() - beat:.1f}s ago" if beat else "has not polled yet"
+            raise RuntimeError(f"a data hub named {self.name!r} is already running (pid {pid}, {state})")
+        stale.unlink()
+        return shared_memory.SharedMemory(name=self.name, create=True, size=size)
+
+    def close(self):
+        # Subscribers still attached keep the mapping; a zero heartbeat makes their reads fail from now on
+        self.header['heartbeat'][0] = 0.0
+        self.header['pid'][0] = 0
+        self.views = self.header = None
+        self.shm.close()
+        self.shm.unlink()
+
+    # --- Publishing ---
+    def publish(self, kind, index, fields):
+        head = int(self.header['head'][0])
+        slot = head % self.slots
+        event = np.zeros((), dtype=EVENT_DTYPE)
+        event['seq'] = 2 * head + 1
+        event['kind'] = kind
+        event['index'] = index
+        for name, value in fields.items():
+            event[name] = value
+        events = self.views['events']
+        events['seq'][slot] = 2 * head + 1
+        events[slot] = event
+        events['seq'][slot] = 2 * head + 2
+        self.header['head'][0] = head + 1
+
+    def publish_bars(self, i, rates):
+        # Copies the window when its newest bar changed, plus one event per new or updated bar
+        if len(rates) == 0:
+            return 0
+        row = rates[-1]
+        key = (int(row['time']), float(row['high']), float(row['low']), float(row['close']), int(row['tick_volume']))
+        last = self.last_bar.get(i)
+        if key == last:
+            return 0
+        n = min(len(rates), self.capacity)
+        series = self.views['series']
+        series['seq'][i] += 1
+        self.views['bars'][i, :n] = rates[-n:]
+        series['count'][i] = n
+        series['updated'][i] = time.time()
+        series['seq'][i] += 1
+        changed = rates[-1:] if last is None else rates[rates['time'] >= last[0]]
+        for bar in changed[-self.slots:]:
+            self.publish(EVENT_BAR, i, {name: bar[name] for name in RATE_DTYPE.names})
+        self.last_bar[i] = key
+        return len(changed)
+
+    def publish_tick(self, symbol, tick):
+        key = (tick.time_msc, tick.bid, tick.ask)
+        i = self.symbol_index[symbol]
+        if self.last_tick.get(i) == key:
+            return 0
+        fields = {name: getattr(tick, name) for name, _ in TICK_FIELDS}
+        ticks = self.views['ticks']
+        ticks['seq'][i] += 1
+        for name, value in fields.items():
+            ticks[name][i] = value
+        ticks['seq'][i] += 1
+        self.publish(EVENT_TICK, i, fields)
+        self.last_tick[i] = key
+        return 1
+
+    def poll(self):
+        # One terminal round per symbol: a delta M1 fetch (other timeframes resampled) and the last tick
+        published = 0
+        for symbol, engine in self.engines.items():
+            for tf_name, rates in engine.fetch().items():
+                published += self.publish_bars(self.series_index[symbol, tf_name], rates)
+            tick = self.mt5.symbol_info_tick(symbol)
+            if tick:
+                published += self.publish_tick(symbol, tick)
+        self.polls += 1
+        self.header['heartbeat'][0] = time.time()
+        return published
+
+    def run(self, interval=0.1, report=None, report_every=60.0):
+        # Polls every `interval` seconds until interrupted; `report(hub, seconds_per_poll)` is called every `report_every` seconds.
+        # A poll that raises is logged and the next one tried; the heartbeat stops meanwhile, so subscribers see the gap.
+        self.header['interval'][0] = interval
+        last_report, busy, polls = time.time(), 0.0, 0
+        failing = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                self.poll()
+                if failing:
+                    print(f"{datetime.now():%H:%M:%S} Polling recovered after {failing} failed poll(s)")
+                    failing = 0
+            except Exception as e:
+                self.errors += 1
+                if not failing:
+                    print(f"{datetime.now():%H:%M:%S} Poll failed: {e!r}")
+                failing += 1
+            elapsed = time.perf_counter() - started
+            busy += elapsed
+            polls += 1
+            if report and time.time() - last_report >= report_every:
+                report(self, busy / polls)
+                last_report, busy, polls = time.time(), 0.0, 0
+            time.sleep(max(interval - elapsed, 0.0))
+
+
+# --- Subscriber (Stands in for the MetaTrader5 Module) ---
+class HubFeed:
+    def __init__(self, name=DEFAULT_NAME, backend=None, retries=10000, stale_polls=5, min_stale=1.0):
+        self.name = name
+        self.backend = backend  # Terminal module for the calls the hub does not serve; imported on first use when None
+        self.retries = retries  # Attempts at a consistent copy before giving up on a read
+        # Reads fail once the hub has not polled for `stale_polls` intervals (and at least `min_stale` seconds)
+        self.stale_polls = stale_polls
+        self.min_stale = min_stale
+        self.options = {}
+        self.terminal = None
+        self.shm = None
+        self.views = None
+        self.series_index = {}
+        self.symbol_index = {}
+        self.cursor = 0
+        self.dropped = 0  # Events overwritten before events() read them
+        self.error = (1, 'Success')
+        self.hub_call = True  # Whether the last call was served by the hub (for last_error)
+
+    def __getattr__(self, name):
+        # Timeframe constants need no terminal; anything else not served by the hub goes to a terminal connection
+        if name.startswith('TIMEFRAME_') and name[10:] in TIMEFRAMES and self.__dict__.get('terminal') is None:
+            return TIMEFRAMES[name[10:]]
+        if name.startswith('_') or 'backend' not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self._terminal(), name)
+
+    def _terminal(self):
+        self.hub_call = False
+        if self.terminal is None:
+            backend = self.backend
+            if backend is None:
+                import MetaTrader5 as backend
+            if not backend.initialize(**self.options):
+                raise ConnectionError(f"MetaTrader 5 initialize failed: {backend.last_error()}")
+            self.terminal = backend
+        return self.terminal
+
+    # --- Connection ---
+    def initialize(self, **options):
+        # Attaches to the hub's shared memory; `options` are kept for a later terminal connection
+        self.options = options
+        try:
+            self.shm = shared_memory.SharedMemory(name=self.name)
+            _forget(self.shm)
+        except FileNotFoundError:
+            self.error = (-10003, f"no data hub named {self.name!r} is running")
+            return False
+        header = np.ndarray((1,), HEADER_DTYPE, self.shm.buf)
+        if int(header['magic'][0]) != MAGIC or int(header['version'][0]) != VERSION:
+            self.error = (-10003, f"{self.name!r} is not a version {VERSION} data hub")
+            del header
+            self.shm.close()
+            return False
+        plan, _ = _layout(int(header['symbols'][0]), int(header['series'][0]),
+                          int(header['capacity'][0]), int(header['slots'][0]))
+        del header
+        self.views = _views(self.shm.buf, plan)
+        for view in self.views.values():
+            view.flags.writeable = False
+        self.header = self.views['header']
+        series = self.views['series']
+        self.series_index = {(symbol.decode(), int(tf)): i for i, (symbol, tf) in enumerate(zip(series['symbol'], series['timeframe']))}
+        self.symbol_index = {symbol.decode(): i for i, symbol in enumerate(self.views['ticks']['symbol'])}
+        self.cursor = int(self.header['head'][0])
+        return True
+
+    def shutdown(self):
+        if self.shm is not None:
+            self.views = self.header = None
+            self.shm.close()
+            self.shm = None
+        if self.terminal is not None:
+            self.terminal.shutdown()
+            self.terminal = None
+
+    def last_error(self):
+        return self.terminal.last_error() if self.terminal is not None and not self.hub_call else self.error
+
+    def age(self):
+        # Seconds since the hub's last poll (infinite before its first one and after it closed)
+        beat = float(self.header['heartbeat'][0])
+        return time.time() - beat if beat else float('inf')
+
+    def _fresh(self):
+        # Called before every hub-served read
+        self.hub_call = True
+        age = self.age()
+        if age > max(self.stale_polls * float(self.header['interval'][0]), self.min_stale):
+            state = f"has not polled for {age:.1f}s" if age != float('inf') else "is not polling"
+            self.error = (-10005, f"data hub {self.name!r} {state}")
+            return False
+        self.error = (1, 'Success')
+        return True
+
+    def symbols(self):
+        return list(self.symbol_index)
+
+    # --- Consistent Reads ---
+    def _read(self, seq, i, copy):
+        for _ in range(self.retries):
+            before = int(seq[i])
+            if before & 1:
+                continue  # Being written
+            data = copy()
+            if int(seq[i]) == before:
+                return data
+        self.error = (-10004, f"data hub {self.name!r} is writing too fast to read a consistent copy")
+        return None
+
+    def _series(self, symbol, timeframe, last=None):
+        # The newest `last` bars of the hub's window (all of it when None)
+        if not self._fresh():
+            return None
+        i = self.series_index[symbol, timeframe]
+        series = self.views['series']
+
+        def copy():
+            count = int(series['count'][i])
+            return self.views['bars'][i, max(count - last, 0) if last is not None else 0:count].copy()
+
+        return self._read(series['seq'], i, copy)
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        if (symbol, timeframe) not in self.series_index:
+            return self._terminal().copy_rates_from_pos(symbol, timeframe, start_pos, count)
+        rates = self._series(symbol, timeframe, start_pos + count)
+        if rates is None:
+            return None
+        end = len(rates) - start_pos
+        return rates[max(end - count, 0):max(end, 0)]
+
+    def copy_rates_from(self, symbol, timeframe, date_from, count):
+        if (symbol, timeframe) not in self.series_index:
+            return self._terminal().copy_rates_from(symbol, timeframe, date_from, count)
+        rates = self._series(symbol, timeframe)
+        if rates is None:
+            return None
+        end = np.searchsorted(rates['time'], _seconds(date_from), side='right')
+        return rates[max(end - count, 0):end]
+
+    def copy_rates_range(self, symbol, timeframe, date_from, date_to):
+        # Only the hub's window (the latest `capacity` bars) is served; older history comes from the terminal
+        if (symbol, timeframe) not in self.series_index:
+            return self._terminal().copy_rates_range(symbol, timeframe, date_from, date_to)
+        rates = self._series(symbol, timeframe)
+        if rates is None:
+            return None
+        if len(rates) and _seconds(date_from) < rates['time'][0]:
+            return self._terminal().copy_rates_range(symbol, timeframe, date_from, date_to)
+        lo = np.searchsorted(rates['time'], _seconds(date_from), side='left')
+        hi = np.searchsorted(rates['time'], _seconds(date_to), side='right')
+        return rates[lo:hi]
+
+    def symbol_info_tick(self, symbol):
+        if symbol not in self.symbol_index:
+            return self._terminal().symbol_info_tick(symbol)
+        if not self._fresh():
+            return None
+        i = self.symbol_index[symbol]
+        ticks = self.views['ticks']
+        row = self._read(ticks['seq'], i, lambda: ticks[i:i + 1].copy()[0])
+        if row is None or not row['time_msc']:
+            return None
+        return Tick(int(row['time']), float(row['bid']), float(row['ask']), float(row['last']), int(row['volume']),
+                    int(row['time_msc']), int(row['flags']), float(row['volume_real']))
+
+    # --- Event Stream ---
+    def events(self):
+        # Events published since the last call, oldest first (EVENT_DTYPE records)
+        slots = int(self.header['slots'][0])
+        head = int(self.header['head'][0])
+        if head - self.cursor > slots:
+            self.dropped += head - slots - self.cursor
+            self.cursor = head - slots
+        if self.cursor >= head:
+            return np.empty(0, dtype=EVENT_DTYPE)
+        expected = 2 * np.arange(self.cursor, head, dtype=np.uint64) + 2
+        slot = np.arange(self.cursor, head) % slots
+        ring = self.views['events']
+        batch = ring[slot]
+        # Checked on the copy and again afterwards: a slot the hub rewrote meanwhile ends the batch
+        valid = (batch['seq'] == expected) & (ring['seq'][slot] == expected)
+        n = len(valid) if valid.all() else int(np.argmin(valid))
+        self.cursor += n
+        return batch[:n]
+
+    def wait(self, timeout=None, poll=0.0001):
+        # Blocks until the hub publishes something and returns the new events (empty on timeout)
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            batch = self.events()
+            if len(batch) or (deadline is not None and time.perf_counter() >= deadline):
+                return batch
+            time.sleep(poll)
+
+    def describe(self, event):
+        # (symbol, timeframe name or 'tick') of an event
+        if event['kind'] == EVENT_TICK:
+            return self.views['ticks']['symbol'][event['index']].decode(), 'tick'
+        series = self.views['series']
+        return series['symbol'][event['index']].decode(), timeframe_name(int(series['timeframe'][event['index']]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Poll the terminal once for every strategy process and publish bars and ticks in shared memory.")
+    parser.add_argument('symbols', nargs='+')
+    parser.add_argument('--timeframes', default=','.join(TIMEFRAME_NAMES), help="Comma-separated; the smallest is fetched, the rest are resampled")
+    parser.add_argument('--name', default=DEFAULT_NAME, help="Shared-memory name the scripts' data_hub setting refers to")
+    parser.add_argument('--interval', type=float, default=0.1, help="Seconds between polls")
+    parser.add_argument('--capacity', type=int, default=1000, help="Bars kept per symbol/timeframe")
+    parser.add_argument('--slots', type=int, default=1 << 16, help="Events kept in the ring")
+    parser.add_argument('--store', help="Bar store root that receives closed bars (e.g. data/bars)")
+    args = parser.parse_args()
+
+    bar_store = None
+    if args.store:
+        from bbma_store import BarStore
+        bar_store = BarStore(args.store)
+    symbols = [symbol.upper() for symbol in args.symbols]
+
+    def report(hub, seconds_per_poll):
+        print(f"{datetime.now():%H:%M:%S} {hub.polls} polls, {int(hub.header['head'][0])} events, "
+              f"{seconds_per_poll * 1000:.2f}ms per poll")
+
+    with MT5Connection() as mt5:
+        hub = DataHub(mt5, symbols, args.timeframes.split(','), args.name, args.capacity, args.slots, bar_store)
+        print(f"Data hub {args.name!r} serving {', '.join(symbols)} ({args.timeframes}) every {args.interval}s")
+        try:
+            hub.run(args.interval, report)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            hub.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""Append-only trade log and incremental model training for learn_trade.py.
+
+Closed trades are appended as fixed-width records to one binary file
+(data/trades_{symbol}.bin). The row count is the file size divided by the
+record size, so checking for new trades costs one stat call. The trainer
+keeps the number of rows it has learned from in its checkpoint. It only
+trains when the log has grown, and continues boosting the existing booster
+(xgb_model=...) on the most recent rows instead of refitting from scratch.
+Checkpoints are written to a temporary file and swapped in with os.replace,
+so a crash never leaves a half-written model behind.
+
+SignalScorer sits between the timeframe consensus and order_send. It
+scores all candidate trades of a cycle with one inplace_predict call on
+the warm booster. Candidates below the threshold are gated out, and
+volume can scale with the score. Inference latency is kept in a
+log-bucket histogram.
+"""
+import csv
+import os
+import time
+
+import joblib
+import numpy as np
+
+from bbma_metrics import LatencyHistogram
+
+FEATURES = ['entry', 'tp', 'sl']  # Same inputs as the original Entry Price/TP/SL columns
+TRADE_RECORD_DTYPE = np.dtype([
+    ('time', '<i8'),
+    ('ticket', '<i8'),
+    ('direction', 'i1'),  # 1 buy, -1 sell, 0 unknown (rows imported from the old CSV)
+    ('entry', '<f8'),
+    ('tp', '<f8'),
+    ('sl', '<f8'),
+    ('win', 'i1'),
+])
+
+
+# --- Append-Only Trade Log ---
+class TradeLog:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._repair()
+
+    def _repair(self):
+        # A crash mid-write can leave a partial record at the end; cut it off
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size % TRADE_RECORD_DTYPE.itemsize or not os.path.exists(self.path):
+            with open(self.path, 'ab') as f:
+                f.truncate(size - size % TRADE_RECORD_DTYPE.itemsize)
+
+    def __len__(self):
+        return os.path.getsize(self.path) // TRADE_RECORD_DTYPE.itemsize
+
+    def append(self, time, ticket, direction, entry, tp, sl, win):
+        record = np.array([(time, ticket, direction, entry, tp, sl, win)], dtype=TRADE_RECORD_DTYPE)
+        with open(self.path, 'ab') as f:
+            f.write(record.tobytes())
+        return len(self)
+
+    def rows(self, start=0, end=None):
+        # Read-only view of records start..end without loading the rest of the file
+        count = len(self)
+        end = count if end is None else min(end, count)
+        if start >= end:
+            return np.empty(0, dtype=TRADE_RECORD_DTYPE)
+        return np.memmap(self.path, dtype=TRADE_RECORD_DTYPE, mode='r', shape=(count,))[start:end]
+
+    def import_csv(self, csv_path):
+        # One-off migration of the old trade_history CSV (rows end with Entry Price, TP, SL, Result)
+        if len(self) or not os.path.exists(csv_path):
+            return 0
+        imported = 0
+        with open(csv_path, newline='') as f:
+            for fields in csv.reader(f):
+                if len(fields) < 4 or fields[-1] not in ('win', 'loss'):
+                    continue
+                direction = {'BUY': 1, 'SELL': -1}.get(fields[0], 0) if len(fields) > 4 else 0
+                entry, tp, sl = (float(value) for value in fields[-4:-1])
+                self.append(0, 0, direction, entry, tp, sl, fields[-1] == 'win')
+                imported += 1
+        return imported
+
+
+# --- Incremental Trainer with Atomic Checkpoints ---
+class IncrementalTrainer:
+    def __init__(self, model_path, log, min_trades=30, update_rounds=10, window=500, max_trees=2000, refit_window=5000):
+        self.model_path = model_path
+        self.log = log
+        self.min_trades = min_trades
+        self.update_rounds = update_rounds  # Trees added per update
+        self.window = window  # Most recent rows each update boosts on
+        self.max_trees = max_trees  # Past this the model is refit so predict cost stays bounded
+        self.refit_window = refit_window  # Rows used by a full refit
+        self.model, self.trained_rows = self.load()
+
+    def load(self):
+        if os.path.exists(self.model_path):
+            saved = joblib.load(self.model_path)
+            if isinstance(saved, dict):
+                return saved['model'], saved['trained_rows']
+            return saved, 0  # Checkpoint from before the trade log: refit on the log once
+        import xgboost as xgb
+        return xgb.XGBRegressor(), 0
+
+    def checkpoint(self):
+        tmp = self.model_path + '.tmp'
+        joblib.dump({'model': self.model, 'trained_rows': self.trained_rows}, tmp)
+        os.replace(tmp, self.model_path)
+
+    def update(self):
+        # Returns the number of new rows learned from (0 when there was nothing to do)
+        total = len(self.log)
+        new = total - self.trained_rows
+        if total < self.min_trades or new <= 0:
+            return 0
+        if self.trained_rows == 0 or self.model.get_booster().num_boosted_rounds() >= self.max_trees:
+            rows = self.log.rows(max(total - self.refit_window, 0))
+            self.model.set_params(n_estimators=100)
+            self.model.fit(*self.dataset(rows))
+        else:
+            rows = self.log.rows(max(total - max(self.window, new), 0))
+            self.model.set_params(n_estimators=self.update_rounds)
+            self.model.fit(*self.dataset(rows), xgb_model=self.model.get_booster())
+        self.trained_rows = total
+        self.checkpoint()
+        return new
+
+    @staticmethod
+    def dataset(rows):
+        X = np.column_stack([rows[name] for name in FEATURES]).astype(np.float64)
+        return X, rows['win'].astype(np.float64)
+
+
+# --- Batched Scoring of Candidate Trades ---
+class SignalScorer:
+    def __init__(self, trainer, threshold=0.5, volume=0.01, max_volume=0.01, volume_step=0.01, budget=0.005):
+        self.trainer = trainer
+        self.threshold = threshold  # Candidates scoring below this are not traded
+        self.volume = volume  # Volume at the threshold, scaled linearly up to max_volume at a score of 1
+        self.max_volume = max_volume
+        self.volume_step = volume_step
+        self.budget = budget  # Seconds one scoring call may take before it counts as an overrun
+        self.latency = LatencyHistogram()
+        self.overruns = 0
+        self.warm_rounds = None
+
+    def ready(self):
+        return self.trainer.trained_rows > 0
+
+    def warm(self):
+        # The first predict after loading or updating a booster pays for setup; do it off the order path
+        if self.ready():
+            booster = self.trainer.model.get_booster()
+            booster.inplace_predict(np.zeros((1, len(FEATURES))))
+            self.warm_rounds = booster.num_boosted_rounds()
+
+    def score(self, candidates):
+        # One predict for all candidates (dicts with entry/tp/sl); None when no model is trained yet
+        if not self.ready() or not candidates:
+            return None
+        booster = self.trainer.model.get_booster()
+        if booster.num_boosted_rounds() != self.warm_rounds:
+            self.warm()
+        X = np.array([[candidate[name] for name in FEATURES] for candidate in candidates], dtype=np.float64)
+        started = time.perf_counter()
+        scores = booster.inplace_predict(X)
+        elapsed = time.perf_counter() - started
+        self.latency.record(elapsed)
+        if elapsed > self.budget:
+            self.overruns += 1
+        return scores
+
+    def size(self, score):
+        if score is None:
+            return self.volume  # No model yet: trade as before
+        if score < self.threshold:
+            return 0.0
+        span = (score - self.threshold) / max(1.0 - self.threshold, 1e-9)
+        volume = self.volume + min(span, 1.0) * (self.max_volume - self.volume)
+        return float(round(np.floor(volume / self.volume_step + 1e-9) * self.volume_step, 8))
+
+    def select(self, candidates):
+        # Best-scoring candidate with its score and volume, or None when every candidate is gated out
+        scores = self.score(candidates)
+        if scores is None:
+            return (candidates[0], None, self.volume) if candidates else None
+        best = int(np.argmax(scores))
+        volume = self.size(float(scores[best]))
+        return (candidates[best], float(scores[best]), volume) if volume > 0 else None
@@ -0,0 +1,199 @@
+"""Low-overhead metrics for the live loops.
+
+Stage durations (fetch, indicators, news, retrain, score, order_send, ...)
+go into constant-memory log-bucket histograms. Counters track bars
+processed, signals emitted and order results. Recording a value costs a
+perf_counter call, a log2 and a list increment. Nothing is formatted until
+an export runs.
+
+Exports:
+  serve(port)      Prometheus text format on http://127.0.0.1:<port>/metrics
+  start_jsonl(path) a snapshot line every `interval` seconds to a size-rotated JSONL file
+"""
+import json
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# --- Latency Histogram (Log-Spaced Buckets, Constant Memory) ---
+class LatencyHistogram:
+    def __init__(self, lowest=1e-6, highest=10.0, buckets_per_doubling=4):
+        self.lowest = lowest
+        self.per_doubling = buckets_per_doubling
+        self.size = int(math.ceil(math.log2(highest / lowest) * buckets_per_doubling)) + 1
+        self.counts = [0] * self.size
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        seconds = float(seconds)
+        k = 0 if seconds <= self.lowest else int(math.log2(seconds / self.lowest) * self.per_doubling) + 1
+        self.counts[min(k, self.size - 1)] += 1
+        self.total += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def upper_bound(self, k):
+        return self.lowest * 2 ** (k / self.per_doubling)
+
+    def quantile(self, q):
+        # Upper edge of the bucket holding the q-th observation (at most ~19% above the true value)
+        if not self.total:
+            return None
+        rank = max(int(math.ceil(q * self.total)), 1)
+        seen = 0
+        for k, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.upper_bound(k), self.max)
+        return self.max
+
+    def summary(self):
+        if not self.total:
+            return {}
+        return {'count': self.total, 'sum': self.sum, 'p50': self.quantile(0.5), 'p99': self.quantile(0.99), 'max': self.max}
+
+
+class _Timer:
+    __slots__ = ('histogram', 'lock', 'started')
+
+    def __init__(self, histogram, lock):
+        self.histogram = histogram
+        self.lock = lock
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        with self.lock:
+            self.histogram.record(elapsed)
+        return False
+
+
+def _label_text(labels):
+    return ','.join(f'{key}="{value}"' for key, value in labels)
+
+
+# --- Registry ---
+class Metrics:
+    def __init__(self, prefix='bbma', labels=None):
+        self.prefix = prefix
+        self.labels = tuple(sorted((labels or {}).items()))  # Added to every series, e.g. {'symbol': 'EURUSD'}
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def _key(self, name, labels):
+        return name, self.labels + tuple(sorted(labels.items()))
+
+    def histogram(self, name, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms.setdefault(key, LatencyHistogram())
+        return histogram
+
+    def stage(self, name):
+        # `with metrics.stage('fetch'): ...` records the block's duration
+        return _Timer(self.histogram('stage_seconds', stage=name), self.lock)
+
+    def observe(self, name, seconds, **labels):
+        histogram = self.histogram(name, **labels)
+        with self.lock:
+            histogram.record(seconds)
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    # --- Exports ---
+    def snapshot(self):
+        with self.lock:
+            histograms = {key: histogram.summary() for key, histogram in self.histograms.items()}
+            counters = dict(self.counters)
+        return {
+            'time': time.time(),
+            'uptime': time.time() - self.started,
+            'histograms': [dict(name=name, labels=dict(labels), **summary) for (name, labels), summary in histograms.items() if summary],
+            'counters': [dict(name=name, labels=dict(labels), value=value) for (name, labels), value in counters.items()],
+        }
+
+    def prometheus_text(self):
+        lines = []
+        typed = set()
+        with self.lock:
+            histograms = [(key, histogram.summary(), [(q, histogram.quantile(q)) for q in (0.5, 0.9, 0.99)])
+                          for key, histogram in self.histograms.items() if histogram.total]
+            counters = list(self.counters.items())
+        for (name, labels), summary, quantiles in histograms:
+            metric = f"{self.prefix}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} summary")
+                typed.add(metric)
+            for q, value in quantiles:
+                lines.append(f"{metric}{{{_label_text(labels + (('quantile', q),))}}} {value:.9g}")
+            lines.append(f"{metric}_sum{{{_label_text(labels)}}} {summary['sum']:.9g}")
+            lines.append(f"{metric}_count{{{_label_text(labels)}}} {summary['count']}")
+        for (name, labels), value in counters:
+            metric = f"{self.prefix}_{name}_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{{{_label_text(labels)}}} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='127.0.0.1'):
+        # Prometheus scrape endpoint in a daemon thread; returns the server
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name='MetricsServer', daemon=True).start()
+        return server
+
+    def write_jsonl(self, path, max_bytes=10 * 1024 * 1024, backups=3):
+        # Append one snapshot line, rotating path -> path.1 -> ... -> path.<backups> past max_bytes
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if os.path.exists(path) and os.path.getsize(path) >= max_bytes:
+            for i in range(backups, 0, -1):
+                source = path if i == 1 else f"{path}.{i - 1}"
+                if os.path.exists(source):
+                    os.replace(source, f"{path}.{i}")
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.snapshot()) + '\n')
+
+    def start_jsonl(self, path, interval=60.0, max_bytes=10 * 1024 * 1024, backups=3):
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write_jsonl(path, max_bytes, backups)
+                except OSError as e:
+                    print(f"Metrics export failed: {e}")
+
+        thread = threading.Thread(target=run, name='MetricsJsonl', daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,96 @@
+"""Background monitor for any number of open positions.
+
+PositionMonitor runs in a daemon thread. Every `interval` seconds it syncs
+new deals through DealSync. Tracked positions that closed are handed to
+`on_close(outcome, info)`. For positions still open, `adjust(position, info)`
+may return new (tp, sl) levels, which are applied with `modify(position, tp, sl)`.
+Levels the server rejected are not sent again, and after each rejection the
+position waits twice as long (up to `max_backoff` seconds) before the next try.
+The analysis loop only calls track() after an order fills, so it never
+waits for a position to close.
+"""
+import threading
+import time
+
+
+class PositionMonitor(threading.Thread):
+    def __init__(self, deal_sync, on_close=None, adjust=None, modify=None, interval=5.0, min_change=0.0,
+                 max_backoff=600.0):
+        super().__init__(name='PositionMonitor', daemon=True)
+        self.deal_sync = deal_sync
+        self.on_close = on_close
+        self.adjust = adjust
+        self.modify = modify
+        self.interval = interval
+        self.min_change = min_change  # Smallest TP/SL move worth a modify request (e.g. the symbol's point)
+        self.max_backoff = max_backoff
+        self.positions = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def track(self, position, tp=None, sl=None, **info):
+        with self.lock:
+            self.positions[position] = dict(info, tp=tp, sl=sl)
+
+    def open_positions(self):
+        with self.lock:
+            return dict(self.positions)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.positions)
+
+    def stop(self, timeout=None):
+        self.stopped.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.run_once()
+            self.stopped.wait(self.interval)
+
+    def run_once(self):
+        # One poll without the thread (bbma_replay calls this from its virtual clock)
+        try:
+            self.poll()
+        except Exception as e:
+            # Keep monitoring after a transient terminal error
+            print(f"Position monitor error: {e}")
+
+    def poll(self):
+        self.deal_sync.sync()
+        # Checked per tracked position rather than from sync()'s return value, so a position that
+        # closed before track() was called is still reported
+        for position in list(self.open_positions()):
+            outcome = self.deal_sync.outcome(position)
+            if outcome is None or not outcome['closed']:
+                continue
+            with self.lock:
+                info = self.positions.pop(position, None)
+            if info is not None and self.on_close:
+                self.on_close(outcome, info)
+        if not (self.adjust and self.modify):
+            return
+        now = time.time()
+        for position, info in self.open_positions().items():
+            if now < info.get('retry_at', 0.0):
+                continue
+            levels = self.adjust(position, info)
+            if levels is None:
+                continue
+            tp, sl = levels
+            # Compared with the last levels sent, so a rejected pair is not sent again
+            last_tp, last_sl = info.get('attempted') or (info['tp'], info['sl'])
+            if all(old is not None and abs(new - old) <= self.min_change for new, old in ((tp, last_tp), (sl, last_sl))):
+                continue
+            applied = self.modify(position, tp, sl)
+            with self.lock:
+                if position not in self.positions:
+                    continue
+                if applied:
+                    self.positions[position].update(tp=tp, sl=sl, attempted=None, rejections=0, retry_at=0.0)
+                else:
+                    rejections = info.get('rejections', 0) + 1
+                    backoff = min(self.interval * 2 ** rejections, self.max_backoff)
+                    self.positions[position].update(attempted=(tp, sl), rejections=rejections, retry_at=now + backoff)
@@ -0,0 +1,236 @@
+"""Market order routing: side price, filling mode, pre-checks and requote retries.
+
+OrderRouter keeps the symbol's trading parameters (symbol_info, refreshed
+every `info_ttl` seconds) and its last tick. A market order:
+  - is priced at the ask for a buy and at the bid for a sell;
+  - uses the first filling mode the symbol allows (FOK, then IOC, then RETURN);
+  - has its volume rounded to the symbol's step and limits, and its TP/SL
+    rounded to the tick size and checked against the stops level before
+    anything is sent;
+  - goes through order_check before the first order_send;
+  - is re-priced from a fresh tick and sent again after a requote,
+    price-changed or price-off reply, up to `max_attempts` sends and until
+    `deadline` seconds after the signal.
+Every order returns a fill record: attempts, retcodes, signal-to-fill
+latency and slippage in points against the price at signal time (positive
+is worse). Records feed Metrics (slippage as separate adverse and favourable
+counters, so both only grow) and, with `log_path`, a JSONL file.
+"""
+import json
+import os
+import time
+from collections import deque
+
+# MetaTrader 5 constants, so this module does not need the terminal package
+ORDER_TYPE_BUY, ORDER_TYPE_SELL = 0, 1
+ORDER_FILLING_FOK, ORDER_FILLING_IOC, ORDER_FILLING_RETURN = 0, 1, 2
+SYMBOL_FILLING_FOK, SYMBOL_FILLING_IOC = 1, 2
+TRADE_ACTION_DEAL = 1
+TRADE_RETCODE_REQUOTE = 10004
+TRADE_RETCODE_DONE, TRADE_RETCODE_DONE_PARTIAL = 10009, 10010
+TRADE_RETCODE_PRICE_CHANGED, TRADE_RETCODE_PRICE_OFF = 10020, 10021
+TRADE_RETCODE_INVALID_FILL = 10030
+RETRY_RETCODES = {TRADE_RETCODE_REQUOTE, TRADE_RETCODE_PRICE_CHANGED, TRADE_RETCODE_PRICE_OFF}
+FILLED_RETCODES = {TRADE_RETCODE_DONE, TRADE_RETCODE_DONE_PARTIAL}
+FILLING_NAMES = {ORDER_FILLING_FOK: 'FOK', ORDER_FILLING_IOC: 'IOC', ORDER_FILLING_RETURN: 'RETURN'}
+
+
+class OrderRouter:
+    def __init__(self, mt5, symbol, magic=0, deviation=10, deadline=2.0, max_attempts=5, info_ttl=60.0, tick_ttl=0.5,
+                 metrics=None, log_path=None):
+        self.mt5 = mt5
+        self.symbol = symbol
+        self.magic = magic
+        self.deviation = deviation  # Points the fill may differ from the request price
+        self.deadline = deadline  # Seconds after the signal after which no retry is sent
+        self.max_attempts = max_attempts
+        self.info_ttl = info_ttl
+        self.tick_ttl = tick_ttl  # A tick younger than this (from quote()) prices the first attempt
+        self.metrics = metrics
+        self.log_path = log_path
+        self.symbol_info = None
+        self.info_at = None
+        self.last_tick = None
+        self.tick_at = None
+        self.fills = deque(maxlen=1000)  # Recent fill records, for summary()
+
+    # --- Snapshots ---
+    def info(self):
+        now = time.time()
+        if self.symbol_info is None or now - self.info_at > self.info_ttl:
+            info = self.mt5.symbol_info(self.symbol)
+            if info is None:
+                raise RuntimeError(f"symbol_info({self.symbol!r}) failed: {self.mt5.last_error()}")
+            self.symbol_info, self.info_at = info, now
+        return self.symbol_info
+
+    def tick(self, max_age=0.0):
+        # The last tick, fetched again unless it is younger than `max_age` seconds
+        now = time.time()
+        if self.last_tick is None or now - self.tick_at > max_age:
+            tick = self.mt5.symbol_info_tick(self.symbol)
+            if tick is None:
+                raise RuntimeError(f"symbol_info_tick({self.symbol!r}) failed: {self.mt5.last_error()}")
+            self.last_tick, self.tick_at = tick, now
+        return self.last_tick
+
+    def refresh(self):
+        # Call between cycles so the order path finds both snapshots warm
+        self.info()
+        self.tick()
+
+    def quote(self, direction):
+        # Price a market order would be sent at now: ask for 'BUY', bid for 'SELL'
+        tick = self.tick()
+        return tick.ask if direction == 'BUY' else tick.bid
+
+    # --- Request Parameters ---
+    def filling_modes(self):
+        # Order filling types the symbol accepts, fastest-failing first
+        allowed = self.info().filling_mode
+        modes = [mode for mode, flag in ((ORDER_FILLING_FOK, SYMBOL_FILLING_FOK), (ORDER_FILLING_IOC, SYMBOL_FILLING_IOC))
+                 if allowed & flag]
+        return modes + [ORDER_FILLING_RETURN]
+
+    def normalize_volume(self, volume):
+        info = self.info()
+        step = info.volume_step or 0.01
+        volume = round(round(volume / step) * step, 8)
+        return min(max(volume, info.volume_min), info.volume_max)
+
+    def normalize_price(self, price):
+        # A price level (e.g. a raw Bollinger band) on the symbol's tick grid; 0/None mean no level
+        if not price:
+            return price
+        info = self.info()
+        tick_size = getattr(info, 'trade_tick_size', 0.0) or info.point
+        return round(round(price / tick_size) * tick_size, info.digits)
+
+    def stops_problem(self, order_type, tick, sl, tp):
+        # Why the TP/SL cannot be accepted at this tick, or None. A buy's stops are measured from
+        # the bid and a sell's from the ask, and must be at least trade_stops_level points away.
+        info = self.info()
+        level = info.trade_stops_level * info.point
+        if order_type == ORDER_TYPE_BUY:
+            distances = {'sl': tick.bid - sl if sl else None, 'tp': tp - tick.bid if tp else None}
+        else:
+            distances = {'sl': sl - tick.ask if sl else None, 'tp': tick.ask - tp if tp else None}
+        for name, distance in distances.items():
+            if distance is not None and (distance <= 0 or distance < level):
+                value = sl if name == 'sl' else tp
+                return f"{name.upper()} {value} is on the wrong side of the price or closer than {info.trade_stops_level} points"
+        return None
+
+    def request(self, order_type, volume, price, sl, tp, filling, comment):
+        return {
+            "action": TRADE_ACTION_DEAL,
+            "symbol": self.symbol,
+            "volume": volume,
+            "type": order_type,
+            "price": price,
+            "sl": sl or 0.0,
+            "tp": tp or 0.0,
+            "deviation": self.deviation,
+            "magic": self.magic,
+            "comment": comment,
+            "type_filling": filling,
+        }
+
+    # --- Sending ---
+    def market_order(self, direction, volume, sl=None, tp=None, reference=None, signal_at=None, comment=''):
+        # `signal_at` is the perf_counter() time of the decision and `reference` the price quoted then
+        signal_at = time.perf_counter() if signal_at is None else signal_at
+        order_type = ORDER_TYPE_BUY if direction == 'BUY' else ORDER_TYPE_SELL
+        sl, tp = self.normalize_price(sl), self.normalize_price(tp)
+        tick = self.tick(self.tick_ttl)
+        price = tick.ask if order_type == ORDER_TYPE_BUY else tick.bid
+        fill = {
+            'time': time.time(), 'symbol': self.symbol, 'direction': direction, 'volume': self.normalize_volume(volume),
+            'reference': price if reference is None else reference, 'sl': sl, 'tp': tp, 'price': None, 'order': 0, 'deal': 0,
+            'done': False, 'retcode': None, 'retcodes': [], 'attempts': 0, 'filling': None, 'latency': None,
+            'slippage': None, 'reason': None,
+        }
+        fillings = self.filling_modes()
+        checked = False
+        while True:
+            problem = self.stops_problem(order_type, tick, sl, tp)
+            if problem:
+                fill['reason'] = problem
+                break
+            request = self.request(order_type, fill['volume'], price, sl, tp, fillings[0], comment)
+            if not checked:
+                # Margin, volume, stops and filling validated by the server before committing to a send
+                check = self.mt5.order_check(request)
+                retcode = None if check is None else check.retcode
+                if retcode != 0:
+                    fill['retcodes'].append(('check', retcode))
+                    if retcode == TRADE_RETCODE_INVALID_FILL and len(fillings) > 1:
+                        fillings.pop(0)
+                        continue
+                    fill['retcode'] = retcode
+                    fill['reason'] = f"order_check failed: {check.comment if check is not None else self.mt5.last_error()}"
+                    break
+                checked = True
+            fill['attempts'] += 1
+            fill['filling'] = FILLING_NAMES[fillings[0]]
+            if self.metrics:
+                with self.metrics.stage('order_send'):  # Round trip to the trade server
+                    result = self.mt5.order_send(request)
+            else:
+                result = self.mt5.order_send(request)
+            retcode = None if result is None else result.retcode
+            fill['retcode'] = retcode
+            fill['retcodes'].append(retcode)
+            if self.metrics:
+                self.metrics.inc('orders', action='deal', retcode=retcode)
+            if retcode in FILLED_RETCODES:
+                fill.update(done=True, price=result.price, order=result.order, deal=result.deal, volume=result.volume)
+                break
+            if retcode == TRADE_RETCODE_INVALID_FILL and len(fillings) > 1:
+                fillings.pop(0)
+                checked = False
+                continue
+            if retcode in RETRY_RETCODES and fill['attempts'] < self.max_attempts and \
+                    time.perf_counter() - signal_at < self.deadline:
+                tick = self.tick()
+                price = tick.ask if order_type == ORDER_TYPE_BUY else tick.bid
+                continue
+            fill['reason'] = f"order_send returned {retcode}: {result.comment if result is not None else self.mt5.last_error()}"
+            break
+        fill['latency'] = time.perf_counter() - signal_at
+        if fill['done']:
+            sign = 1 if order_type == ORDER_TYPE_BUY else -1
+            fill['slippage'] = round(sign * (fill['price'] - fill['reference']) / self.info().point, 1) + 0.0  # No -0.0
+        self._record(fill)
+        return fill
+
+    def _record(self, fill):
+        self.fills.append(fill)
+        if self.metrics:
+            outcome = 'filled' if fill['done'] else 'failed'
+            self.metrics.inc('order_attempts', fill['attempts'], outcome=outcome)
+            self.metrics.observe('signal_to_fill_seconds', fill['latency'], outcome=outcome)
+            if fill['done']:
+                self.metrics.inc('fills', direction=fill['direction'])
+                if fill['slippage']:
+                    side = 'adverse' if fill['slippage'] > 0 else 'favourable'
+                    self.metrics.inc('slippage_points', abs(fill['slippage']), direction=fill['direction'], side=side)
+        if self.log_path:
+            os.makedirs(os.path.dirname(self.log_path) or '.', exist_ok=True)
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps(fill, default=str) + '\n')
+
+    def summary(self):
+        # Fill rate, signal-to-fill latency and mean slippage over the recent orders
+        if not self.fills:
+            return {}
+        filled = [fill for fill in self.fills if fill['done']]
+        latencies = sorted(fill['latency'] for fill in filled)
+        return {
+            'orders': len(self.fills),
+            'fill_rate': len(filled) / len(self.fills),
+            'retried': sum(fill['attempts'] > 1 for fill in self.fills),
+            'p50': latencies[len(latencies) // 2] if latencies else None,
+            'p99': latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] if latencies else None,
+            'slippage': sum(fill['slippage'] for fill in filled) / len(filled) if filled else None,
+        }
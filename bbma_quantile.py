@@ -0,0 +1,181 @@
+"""Incremental quantile estimators for the regime filters.
+
+bbma_signal.py used to hold a signal when the market was ranging (band
+width below the median of BB_Upper) or too volatile (ATR above its 0.9
+quantile). Both thresholds were recomputed by sorting the 1000 fetched
+candles every cycle. The estimators here are instead updated once per
+closed bar, over a lookback that is independent of the fetch size:
+
+  WindowQuantile  exact quantile of the last `window` values. The window is
+                  kept as sorted blocks, so an update costs O(sqrt(window)),
+                  and only the window is held in memory.
+  P2Quantile      P² estimate (Jain & Chlamtac) over every value pushed.
+                  Five markers give O(1) time and memory per update, but it
+                  has no window and adapts slowly to regime changes.
+  RegimeFilter    the Ranging and high-volatility rules on top of either
+                  estimator, applied to BBMAStream rows.
+"""
+import math
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+
+NAN = float('nan')
+
+
+def sample_quantile(ordered, q):
+    # Linear interpolation between order statistics, as Series.quantile and np.quantile
+    if not ordered:
+        return NAN
+    position = q * (len(ordered) - 1)
+    lower = int(position)
+    if lower + 1 >= len(ordered):
+        return ordered[-1]
+    return ordered[lower] + (ordered[lower + 1] - ordered[lower]) * (position - lower)
+
+
+# --- Exact Quantile over a Sliding Window (Order-Statistic Window in Sorted Blocks) ---
+class WindowQuantile:
+    def __init__(self, q, window, block=256):
+        self.q = q
+        self.window = window
+        self.block = block
+        self.values = deque()  # Arrival order, to know which value leaves the window
+        self.blocks = []  # Sorted blocks whose concatenation is the sorted window
+        self.maxes = []  # Largest value of each block
+
+    def __len__(self):
+        return len(self.values)
+
+    def push(self, value):
+        value = float(value)
+        if len(self.values) == self.window:
+            self._remove(self.values.popleft())
+        self.values.append(value)
+        self._insert(value)
+
+    def _insert(self, value):
+        if not self.blocks:
+            self.blocks.append([value])
+            self.maxes.append(value)
+            return
+        i = min(bisect_left(self.maxes, value), len(self.blocks) - 1)
+        block = self.blocks[i]
+        insort(block, value)
+        self.maxes[i] = block[-1]
+        if len(block) > 2 * self.block:
+            self.blocks[i:i + 1] = [block[:self.block], block[self.block:]]
+            self.maxes[i:i + 1] = [block[self.block - 1], block[-1]]
+
+    def _remove(self, value):
+        i = bisect_left(self.maxes, value)
+        block = self.blocks[i]
+        del block[bisect_left(block, value)]
+        if block:
+            self.maxes[i] = block[-1]
+        else:
+            del self.blocks[i]
+            del self.maxes[i]
+
+    def _at(self, k):
+        for block in self.blocks:
+            if k < len(block):
+                return block[k]
+            k -= len(block)
+        raise IndexError(k)
+
+    def value(self):
+        n = len(self.values)
+        if not n:
+            return NAN
+        position = self.q * (n - 1)
+        lower = int(position)
+        low = self._at(lower)
+        if lower + 1 >= n:
+            return low
+        return low + (self._at(lower + 1) - low) * (position - lower)
+
+
+# --- P² Estimate over the Whole Stream (Five Markers, Constant Memory) ---
+class P2Quantile:
+    def __init__(self, q):
+        self.q = q
+        self.count = 0
+        self.heights = []  # The first five values, then the marker heights
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5]
+        self.increments = [0, q / 2, q, (1 + q) / 2, 1]
+
+    def __len__(self):
+        return self.count
+
+    def push(self, value):
+        value = float(value)
+        self.count += 1
+        h = self.heights
+        if self.count <= 5:
+            insort(h, value)
+            return
+        if value < h[0]:
+            h[0] = value
+            k = 0
+        elif value >= h[4]:
+            h[4] = value
+            k = 3
+        else:
+            k = bisect_right(h, value) - 1
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if d > 0 else -1
+                height = self._parabolic(i, step)
+                if not h[i - 1] < height < h[i + 1]:
+                    height = h[i] + step * (h[i + step] - h[i]) / (n[i + step] - n[i])
+                h[i] = height
+                n[i] += step
+
+    def _parabolic(self, i, d):
+        h, n = self.heights, self.positions
+        return h[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1]))
+
+    def value(self):
+        if self.count <= 5:
+            return sample_quantile(self.heights, self.q)
+        return self.heights[2]
+
+
+# --- Ranging and High-Volatility Filters (bbma_signal.py) ---
+class RegimeFilter:
+    def __init__(self, lookback, atr_quantile=0.9, estimator='window'):
+        # `lookback` is in bars of the filtered timeframe; ignored by the 'p2' estimator
+        if estimator == 'window':
+            self.upper_median = WindowQuantile(0.5, lookback)
+            self.atr_threshold = WindowQuantile(atr_quantile, lookback)
+        elif estimator == 'p2':
+            self.upper_median = P2Quantile(0.5)
+            self.atr_threshold = P2Quantile(atr_quantile)
+        else:
+            raise ValueError(f"unknown estimator: {estimator}")
+
+    def push(self, row):
+        # Called once per closed bar
+        if not math.isnan(row['BB_Upper']):
+            self.upper_median.push(row['BB_Upper'])
+        if not math.isnan(row['ATR']):
+            self.atr_threshold.push(row['ATR'])
+
+    def apply(self, row):
+        # Adds Trending, Ranging and Filtered_Signal to a stream row. Ranging compares the band
+        # width with the median of BB_Upper, the same comparison as the pandas analyze_bbma.
+        ranging = row['BB_Upper'] - row['BB_Lower'] < self.upper_median.value()
+        volatile = row['ATR'] > self.atr_threshold.value()
+        row['Trending'] = row['close'] > row['SMA200']
+        row['Ranging'] = ranging
+        row['Filtered_Signal'] = 'Hold' if ranging or volatile else row['Signal']
+        return row
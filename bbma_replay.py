@@ -0,0 +1,667 @@
+"""Record the live market data stream and replay it on a virtual clock.
+
+`record` runs a live script with `import MetaTrader5` served by a Recorder.
+The Recorder passes every call on to the terminal. It also appends what the
+loop saw to data/recordings/<time>/:
+  <SYMBOL>.bars        closed M1 bars (RATE_DTYPE records)
+  <SYMBOL>.forming     the forming M1 bar of every M1 fetch, with the local time it was seen
+  <SYMBOL>.ticks       every symbol_info_tick result, with the local time it was seen
+  <SYMBOL>.native      every other copy_rates_* result (the native higher-timeframe history
+                       the resampler seeds from, drift checks), with timeframe and start_pos
+  meta.json            symbols, symbol_info fields, start and stop time, script
+  calendar_cache.json  the economic calendar the script had cached
+  output.log           what the script printed
+
+`play` runs the same script, unchanged, against a ReplayTerminal:
+  - time.time and time.sleep come from a VirtualClock. A sleep on the main
+    thread only moves the clock, so bar-close waits cost nothing.
+  - At each virtual instant the terminal serves the closed bars, the forming
+    bar and the last tick that had been seen by then. Higher timeframes are
+    the native bars recorded by then, continued with bars resampled from the
+    recorded M1 bars where those cover the whole bucket. Orders fill on the
+    recorded quotes, and TP/SL settle against the recorded bars with the
+    bbma_fakemt5 trading logic.
+  - PositionMonitor polls run as clock timers on the main thread instead of
+    in their own thread, so trades are handled at the same points every run.
+  - input() answers the recorded symbol, and the calendar is served from the
+    recorded cache without a refresh.
+  - The script runs in its own working directory (data/replay/<name>). Trade
+    logs, models and bar stores start empty, or as copies of --data.
+The replay ends when the virtual clock passes the end of the recording. The
+Signals, Final Decision and Take Profit lines the replay printed are checked
+against the recorded output.log; the summary reports how many matched. The
+time the loop spent computing is not on the virtual clock, so a response
+recorded up to `skew` seconds after a call is served to it. Background
+threads (the metrics JSONL export) keep sleeping in real time. The asyncio
+mode of bbma_signal.py waits on the event loop's clock and is not supported.
+
+Usage: python bbma_replay.py record learn_trade.py [--out data/recordings/NAME]
+       python bbma_replay.py play data/recordings/NAME learn_trade.py [--workdir DIR] [--data DIR] [--verbose]
+"""
+import argparse
+import builtins
+import contextlib
+import hashlib
+import heapq
+import json
+import os
+import re
+import runpy
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+import bbma_fakemt5
+from bbma_cache import RATE_DTYPE, as_rates, timeframe_seconds
+from bbma_fakemt5 import FakeTerminal, SymbolInfo, Tick
+from bbma_monitor import PositionMonitor
+from bbma_resample import bucket_start, merge_bar, resample_rates
+
+TICK_DTYPE = np.dtype([
+    ('seen', '<f8'),
+    ('time', '<i8'),
+    ('bid', '<f8'),
+    ('ask', '<f8'),
+    ('last', '<f8'),
+    ('volume', '<u8'),
+    ('time_msc', '<i8'),
+    ('flags', '<u4'),
+    ('volume_real', '<f8'),
+])
+FORMING_DTYPE = np.dtype([('seen', '<f8')] + [(name, RATE_DTYPE.fields[name][0]) for name in RATE_DTYPE.names])
+# start_pos is -1 for copy_rates_from/copy_rates_range; `last` marks the newest bar of a result
+NATIVE_DTYPE = np.dtype([('seen', '<f8'), ('timeframe', '<i8'), ('start_pos', '<i8'), ('last', '?')]
+                        + [(name, RATE_DTYPE.fields[name][0]) for name in RATE_DTYPE.names])
+INFO_FIELDS = ('point', 'digits', 'spread', 'trade_contract_size', 'volume_min', 'volume_max', 'volume_step',
+               'filling_mode', 'trade_stops_level')
+MARKER = '.replay'  # Marks a working directory this module created (and may clear)
+SIGNAL_LINES = ('Signals:', 'Final Decision:', 'Suggested Take Profit Points:')  # Checked against the recorded output
+
+
+def _read(path, dtype):
+    # Whole records only, in case the recorder was killed mid-write
+    if not os.path.exists(path):
+        return np.empty(0, dtype=dtype)
+    with open(path, 'rb') as f:
+        raw = f.read()
+    return np.frombuffer(raw[:len(raw) // dtype.itemsize * dtype.itemsize], dtype=dtype).copy()
+
+
+def _bars(records):
+    # RATE_DTYPE copy of records that carry the rate fields among others
+    bars = np.zeros(len(records), dtype=RATE_DTYPE)
+    for name in RATE_DTYPE.names:
+        bars[name] = records[name]
+    return bars
+
+
+# --- Recording Proxy for the MetaTrader5 Module ---
+class Recorder:
+    def __init__(self, backend, path, clock=time.time):
+        self.backend = backend
+        self.path = path
+        self.clock = clock
+        self.files = {}
+        self.last_closed = {}  # Time of the newest closed M1 bar written per symbol
+        self.meta = {'script': None, 'symbols': [], 'symbol_info': {}, 'started': clock(), 'stopped': None}
+        os.makedirs(path, exist_ok=True)
+        self.save_meta()
+
+    def __getattr__(self, name):
+        # Everything not recorded (constants, trading calls) goes straight to the terminal
+        return getattr(self.__dict__['backend'], name)
+
+    def save_meta(self):
+        tmp = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f, indent=1)
+        os.replace(tmp, os.path.join(self.path, 'meta.json'))
+
+    def _append(self, symbol, kind, records):
+        key = (symbol, kind)
+        if key not in self.files:
+            if symbol not in self.meta['symbols']:
+                self.meta['symbols'].append(symbol)
+                self.save_meta()
+            self.files[key] = open(os.path.join(self.path, f"{symbol}.{kind}"), 'ab')
+        self.files[key].write(records.tobytes())
+        self.files[key].flush()
+
+    def _native(self, symbol, timeframe, start_pos, rates):
+        if rates is None or not len(rates):
+            return
+        bars = as_rates(rates)
+        records = np.zeros(len(bars), dtype=NATIVE_DTYPE)
+        records['seen'] = self.clock()
+        records['timeframe'] = timeframe
+        records['start_pos'] = start_pos
+        records['last'][-1] = True
+        for name in RATE_DTYPE.names:
+            records[name] = bars[name]
+        self._append(symbol, 'native', records)
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        rates = self.backend.copy_rates_from_pos(symbol, timeframe, start_pos, count)
+        if timeframe != self.backend.TIMEFRAME_M1 or start_pos != 0:
+            self._native(symbol, timeframe, start_pos, rates)
+        elif rates is not None and len(rates):
+            seen = self.clock()
+            bars = as_rates(rates)
+            closed = bars[:-1][bars['time'][:-1] > self.last_closed.get(symbol, -1)]
+            if len(closed):
+                self._append(symbol, 'bars', closed)
+                self.last_closed[symbol] = int(closed['time'][-1])
+            forming = np.zeros(1, dtype=FORMING_DTYPE)
+            forming['seen'] = seen
+            for name in RATE_DTYPE.names:
+                forming[name] = bars[name][-1]
+            self._append(symbol, 'forming', forming)
+        return rates
+
+    def copy_rates_from(self, symbol, timeframe, date_from, count):
+        rates = self.backend.copy_rates_from(symbol, timeframe, date_from, count)
+        self._native(symbol, timeframe, -1, rates)
+        return rates
+
+    def copy_rates_range(self, symbol, timeframe, date_from, date_to):
+        rates = self.backend.copy_rates_range(symbol, timeframe, date_from, date_to)
+        self._native(symbol, timeframe, -1, rates)
+        return rates
+
+    def symbol_info_tick(self, symbol):
+        tick = self.backend.symbol_info_tick(symbol)
+        if tick:
+            record = np.zeros(1, dtype=TICK_DTYPE)
+            record['seen'] = self.clock()
+            for name in TICK_DTYPE.names[1:]:
+                record[name] = getattr(tick, name)
+            self._append(symbol, 'ticks', record)
+        return tick
+
+    def symbol_info(self, symbol):
+        info = self.backend.symbol_info(symbol)
+        if info:
+            fields = {name: getattr(info, name, None) for name in INFO_FIELDS}
+            if self.meta['symbol_info'].get(symbol) != fields:
+                self.meta['symbol_info'][symbol] = fields
+                self.save_meta()
+        return info
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+        self.meta['stopped'] = self.clock()
+        self.save_meta()
+
+
+class Recording:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.symbols = self.meta['symbols']
+        self.bars = {symbol: _read(os.path.join(path, f"{symbol}.bars"), RATE_DTYPE) for symbol in self.symbols}
+        self.forming = {symbol: _read(os.path.join(path, f"{symbol}.forming"), FORMING_DTYPE) for symbol in self.symbols}
+        self.ticks = {symbol: _read(os.path.join(path, f"{symbol}.ticks"), TICK_DTYPE) for symbol in self.symbols}
+        for symbol, forming in self.forming.items():
+            # The bar still forming when the recording stopped never closed; its last snapshot stands in
+            bars = self.bars[symbol]
+            if len(forming) and (not len(bars) or forming['time'][-1] > bars['time'][-1]):
+                self.bars[symbol] = np.concatenate([bars, _bars(forming[-1:])])
+        seen = [records['seen'][-1] for records in list(self.forming.values()) + list(self.ticks.values()) if len(records)]
+        self.start = self.meta['started']
+        self.end = self.meta['stopped'] or max(seen, default=self.start)  # A killed recorder never wrote 'stopped'
+        # Server minus local time: ticks never run ahead of the server clock, so the largest offset
+        # is the best estimate (as in BarCloseScheduler); forming bars bound it from below otherwise
+        ticks = [records['time_msc'] / 1000.0 - records['seen'] for records in self.ticks.values() if len(records)]
+        forming = [records['time'] - records['seen'] for records in self.forming.values() if len(records)]
+        self.offset = float(max(np.max(values) for values in ticks)) if ticks else \
+            float(max(np.max(values) for values in forming)) if forming else 0.0
+        # Native bars per (symbol, timeframe) in the order they were seen, split into bars that had
+        # closed when seen and the forming bars of results that reached the present
+        self.native = {}
+        for symbol in self.symbols:
+            records = _read(os.path.join(path, f"{symbol}.native"), NATIVE_DTYPE)
+            for timeframe in np.unique(records['timeframe']):
+                part = records[records['timeframe'] == timeframe]
+                closes = part['time'] + timeframe_seconds(int(timeframe))
+                forming = (part['last'] & (part['start_pos'] == 0)) | (closes > part['seen'] + self.offset)
+                self.native[(symbol, int(timeframe))] = part[~forming], part[forming]
+            # M1 history fetched some other way extends the recorded bars backwards
+            closed = self.native.get((symbol, bbma_fakemt5.TIMEFRAME_M1), (np.empty(0, dtype=NATIVE_DTYPE),))[0]
+            bars = self.bars[symbol]
+            older = closed[closed['time'] < (bars['time'][0] if len(bars) else np.inf)]
+            if len(older):
+                _, index = np.unique(older['time'][::-1], return_index=True)
+                self.bars[symbol] = np.concatenate([_bars(older[::-1][index]), bars])
+
+    def symbol_info(self, symbol):
+        return self.meta['symbol_info'].get(symbol) or {}
+
+    def native_bars(self, symbol, timeframe, before):
+        # Native bars seen before local time `before`: the latest closed version of each bar (by time),
+        # and the newest forming bar (or None)
+        closed, forming = self.native.get((symbol, timeframe), (np.empty(0, dtype=NATIVE_DTYPE),) * 2)
+        closed = closed[:np.searchsorted(closed['seen'], before, side='right')]
+        forming = forming[:np.searchsorted(forming['seen'], before, side='right')]
+        _, index = np.unique(closed['time'][::-1], return_index=True)
+        return closed[::-1][index], forming[-1] if len(forming) else None
+
+    def output_lines(self):
+        path = os.path.join(self.path, 'output.log')
+        return signal_lines(path) if os.path.exists(path) else None
+
+    def calendar_path(self):
+        path = os.path.join(self.path, 'calendar_cache.json')
+        return path if os.path.exists(path) else None
+
+
+# --- Virtual Clock ---
+class ReplayFinished(BaseException):
+    # A BaseException, like KeyboardInterrupt, so the scripts' `except Exception` handlers let it through
+    pass
+
+
+class VirtualClock:
+    def __init__(self, start, end=None):
+        self.now = float(start)
+        self.end = end
+        self.owner = threading.current_thread()  # Only this thread's sleeps move the clock
+        self.timers = []  # Heap of [due, sequence, interval, callback]
+        self.sequence = 0
+        self.real_sleep = time.sleep
+        self.sleeps = 0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if threading.current_thread() is not self.owner:
+            self.real_sleep(seconds)
+            return
+        self.sleeps += 1
+        target = self.now + max(seconds, 0.0)
+        while self.timers and self.timers[0][0] <= target:
+            timer = heapq.heappop(self.timers)
+            self._move(timer[0])
+            timer[0] += timer[2]
+            heapq.heappush(self.timers, timer)
+            timer[3]()
+        self._move(target)
+
+    def _move(self, t):
+        if self.end is not None and t > self.end:
+            self.now = self.end
+            raise ReplayFinished()
+        self.now = max(self.now, t)
+
+    def every(self, interval, callback):
+        # Calls callback() now and every `interval` seconds after, from within sleep(); returns a handle for cancel()
+        self.sequence += 1
+        timer = [self.now, self.sequence, interval, callback]
+        heapq.heappush(self.timers, timer)
+        return timer
+
+    def cancel(self, timer):
+        if timer in self.timers:
+            self.timers.remove(timer)
+            heapq.heapify(self.timers)
+
+
+# --- Terminal Serving a Recording ---
+class ReplayTerminal(FakeTerminal):
+    def __init__(self, recording, clock, skew=1.0, **options):
+        info = recording.symbol_info(recording.symbols[0]) if recording.symbols else {}
+        defaults = {'point': info.get('point'), 'digits': info.get('digits'), 'spread': info.get('spread'),
+                    'contract_size': info.get('trade_contract_size'), 'filling_mode': info.get('filling_mode')}
+        options = dict({key: value for key, value in defaults.items() if value is not None}, **options)
+        super().__init__(symbols=recording.symbols, rates=recording.bars, realtime=True,
+                         clock=clock.time, sleep=clock.sleep, **options)
+        self.recording = recording
+        self.skew = skew
+
+    def server_time(self):
+        return self.clock() + self.recording.offset
+
+    def visible(self, symbol):
+        # Bars that had opened by now on the server clock (weekend gaps need no special case)
+        return max(int(np.searchsorted(self._m1(symbol)['time'], self.server_time(), side='right')), 1)
+
+    def _latest(self, records):
+        # Index of the newest record seen by now (allowing for the untimed compute), or -1
+        return int(np.searchsorted(records['seen'], self.clock() + self.skew, side='right')) - 1
+
+    def _visible_m1(self, symbol):
+        m1 = super()._visible_m1(symbol)
+        last = m1[-1]
+        if int(last['time']) + 60 <= self.server_time():
+            return m1
+        # The recorded bar holds the whole minute; serve it as the terminal showed it at the time
+        m1 = m1.copy()
+        forming = self.recording.forming.get(symbol, np.empty(0, dtype=FORMING_DTYPE))
+        i = self._latest(forming)
+        if i >= 0 and forming['time'][i] == last['time']:
+            for name in RATE_DTYPE.names:
+                m1[name][-1] = forming[name][i]
+        else:
+            for name in ('high', 'low', 'close'):
+                m1[name][-1] = last['open']
+            m1['tick_volume'][-1] = 0
+        return m1
+
+    def _rates(self, symbol, timeframe, last_count=None):
+        # Native bars recorded by now, continued with bars resampled from the recorded M1 bars from the
+        # first bucket those cover completely; the bucket they start in comes from its recorded native bar
+        m1 = self._visible_m1(symbol)
+        if timeframe == bbma_fakemt5.TIMEFRAME_M1 or not len(m1):
+            return m1
+        seconds = timeframe_seconds(timeframe)
+        derived = resample_rates(m1, timeframe)
+        closed, forming = self.recording.native_bars(symbol, timeframe, self.clock() + self.skew)
+        first = int(m1['time'][0])
+        start = bucket_start(first, seconds)
+        covered = start if start == first else start + seconds
+        parts = [_bars(closed[closed['time'] < covered])]
+        if covered != start and not (len(closed) and start in closed['time']):
+            if forming is not None and forming['time'] == start:
+                parts.append(self._continue(symbol, forming, m1[m1['time'] < covered]))
+            else:
+                covered = start  # No native bar for it: the partial bucket is the best there is
+        parts.append(derived[derived['time'] >= covered])
+        return np.concatenate(parts)
+
+    def _continue(self, symbol, native, m1):
+        # A native bar recorded while forming, merged with the M1 bars from the one forming when it was seen
+        # (whose volume then was already in the native bar)
+        bar = _bars(np.array([native], dtype=NATIVE_DTYPE))[0]
+        minute = int((native['seen'] + self.recording.offset) // 60 * 60)
+        forming = self.recording.forming.get(symbol, np.empty(0, dtype=FORMING_DTYPE))
+        i = int(np.searchsorted(forming['seen'], native['seen'] + self.skew, side='right')) - 1
+        if i >= 0 and forming['time'][i] == minute:
+            bar['tick_volume'] = max(int(bar['tick_volume']) - int(forming['tick_volume'][i]), 0)
+            bar['real_volume'] = max(int(bar['real_volume']) - int(forming['real_volume'][i]), 0)
+        for m in m1[m1['time'] >= minute]:
+            bar = merge_bar(bar, m)
+        return np.array([bar], dtype=RATE_DTYPE)
+
+    def _tick(self, symbol):
+        ticks = self.recording.ticks.get(symbol)
+        if ticks is None or not len(ticks):
+            return None
+        i = self._latest(ticks)
+        return ticks[i] if i >= 0 else None
+
+    def _quote(self, symbol):
+        tick = self._tick(symbol)
+        if tick is None:
+            return super()._quote(symbol)
+        return self._visible_m1(symbol)[-1], round(float(tick['bid']), self.digits), round(float(tick['ask']), self.digits)
+
+    def symbol_info_tick(self, symbol):
+        self._call('symbol_info_tick')
+        self._settle()
+        server_msc = int(self.server_time() * 1000)
+        tick = self._tick(symbol)
+        if tick is None:
+            _, bid, ask = self._quote(symbol)
+            return Tick(server_msc // 1000, bid, ask, 0.0, 0, server_msc, 6, 0.0)
+        msc = min(int(tick['time_msc']), server_msc)  # A tick seen within `skew` may not be from the future
+        return Tick(msc // 1000, float(tick['bid']), float(tick['ask']), float(tick['last']), int(tick['volume']),
+                    msc, int(tick['flags']), float(tick['volume_real']))
+
+    def symbol_info(self, symbol):
+        self._call('symbol_info')
+        _, bid, ask = self._quote(symbol)
+        info = self.recording.symbol_info(symbol)
+        return SymbolInfo(symbol, True, info.get('point', self.point), info.get('digits', self.digits),
+                          info.get('spread', self.spread), info.get('trade_contract_size', self.contract_size),
+                          info.get('volume_min', 0.01), info.get('volume_max', 100.0), info.get('volume_step', 0.01),
+                          info.get('filling_mode', self.filling_mode), info.get('trade_stops_level', 0), bid, ask)
+
+
+# --- Running a Script ---
+def run_script(script, args=()):
+    saved = sys.argv
+    sys.argv = [script] + list(args)
+    try:
+        runpy.run_path(script, run_name='__main__')
+    finally:
+        sys.argv = saved
+
+
+@contextlib.contextmanager
+def virtual_time(clock):
+    # time.time/time.sleep from the clock, and position monitors polled by its timers instead of a thread
+    saved = time.time, time.sleep, PositionMonitor.start, PositionMonitor.stop
+
+    def start(monitor):
+        monitor.timer = clock.every(monitor.interval, monitor.run_once)
+
+    def stop(monitor, timeout=None):
+        clock.cancel(getattr(monitor, 'timer', None))
+
+    time.time, time.sleep = clock.time, clock.sleep
+    PositionMonitor.start, PositionMonitor.stop = start, stop
+    try:
+        yield clock
+    finally:
+        time.time, time.sleep, PositionMonitor.start, PositionMonitor.stop = saved
+
+
+@contextlib.contextmanager
+def answering(text):
+    # input() returns `text`, echoing the prompt as a terminal would
+    saved = builtins.input
+
+    def answer(prompt=''):
+        print(f"{prompt}{text}")
+        return text
+
+    builtins.input = answer
+    try:
+        yield
+    finally:
+        builtins.input = saved
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    saved = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(saved)
+
+
+def prepare_workdir(path, data=None, calendar=None, calendar_time=None):
+    # A fresh working directory per replay, so runs do not see each other's trade logs and models
+    if os.path.exists(path):
+        if not os.path.exists(os.path.join(path, MARKER)):
+            raise FileExistsError(f"{path} exists and was not created by a replay; choose another --workdir")
+        shutil.rmtree(path)
+    if data:
+        shutil.copytree(data, os.path.join(path, 'data'))
+    os.makedirs(os.path.join(path, 'data'), exist_ok=True)
+    open(os.path.join(path, MARKER), 'w').close()
+    events = []
+    if calendar:
+        with open(calendar) as f:
+            events = json.load(f)['events']
+    # Fetched at the end of the recording, so the calendar is never refreshed during the replay
+    with open(os.path.join(path, 'data', 'calendar_cache.json'), 'w') as f:
+        json.dump({'fetched_at': calendar_time, 'events': events}, f)
+
+
+def signal_lines(path):
+    # The script's signal report lines, without colours and countdown redraws
+    lines = []
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = re.sub(r'\x1b\[[0-9;]*m', '', line).split('\r')[-1].strip()
+            if line.startswith(SIGNAL_LINES):
+                lines.append(line)
+    return lines
+
+
+def compare_signals(recorded, replayed):
+    # Lines are compared in order over the part both runs reached
+    if recorded is None:
+        return {'signals_checked': 0, 'signals_matched': None, 'first_mismatch': None}
+    checked = min(len(recorded), len(replayed))
+    mismatches = [i for i in range(checked) if recorded[i] != replayed[i]]
+    return {
+        'signals_checked': checked,
+        'signals_matched': checked - len(mismatches),
+        'first_mismatch': {'line': mismatches[0], 'recorded': recorded[mismatches[0]], 'replayed': replayed[mismatches[0]]}
+                          if mismatches else None,
+    }
+
+
+class Tee:
+    # A stdout that also writes to a file
+    def __init__(self, *streams):
+        self.streams = streams
+
+    def write(self, text):
+        for stream in self.streams:
+            stream.write(text)
+        return len(text)
+
+    def flush(self):
+        for stream in self.streams:
+            stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.streams[0], name)
+
+
+def deals_digest(deals):
+    # Equal digests mean two replays traded identically
+    return hashlib.sha1(repr([tuple(deal) for deal in deals]).encode()).hexdigest()[:12]
+
+
+def replay(recording, script, args=(), workdir=None, data=None, symbol=None, skew=1.0, verbose=False):
+    # Runs `script` against the recording; returns a summary dict (also saved as summary.json in the workdir)
+    script = os.path.abspath(script)
+    workdir = os.path.abspath(workdir or os.path.join('data', 'replay', os.path.basename(os.path.normpath(recording.path))))
+    symbol = symbol or (recording.symbols[0] if recording.symbols else '')
+    prepare_workdir(workdir, data, recording.calendar_path(), recording.end)
+
+    clock = VirtualClock(recording.start, recording.end)
+    terminal = ReplayTerminal(recording, clock, skew=skew)
+    saved_terminal, saved_module = bbma_fakemt5.terminal, sys.modules.get('MetaTrader5')
+    bbma_fakemt5.terminal = terminal
+    sys.modules['MetaTrader5'] = bbma_fakemt5
+    log = open(os.path.join(workdir, 'output.log'), 'w', encoding='utf-8')
+    output = Tee(sys.stdout, log) if verbose else log
+    finished = False
+    started = time.perf_counter()
+    try:
+        with working_directory(workdir), virtual_time(clock), answering(symbol), contextlib.redirect_stdout(output):
+            try:
+                run_script(script, args)
+            except ReplayFinished:
+                finished = True
+    finally:
+        elapsed = time.perf_counter() - started
+        bbma_fakemt5.terminal = saved_terminal
+        if saved_module is None:
+            sys.modules.pop('MetaTrader5', None)
+        else:
+            sys.modules['MetaTrader5'] = saved_module
+        log.close()
+
+    replayed = clock.now - recording.start
+    summary = {
+        'recording': recording.path,
+        'script': os.path.basename(script),
+        'symbol': symbol,
+        'finished': finished,
+        'replayed_seconds': round(replayed, 3),
+        'real_seconds': round(elapsed, 3),
+        'speedup': round(replayed / elapsed, 1) if elapsed else None,
+        'sleeps': clock.sleeps,
+        'calls': dict(sorted(terminal.calls.items())),
+        'orders': terminal.calls.get('order_send', 0),
+        'deals': len(terminal.deals),
+        'balance': round(terminal.balance, 2),
+        'deals_digest': deals_digest(terminal.deals),
+    }
+    summary.update(compare_signals(recording.output_lines(), signal_lines(os.path.join(workdir, 'output.log'))))
+    with open(os.path.join(workdir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=1)
+    return summary
+
+
+def record(script, args=(), out=None, backend=None):
+    # Runs `script` live with the terminal behind a Recorder until it exits or is interrupted; returns the recording path
+    if backend is None:
+        import MetaTrader5 as backend
+    out = out or os.path.join('data', 'recordings', datetime.now().strftime('%Y%m%d_%H%M%S'))
+    recorder = Recorder(backend, out)
+    recorder.meta['script'] = os.path.basename(script)
+    recorder.meta['args'] = list(args)
+    recorder.save_meta()
+    saved_module = sys.modules.get('MetaTrader5')
+    sys.modules['MetaTrader5'] = recorder
+    log = open(os.path.join(out, 'output.log'), 'w', encoding='utf-8')
+    try:
+        with contextlib.redirect_stdout(Tee(sys.stdout, log)):
+            run_script(os.path.abspath(script), args)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.close()
+        recorder.close()
+        if saved_module is None:
+            sys.modules.pop('MetaTrader5', None)
+        else:
+            sys.modules['MetaTrader5'] = saved_module
+        if os.path.exists('data/calendar_cache.json'):
+            shutil.copy('data/calendar_cache.json', os.path.join(out, 'calendar_cache.json'))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record the live market data stream, or replay it on a virtual clock.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    rec = commands.add_parser('record', help="Run a live script and record what it sees")
+    rec.add_argument('script')
+    rec.add_argument('--out', help="Recording directory (default data/recordings/<time>)")
+    play = commands.add_parser('play', help="Replay a recording through a script on a virtual clock")
+    play.add_argument('recording')
+    play.add_argument('script')
+    play.add_argument('--workdir', help="Working directory of the replayed script (default data/replay/<recording>)")
+    play.add_argument('--data', help="Directory copied to <workdir>/data first (e.g. a production model and trade log)")
+    play.add_argument('--symbol', help="Answer to the script's symbol prompt (default: the first recorded symbol)")
+    play.add_argument('--skew', type=float, default=1.0, help="Seconds of untimed compute allowed for when serving recorded data")
+    play.add_argument('--verbose', action='store_true', help="Also print the script's output (it always goes to <workdir>/output.log)")
+    args, script_args = parser.parse_known_args()
+
+    if args.command == 'record':
+        path = record(args.script, script_args, args.out)
+        recording = Recording(path)
+        print(f"\nRecorded {recording.end - recording.start:.0f}s of {', '.join(recording.symbols) or 'no symbols'} to {path}")
+        return
+    recording = Recording(args.recording)
+    summary = replay(recording, args.script, script_args, args.workdir, args.data, args.symbol, args.skew, args.verbose)
+    print(f"Replayed {summary['replayed_seconds'] / 3600:.2f}h of {summary['symbol']} through {summary['script']} "
+          f"in {summary['real_seconds']:.2f}s ({summary['speedup']}x)"
+          + ("" if summary['finished'] else ", stopped early by the script"))
+    print(f"Orders: {summary['orders']}, deals: {summary['deals']}, balance: {summary['balance']:.2f}, "
+          f"deals digest: {summary['deals_digest']}")
+    print(f"Terminal calls: {summary['calls']}")
+    if summary['signals_checked']:
+        print(f"Signal lines matching the recorded run: {summary['signals_matched']}/{summary['signals_checked']}")
+        if summary['first_mismatch']:
+            print(f"First mismatch: {summary['first_mismatch']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Derive higher-timeframe bars locally from a single M1 stream.
+
+Each higher timeframe is backfilled once from the terminal. From then on
+only the M1 series is fetched and every other timeframe is rebuilt from it
+incrementally, so all timeframes describe the same instant. Bars live in
+the shared BarCache under their usual (symbol, timeframe) keys.
+"""
+import numpy as np
+
+from bbma_cache import RATE_DTYPE, timeframe_seconds
+
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+
+
+def bucket_start(t, seconds, session_offset=0):
+    # Start of the bar containing server time `t`; MT5 bar times are server time,
+    # so H4/D1 buckets line up with the broker's midnight unless an offset is given
+    return (t - session_offset) // seconds * seconds + session_offset
+
+
+def merge_bar(partial, bar):
+    # Combine a bar aggregated so far with the next (later) bar in the same bucket
+    merged = partial.copy()
+    merged['high'] = max(partial['high'], bar['high'])
+    merged['low'] = min(partial['low'], bar['low'])
+    merged['close'] = bar['close']
+    merged['tick_volume'] = partial['tick_volume'] + bar['tick_volume']
+    merged['real_volume'] = partial['real_volume'] + bar['real_volume']
+    merged['spread'] = min(partial['spread'], bar['spread'])
+    return merged
+
+
+# --- Incremental Resampler for One Symbol ---
+class Resampler:
+    def __init__(self, cache, symbol, timeframes, base_timeframe, session_offset=0):
+        self.cache = cache
+        self.symbol = symbol
+        self.timeframes = timeframes  # {name: mt5 timeframe}, may include the base timeframe
+        self.base_timeframe = base_timeframe
+        self.session_offset = session_offset  # Only applied to buckets of a day or longer
+        self.derived = {name: tf for name, tf in timeframes.items() if tf != base_timeframe}
+        self.partials = {}  # name -> bar aggregated over closed base bars of the current bucket
+        self.last_closed_time = None
+        self.seeded = False
+
+    def _bucket(self, t, timeframe):
+        seconds = timeframe_seconds(timeframe)
+        offset = self.session_offset if seconds >= 86400 else 0
+        return bucket_start(int(t), seconds, offset)
+
+    def _seed(self, base):
+        # One native fetch per derived timeframe; the forming native bar becomes the
+        # starting partial with the forming M1 bar's volume taken back out
+        forming = base[-1]
+        for name, timeframe in self.derived.items():
+            self.cache.update(self.symbol, timeframe)
+            native = self.cache.bars(self.symbol, timeframe)
+            if len(native) == 0 or native['time'][-1] != self._bucket(forming['time'], timeframe):
+                self.partials[name] = None
+                continue
+            partial = native[-1].copy()
+            partial['tick_volume'] = max(int(partial['tick_volume']) - int(forming['tick_volume']), 0)
+            partial['real_volume'] = max(int(partial['real_volume']) - int(forming['real_volume']), 0)
+            self.partials[name] = partial
+        self.last_closed_time = int(base['time'][-2]) if len(base) > 1 else -1
+        self.seeded = True
+
+    def _advance(self, name, timeframe, closed, forming):
+        rows = []
+        partial = self.partials.get(name)
+        for bar in closed:
+            bucket = self._bucket(bar['time'], timeframe)
+            if partial is not None and partial['time'] == bucket:
+                partial = merge_bar(partial, bar)
+                continue
+            if partial is not None:
+                rows.append(partial)
+            partial = bar.copy()
+            partial['time'] = bucket
+
+        bucket = self._bucket(forming['time'], timeframe)
+        if partial is not None and partial['time'] == bucket:
+            rows.append(merge_bar(partial, forming))
+        else:
+            if partial is not None:
+                rows.append(partial)
+            partial = None
+            bar = forming.copy()
+            bar['time'] = bucket
+            rows.append(bar)
+        self.partials[name] = partial
+        self.cache.store(self.symbol, timeframe, np.array(rows, dtype=RATE_DTYPE))
+
+    def update(self):
+        # One terminal round trip (after seeding); returns {name: cached bars}
+        self.cache.update(self.symbol, self.base_timeframe)
+        base = self.cache.bars(self.symbol, self.base_timeframe)
+        if len(base) == 0:
+            return {name: self.cache.bars(self.symbol, tf) for name, tf in self.timeframes.items()}
+        if not self.seeded:
+            self._seed(base)
+        else:
+            start = len(base) - 1
+            while start > 0 and base['time'][start - 1] > self.last_closed_time:
+                start -= 1
+            closed = base[start:-1]
+            for name, timeframe in self.derived.items():
+                self._advance(name, timeframe, closed, base[-1])
+            if len(closed):
+                self.last_closed_time = int(closed['time'][-1])
+        return {name: self.cache.bars(self.symbol, tf) for name, tf in self.timeframes.items()}
+
+    def verify(self, name, count=50, tolerance=1e-9):
+        # Compare derived closed bars against terminal-native ones; returns the mismatches
+        timeframe = self.timeframes[name]
+        native = self.cache.mt5.copy_rates_from_pos(self.symbol, timeframe, 1, count)
+        derived = self.cache.bars(self.symbol, timeframe)[:-1]
+        if native is None or len(native) == 0 or len(derived) == 0:
+            return []
+        common, native_idx, derived_idx = np.intersect1d(native['time'], derived['time'], return_indices=True)
+        mismatches = []
+        for t, i, j in zip(common, native_idx, derived_idx):
+            for field in PRICE_FIELDS:
+                a, b = float(derived[field][j]), float(native[field][i])
+                if abs(a - b) > tolerance:
+                    mismatches.append((int(t), field, a, b))
+        return mismatches
+
+    def verify_all(self, count=50, tolerance=1e-9):
+        # Drift check for every derived timeframe; only timeframes with mismatches are returned
+        report = {}
+        for name in self.derived:
+            mismatches = self.verify(name, count, tolerance)
+            if mismatches:
+                report[name] = mismatches
+        return report
+
+
+# --- Vectorized Resampling of a Whole History ---
+def resample_rates(rates, timeframe, session_offset=0):
+    # Same bucketing and merge rules as Resampler, applied to a complete base-timeframe array
+    seconds = timeframe_seconds(timeframe)
+    offset = session_offset if seconds >= 86400 else 0
+    if len(rates) == 0:
+        return np.empty(0, dtype=RATE_DTYPE)
+    buckets = bucket_start(rates['time'].astype(np.int64), seconds, offset)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(rates)] - 1
+    out = np.zeros(len(starts), dtype=RATE_DTYPE)
+    out['time'] = buckets[starts]
+    out['open'] = rates['open'][starts]
+    out['high'] = np.maximum.reduceat(rates['high'], starts)
+    out['low'] = np.minimum.reduceat(rates['low'], starts)
+    out['close'] = rates['close'][ends]
+    out['tick_volume'] = np.add.reduceat(rates['tick_volume'], starts)
+    out['real_volume'] = np.add.reduceat(rates['real_volume'], starts)
+    out['spread'] = np.minimum.reduceat(rates['spread'], starts)
+    return out
+
+
+def closed_bar_index(higher_times, higher_seconds, base_times, base_seconds):
+    # As-of alignment without lookahead: for each base bar, the index of the latest higher
+    # bar that had already closed when the base bar closed (-1 if none)
+    return np.searchsorted(np.asarray(higher_times) + higher_seconds, np.asarray(base_times) + base_seconds, side='right') - 1
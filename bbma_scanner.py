@@ -0,0 +1,112 @@
+"""Multi-symbol BBMA scanner.
+
+Watches a list of symbols (or the terminal's Market Watch) from a single
+process. Bars come through the shared BarCache, with one M1 round trip
+per symbol per cycle. Each timeframe's closes are stacked into a
+(symbols x bars) array, so the BBMA rules and the all-timeframes-agree
+consensus are evaluated for every symbol in one vectorized pass. A ranked
+BUY/SELL/HOLD table is printed each cycle.
+
+Usage: python bbma_scanner.py [SYMBOL ...] [--workers N] [--interval SECONDS]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bbma_cache import BarCache
+from bbma_core import TAKE_PROFIT_TIMEFRAMES, MT5Connection
+from bbma_resample import Resampler
+from bbma_vector import BUY, SELL, HOLD, SIGNAL_NAMES, bbma_signals, consensus, stack_tails
+
+DECISIONS = {BUY: 'BUY', SELL: 'SELL', HOLD: 'HOLD'}
+
+
+def market_watch_symbols(mt5):
+    return [info.name for info in (mt5.symbols_get() or []) if info.visible]
+
+
+# --- Scanner ---
+class Scanner:
+    def __init__(self, mt5, symbols, timeframes, base_timeframe, capacity=1000, lookback=64, workers=0):
+        self.symbols = list(symbols)
+        self.timeframes = timeframes
+        self.lookback = lookback  # Bars per symbol stacked for evaluation; BB(20) only needs 21
+        self.cache = BarCache(mt5, capacity=capacity)
+        self.resamplers = {symbol: Resampler(self.cache, symbol, timeframes, base_timeframe) for symbol in self.symbols}
+        self.pool = ThreadPoolExecutor(max_workers=workers) if workers else None
+
+    def fetch(self):
+        # Terminal calls are I/O bound, so a thread pool overlaps them when workers > 0
+        if self.pool:
+            list(self.pool.map(Resampler.update, self.resamplers.values()))
+        else:
+            for resampler in self.resamplers.values():
+                resampler.update()
+
+    def evaluate(self):
+        codes = []
+        take_profits = {}
+        for tf_name, tf_value in self.timeframes.items():
+            closes = stack_tails([self.cache.bars(symbol, tf_value)['close'] for symbol in self.symbols], self.lookback)
+            result = bbma_signals(closes)
+            codes.append(result['Signal'][:, -1])
+            take_profits[tf_name] = result['Take_Profit'][:, -1]
+        codes = np.array(codes)
+        decisions = consensus(codes)
+        agreement = np.maximum((codes == BUY).sum(axis=0), (codes == SELL).sum(axis=0))
+
+        rows = []
+        for i, symbol in enumerate(self.symbols):
+            row = {
+                'Symbol': symbol,
+                'Decision': DECISIONS[int(decisions[i])],
+                'Agree': int(agreement[i]),
+                'Signals': {tf_name: SIGNAL_NAMES[int(codes[j, i])] for j, tf_name in enumerate(self.timeframes)},
+            }
+            for label, tf_name in TAKE_PROFIT_TIMEFRAMES.items():
+                value = take_profits.get(tf_name, [np.nan] * len(self.symbols))[i]
+                row[label] = None if np.isnan(value) else round(float(value), 5)
+            rows.append(row)
+        # Actionable decisions first, then by how many timeframes agree
+        rows.sort(key=lambda row: (row['Decision'] == 'HOLD', -row['Agree'], row['Symbol']))
+        return rows
+
+    def scan(self):
+        self.fetch()
+        return self.evaluate()
+
+
+def format_table(rows, timeframe_count):
+    lines = [f"{'Symbol':<12}{'Decision':<10}{'Agree':<8}" + ''.join(f"{label:<14}" for label in TAKE_PROFIT_TIMEFRAMES)]
+    for row in rows:
+        tps = ''.join(f"{'-' if row[label] is None else row[label]!s:<14}" for label in TAKE_PROFIT_TIMEFRAMES)
+        lines.append(f"{row['Symbol']:<12}{row['Decision']:<10}{str(row['Agree']) + '/' + str(timeframe_count):<8}{tps}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan many symbols for BBMA multi-timeframe consensus.")
+    parser.add_argument('symbols', nargs='*', help="Symbols to scan (default: the terminal's Market Watch)")
+    parser.add_argument('--workers', type=int, default=0, help="Threads for per-symbol fetch and resampling (0 = sequential); terminal calls themselves run one at a time")
+    parser.add_argument('--interval', type=float, default=60, help="Seconds between scans")
+    args = parser.parse_args()
+
+    with MT5Connection() as mt5:
+        symbols = [symbol.upper() for symbol in args.symbols] or market_watch_symbols(mt5)
+        timeframes = mt5.timeframes()
+        scanner = Scanner(mt5, symbols, timeframes, mt5.TIMEFRAME_M1, workers=args.workers)
+
+        while True:
+            started = time.perf_counter()
+            rows = scanner.scan()
+            elapsed = time.perf_counter() - started
+            print("\n========================================")
+            print(f"Scanned {len(symbols)} symbols in {elapsed:.2f}s")
+            print(format_table(rows, len(timeframes)))
+            time.sleep(max(args.interval - elapsed, 0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Bar-close-aligned scheduling for the live loops.
+
+Replaces fixed `time.sleep(60)` waits. In 'bar_close' mode the loop wakes
+just after the next bar boundary of any watched timeframe, computed on the
+trade server's clock. The server clock offset is estimated from
+symbol_info_tick. In 'tick' mode symbol_info_tick is polled with
+exponential backoff until a new tick arrives. Each wake reports which
+timeframes closed a bar; the set is also kept until SignalEngine.analyze
+takes it, so callers need not pass it along. Signal latency is measured against the latest
+base-timeframe bar close.
+"""
+import time
+from collections import deque
+
+from bbma_cache import timeframe_seconds
+
+
+class BarCloseScheduler:
+    def __init__(self, mt5, symbol, timeframes, mode='bar_close', grace=0.25,
+                 poll_min=0.05, poll_max=2.0, clock=None, sleep=None):
+        self.mt5 = mt5
+        self.symbol = symbol
+        self.seconds = {name: timeframe_seconds(tf) for name, tf in timeframes.items()}
+        self.base_seconds = min(self.seconds.values())
+        self.mode = mode
+        self.grace = grace  # Seconds after the boundary so the terminal has the new bar
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+        # Looked up when the scheduler is built, so a clock patched in by bbma_replay is picked up
+        self.clock = clock or time.time
+        self.sleep = sleep or time.sleep
+        self.offset_samples = deque(maxlen=64)  # (local time, server - local) from recent ticks
+        self.last_bucket = {}
+        self.pending = None  # Timeframes that closed a bar since take_closed(); None until the first wake-up
+        self.last_tick_msc = None
+        self.bar_rows = {}
+        self.latencies = deque(maxlen=1000)
+
+    # --- Server Clock ---
+    def sync_clock(self, tick=None):
+        # A tick's time never runs ahead of the server clock, so the largest recent
+        # offset is the best estimate; old samples expire so DST changes are picked up
+        tick = tick or self.mt5.symbol_info_tick(self.symbol)
+        now = self.clock()
+        if tick:
+            self.offset_samples.append((now, tick.time_msc / 1000.0 - now))
+        while self.offset_samples and now - self.offset_samples[0][0] > 600:
+            self.offset_samples.popleft()
+        return tick
+
+    def offset(self):
+        return max(offset for _, offset in self.offset_samples) if self.offset_samples else 0.0
+
+    def server_time(self):
+        return self.clock() + self.offset()
+
+    def next_close(self, server_now=None):
+        server_now = self.server_time() if server_now is None else server_now
+        return min((server_now // seconds + 1) * seconds for seconds in self.seconds.values())
+
+    # --- Waiting ---
+    def closed_timeframes(self):
+        # Timeframes whose bucket moved on since the previous wake
+        server_now = self.server_time()
+        closed = []
+        for name, seconds in self.seconds.items():
+            bucket = server_now // seconds
+            if self.last_bucket.get(name) is not None and bucket != self.last_bucket[name]:
+                closed.append(name)
+            self.last_bucket[name] = bucket
+        if self.pending is not None:
+            self.pending.update(closed)
+        return closed
+
+    def take_closed(self):
+        # Timeframes that closed a bar since the previous call (None before the first wake-up: all of them)
+        closed, self.pending = self.pending, set()
+        return closed
+
+    def time_to_next_close(self):
+        # Seconds to sleep before the next wake-up in 'bar_close' mode (for callers with their own sleep, e.g. asyncio)
+        self.sync_clock()
+        server_now = self.server_time()
+        return max(self.next_close(server_now) + self.grace - server_now, 0.0)
+
+    def wait(self, progress=None):
+        # Blocks until the next wake-up and returns the timeframes that closed a bar.
+        # `progress(remaining_seconds)` is called about once a second while waiting for a bar close.
+        if not self.last_bucket:
+            self.closed_timeframes()
+        if self.mode == 'tick':
+            return self._wait_tick()
+        # Target and remaining time both use the offset from this one sync
+        self.sync_clock()
+        offset = self.offset()
+        target = self.next_close(self.clock() + offset) + self.grace
+        while True:
+            remaining = target - (self.clock() + offset)
+            if remaining <= 0:
+                break
+            if progress:
+                progress(remaining)
+                self.sleep(min(remaining, 1.0))
+            else:
+                self.sleep(remaining)
+        return self.closed_timeframes()
+
+    def _wait_tick(self):
+        delay = self.poll_min
+        while True:
+            tick = self.mt5.symbol_info_tick(self.symbol)
+            if tick and tick.time_msc != self.last_tick_msc:
+                self.last_tick_msc = tick.time_msc
+                self.sync_clock(tick)
+                return self.closed_timeframes()
+            self.sleep(delay)
+            delay = min(delay * 2, self.poll_max)
+
+    # --- Change Detection and Latency ---
+    def changed(self, name, bars):
+        # True when the latest bar of a timeframe differs from the one seen last time
+        if len(bars) == 0:
+            return False
+        row = bars[-1]
+        key = (int(row['time']), float(row['high']), float(row['low']), float(row['close']))
+        if self.bar_rows.get(name) == key:
+            return False
+        self.bar_rows[name] = key
+        return True
+
+    def mark_signal(self):
+        # Seconds between the latest base bar close and now (server clock)
+        server_now = self.server_time()
+        latency = server_now - server_now // self.base_seconds * self.base_seconds
+        self.latencies.append(latency)
+        return latency
+
+    def latency_summary(self):
+        if not self.latencies:
+            return {}
+        ordered = sorted(self.latencies)
+        return {
+            'count': len(ordered),
+            'p50': ordered[len(ordered) // 2],
+            'p99': ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)],
+            'max': ordered[-1],
+        }
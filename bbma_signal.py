@@ -1,155 +1,180 @@
 import pandas as pd
-import numpy as np
-import MetaTrader5 as mt5
-from ta.volatility import BollingerBands, AverageTrueRange
-from ta.trend import SMAIndicator
-import time
-import requests
-from bs4 import BeautifulSoup
 import sys
 import colorama
 from colorama import Fore, Style
-import itertools
-
-colorama.init(autoreset=True)
-
-# --- Connect to MetaTrader 5 ---
-mt5.initialize()
-
-# --- User Input for Currency Pair ---
-symbol = input("Enter currency pair (e.g., EURUSD): ").strip().upper()
-timeframes = {
-    'M1': mt5.TIMEFRAME_M1,
-    'M5': mt5.TIMEFRAME_M5,
-    'M15': mt5.TIMEFRAME_M15,
-    'H1': mt5.TIMEFRAME_H1,
-    'H4': mt5.TIMEFRAME_H4,
-    'D1': mt5.TIMEFRAME_D1
-}
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from bbma_core import MT5Connection, SignalEngine, consensus_decision, take_profit_suggestions
+from bbma_calendar import EconomicCalendar, format_event
+from bbma_store import BarStore
+from bbma_metrics import Metrics
+
 num_candles = 1000  # Fetch 1000 Candles for Live Updates
+verify_interval = 60  # Cycles between drift checks against terminal-native bars (0 disables)
+wake_mode = 'bar_close'  # 'bar_close' wakes right after each M1 close (server time); 'tick' polls for new ticks
+data_hub = None  # Name of a running bbma_hub.py to read bars and ticks from (None polls the terminal directly)
+news_window = 30  # Minutes before/after a high-impact event during which trading is held
+calendar_html = None  # Path to a saved ForexFactory calendar page to run offline
+metrics_port = None  # Serve Prometheus metrics on http://127.0.0.1:<port>/metrics (None disables)
+metrics_interval = 60  # Seconds between snapshots appended to data/metrics_<symbol>.jsonl (0 disables)
+regime_days = 20  # Trading days of bars (per timeframe) behind the Ranging and high-volatility thresholds
+regime_estimator = 'window'  # 'window' is exact over regime_days; 'p2' uses constant memory over all bars seen
 
-# --- Function to Show Progress Bar ---
-def progress_bar(task_name, duration=5, bar_length=30):
-    for i in range(duration + 1):
-        progress = int((i / duration) * bar_length)
-        bar = "█" * progress + "-" * (bar_length - progress)
-        sys.stdout.write(f"\r{Fore.CYAN}{task_name}: [{bar}] {int((i/duration)*100)}%{Style.RESET_ALL} ")
-        sys.stdout.flush()
-        time.sleep(0.5)
-    sys.stdout.write("\r" + " " * (bar_length + len(task_name) + 10) + "\r")  # Clear the line
+# --- Function to Show Countdown While Waiting ---
+def countdown_timer(remaining):
+    sys.stdout.write(f"\r{Fore.YELLOW}Waiting for next analysis in {int(round(remaining))} seconds...{Style.RESET_ALL}   ")
     sys.stdout.flush()
 
-# --- Function to Show Countdown While Waiting ---
-def countdown_timer(duration=60):
-    for remaining in range(duration, 0, -1):
-        sys.stdout.write(f"\r{Fore.YELLOW}Waiting for next analysis in {remaining} seconds...{Style.RESET_ALL}   ")
-        sys.stdout.flush()
-        time.sleep(1)
+# --- Function to Wait for the Next Bar Close ---
+def wait_for_next_bar(engine):
+    closed = engine.scheduler.wait(progress=countdown_timer)
     sys.stdout.write("\r" + " " * 50 + "\r")  # Clear the countdown line properly
     sys.stdout.flush()
+    return closed
 
-# --- Function to Fetch Latest Data ---
-def fetch_data(timeframe):
-    progress_bar(f"Fetching {timeframe} data")
-    data = mt5.copy_rates_from_pos(symbol, timeframe, 0, num_candles)
-    df = pd.DataFrame(data)
-    df['time'] = pd.to_datetime(df['time'], unit='s')
-    df.set_index('time', inplace=True)
-    return df
-
-# --- Function to Fetch High-Impact News ---
-def check_high_impact_news():
-    progress_bar("Checking high-impact news")
-    url = "https://www.forexfactory.com/calendar"
-    headers = {"User-Agent": "Mozilla/5.0"}
-    response = requests.get(url, headers=headers)
-    soup = BeautifulSoup(response.content, "html.parser")
-    
-    news_items = soup.find_all("tr", class_="calendar__row")
-    upcoming_news = []
-    
-    for item in news_items:
-        impact = item.find("td", class_="impact")
-        if impact and "high" in str(impact):  # High impact news
-            time = item.find("td", class_="time").text.strip()
-            currency = item.find("td", class_="currency").text.strip()
-            event = item.find("td", class_="event").text.strip()
-            upcoming_news.append(f"{time} - {currency}: {event}")
-    
-    return upcoming_news
-
-# --- Function to Perform BBMA Analysis ---
-def analyze_bbma(df):
-    bb = BollingerBands(close=df['close'], window=20, window_dev=2)
-    df['BB_Upper'] = bb.bollinger_hband()
-    df['BB_Lower'] = bb.bollinger_lband()
-    df['Mid_BB'] = bb.bollinger_mavg()
-    df['SMA200'] = SMAIndicator(df['close'], window=200).sma_indicator()
-    df['ATR'] = AverageTrueRange(df['high'], df['low'], df['close'], window=14).average_true_range()
-    
-    df['Reentry'] = ((df['close'] < df['BB_Upper']) & (df['close'] > df['Mid_BB'])) | \
-                    ((df['close'] > df['BB_Lower']) & (df['close'] < df['Mid_BB']))
-    df['Momentum'] = ((df['close'] > df['BB_Upper']) & (df['close'].shift(1) < df['BB_Upper'])) | \
-                     ((df['close'] < df['BB_Lower']) & (df['close'].shift(1) > df['BB_Lower']))
-    
-    df['Signal'] = 'Hold'
-    df['Take_Profit'] = np.nan
-    
-    df.loc[df['Reentry'] & (df['Momentum']), 'Signal'] = 'Buy'
-    df.loc[df['Reentry'] & (~df['Momentum']), 'Signal'] = 'Sell'
-    
-    df['Trending'] = df['close'] > df['SMA200']
-    df['Ranging'] = df['BB_Upper'] - df['BB_Lower'] < df['BB_Upper'].median()
-    
-    df['Filtered_Signal'] = df['Signal']
-    df.loc[df['Ranging'], 'Filtered_Signal'] = 'Hold'  # Avoid trading in ranging market
-    df.loc[df['ATR'] > df['ATR'].quantile(0.9), 'Filtered_Signal'] = 'Hold'  # Avoid high volatility
-    
-    return df
+# --- Function to Refresh All Timeframes (Single M1 Fetch; Higher Timeframes Are Derived From It) ---
+def fetch_rates(engine, metrics):
+    with metrics.stage('fetch'):
+        return engine.fetch()
 
-# --- Real-Time Multi-Timeframe Analysis ---
-while True:
-    signals = {}
-    tp_values = {}
-    timestamp = pd.Timestamp.now()
-    
-    news_events = check_high_impact_news()
-    
-    for tf_name, tf_value in timeframes.items():
-        df = fetch_data(tf_value)
-        df = analyze_bbma(df)
-        latest_signal = df[['close', 'Filtered_Signal', 'Take_Profit']].tail(1)
-        signals[tf_name] = latest_signal['Filtered_Signal'].values[0]
-        tp_values[tf_name] = round(latest_signal['Take_Profit'].values[0], 5) if not np.isnan(latest_signal['Take_Profit'].values[0]) else None
-    
-    if news_events:
-        final_decision = 'HOLD (Due to News)'
-    elif all(sig == 'Buy' for sig in signals.values()):
-        final_decision = 'BUY'
-    elif all(sig == 'Sell' for sig in signals.values()):
-        final_decision = 'SELL'
-    else:
-        final_decision = 'HOLD'
-    
-    take_profit_suggestions = {
-        'TP1 (M1)': tp_values.get('M1', None),
-        'TP2 (M15)': tp_values.get('M15', None),
-        'TP3 (H1)': tp_values.get('H1', None)
-    }
-    
+# --- Function to Report Drift Between Derived and Terminal-Native Bars ---
+def check_drift(engine):
+    for tf_name, mismatches in engine.check_drift().items():
+        print(f"{Fore.RED}Warning: {tf_name} bars drifted from terminal data at {len(mismatches)} points, e.g. {mismatches[0]}{Style.RESET_ALL}")
+
+# --- Function to Fetch High-Impact News (Only Events for This Pair's Currencies Within +/- news_window Minutes) ---
+def check_high_impact_news(engine, calendar, metrics):
+    with metrics.stage('news'):
+        return [format_event(event) for event in calendar.events_near(engine.symbol, news_window)]
+
+# --- Function to Analyze All Timeframes for One Cycle ---
+def analyze_cycle(engine, metrics, rates, news_events):
+    with metrics.stage('indicators'):
+        # Timeframes whose bar closed since the last wake-up commit it; the rest re-evaluate their forming bar
+        for tf_name, pushed in engine.analyze(rates).items():
+            metrics.inc('bars_processed', pushed, timeframe=tf_name)
+    signals = engine.signals('Filtered_Signal')
+
+    final_decision = 'HOLD (Due to News)' if news_events else consensus_decision(signals)
+    if final_decision in ('BUY', 'SELL'):
+        metrics.inc('signals_emitted', signal=final_decision)
+    return signals, final_decision, take_profit_suggestions(engine.signals('Take_Profit'))
+
+# --- Function to Print the Cycle Report ---
+def print_report(engine, timestamp, signals, final_decision, take_profit_suggestions, news_events):
     print("\n========================================")
     print(f"Timestamp: {timestamp}")
-    print(f"Currency Pair: {symbol}")
+    print(f"Currency Pair: {engine.symbol}")
     print(f"Signals: {signals}")
     print(f"\nFinal Decision: {final_decision}")
     print(f"Suggested Take Profit Points: {take_profit_suggestions}")
+    print(f"Signal latency: {engine.scheduler.mark_signal():.2f}s after bar close")
     print("")
     if news_events:
         print("⚠️ High-impact news detected, avoid trading ⚠️")
         for news in news_events:
             print(news)
-    
-    countdown_timer(60)  # Countdown while waiting for next signal
 
-# --- Shutdown MT5 Connection (Never Reached in Loop, but Useful for Debugging) ---
-mt5.shutdown()
+# --- Real-Time Multi-Timeframe Analysis ---
+def run_sync(engine, calendar, metrics):
+    cycle = 0
+    while True:
+        timestamp = pd.Timestamp.now()
+        cycle += 1
+
+        news_events = check_high_impact_news(engine, calendar, metrics)
+        rates = fetch_rates(engine, metrics)
+
+        signals, final_decision, take_profit_suggestions = analyze_cycle(engine, metrics, rates, news_events)
+        print_report(engine, timestamp, signals, final_decision, take_profit_suggestions, news_events)
+        if verify_interval and cycle % verify_interval == 0:
+            check_drift(engine)
+
+        wait_for_next_bar(engine)  # Countdown while waiting for next signal
+
+# --- Asyncio Mode: News, Market Data and the Status Line Run Concurrently ---
+async def status_line(status, interval=0.25):
+    # Redraws the status line on its own; the analysis never waits for it
+    while True:
+        if status['text']:
+            sys.stdout.write(f"\r{Fore.YELLOW}{status['text']}{Style.RESET_ALL}   ")
+            sys.stdout.flush()
+        await asyncio.sleep(interval)
+
+def clear_status(status):
+    status['text'] = ''
+    sys.stdout.write("\r" + " " * 70 + "\r")
+    sys.stdout.flush()
+
+async def run_async(engine, calendar, metrics):
+    loop = asyncio.get_running_loop()
+    mt5_executor = ThreadPoolExecutor(max_workers=1)  # Terminal calls stay on one thread, in order
+    scheduler = engine.scheduler
+    status = {'text': ''}
+    ui_task = asyncio.create_task(status_line(status))
+    cycle = 0
+    try:
+        while True:
+            timestamp = pd.Timestamp.now()
+            cycle += 1
+            status['text'] = "Fetching news and market data..."
+
+            # The ForexFactory request and the M1 fetch overlap, so a cycle costs the slower of the two
+            news_task = asyncio.create_task(asyncio.to_thread(check_high_impact_news, engine, calendar, metrics))
+            rates_task = loop.run_in_executor(mt5_executor, fetch_rates, engine, metrics)
+            news_events, rates = await asyncio.gather(news_task, rates_task)
+
+            # The analysis and the drift check (native bars for every timeframe) run on the terminal thread too,
+            # so the status line keeps redrawing
+            signals, final_decision, take_profit_suggestions = await loop.run_in_executor(
+                mt5_executor, analyze_cycle, engine, metrics, rates, news_events)
+            clear_status(status)
+            print_report(engine, timestamp, signals, final_decision, take_profit_suggestions, news_events)
+            if verify_interval and cycle % verify_interval == 0:
+                await loop.run_in_executor(mt5_executor, check_drift, engine)
+
+            if wake_mode == 'tick':
+                status['text'] = "Waiting for the next tick..."
+                await loop.run_in_executor(mt5_executor, scheduler.wait)
+            else:
+                delay = await loop.run_in_executor(mt5_executor, scheduler.time_to_next_close)
+                deadline = loop.time() + delay
+                while loop.time() < deadline:
+                    status['text'] = f"Waiting for next analysis in {int(round(deadline - loop.time()))} seconds..."
+                    await asyncio.sleep(min(deadline - loop.time(), 1.0))
+                scheduler.closed_timeframes()
+            clear_status(status)
+    finally:
+        ui_task.cancel()
+        mt5_executor.shutdown(wait=False)
+
+def main():
+    colorama.init(autoreset=True)
+
+    # --- Connect to MetaTrader 5 (Shut Down on Exit) ---
+    with MT5Connection(hub=data_hub) as mt5:
+        # --- User Input for Currency Pair ---
+        symbol = input("Enter currency pair (e.g., EURUSD): ").strip().upper()
+
+        # --- Metrics (Per-Stage Durations for fetch, indicators and news, Plus Counters) ---
+        metrics = Metrics(labels={'symbol': symbol, 'script': 'bbma_signal'})
+        if metrics_port:
+            metrics.serve(metrics_port)
+        if metrics_interval:
+            metrics.start_jsonl(f"data/metrics_{symbol}.jsonl", metrics_interval)
+
+        # --- Signal Engine (Delta-Fetched M1, M5..D1 Derived Locally, Streaming BBMA With Regime Filters) ---
+        engine = SignalEngine(mt5, symbol, mt5.timeframes(), capacity=num_candles, bar_store=BarStore('data/bars'),
+                              reentry='Mid_BB', wake_mode=wake_mode, regime_days=regime_days, regime_estimator=regime_estimator)
+        engine.seed()  # Filter thresholds start from stored history when there is some
+
+        # --- Economic Calendar (Parsed Once, Cached on Disk for Six Hours) ---
+        calendar = EconomicCalendar('data/calendar_cache.json', html_path=calendar_html)
+
+        if '--async' in sys.argv:
+            asyncio.run(run_async(engine, calendar, metrics))
+        else:
+            run_sync(engine, calendar, metrics)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""Append-only, memory-mapped bar store for history.
+
+One directory per symbol/timeframe (e.g. data/bars/EURUSD/M1/) holding one
+fixed-width binary file per column. Columns are opened with np.memmap, so
+slicing a range by timestamp touches only the pages it needs. Appends write
+to the end of each column file, and only closed bars newer than the last
+stored one are kept. Several processes may append to the same series: every
+append holds an exclusive lock on the series' lock file and re-reads the
+stored length before writing.
+
+Usage: python bbma_store.py EURUSD [--timeframe M1] [--days 365] [--root data/bars]
+"""
+import argparse
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from bbma_cache import RATE_DTYPE, timeframe_name
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+COLUMNS = {
+    'time': np.dtype('<i8'),
+    'open': np.dtype('<f8'),
+    'high': np.dtype('<f8'),
+    'low': np.dtype('<f8'),
+    'close': np.dtype('<f8'),
+    'tick_volume': np.dtype('<u8'),
+    'spread': np.dtype('<i4'),
+}
+
+
+# --- One Symbol/Timeframe Series ---
+class BarSeries:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.maps = None
+        self.refresh()
+
+    def _file(self, column):
+        return os.path.join(self.path, f"{column}.bin")
+
+    @contextmanager
+    def _locked(self):
+        # Exclusive across processes; held while the column files are repaired or appended to
+        with open(os.path.join(self.path, 'lock'), 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _repair(self):
+        # A crash between column writes can leave columns of different lengths; cut them back
+        lengths = {}
+        for column, dtype in COLUMNS.items():
+            size = os.path.getsize(self._file(column)) if os.path.exists(self._file(column)) else 0
+            lengths[column] = size // dtype.itemsize
+        length = min(lengths.values())
+        for column, dtype in COLUMNS.items():
+            if lengths[column] != length or not os.path.exists(self._file(column)):
+                with open(self._file(column), 'ab') as f:
+                    f.truncate(length * dtype.itemsize)
+        return length
+
+    def refresh(self):
+        # Length on disk, including bars other processes appended since the last look
+        with self._locked():
+            self.length = self._repair()
+        return self.length
+
+    def __len__(self):
+        return self.length
+
+    def columns(self):
+        # Read-only memmaps of every column, remapped only after the series has grown
+        if self.maps is None or len(self.maps['time']) != self.length:
+            if self.length == 0:
+                self.maps = {column: np.empty(0, dtype=dtype) for column, dtype in COLUMNS.items()}
+            else:
+                self.maps = {column: np.memmap(self._file(column), dtype=dtype, mode='r', shape=(self.length,))
+                             for column, dtype in COLUMNS.items()}
+        return self.maps
+
+    def last_time(self):
+        return int(self.columns()['time'][-1]) if self.length else None
+
+    def append(self, rates):
+        # Rates must be ordered by time; rows not newer than the last stored bar are skipped
+        if rates is None or len(rates) == 0:
+            return 0
+        with self._locked():
+            # Another process may have appended since this one last looked
+            self.length = self._repair()
+            last = self.last_time()
+            if last is not None:
+                rates = rates[rates['time'] > last]
+            if len(rates) == 0:
+                return 0
+            for column, dtype in COLUMNS.items():
+                with open(self._file(column), 'ab') as f:
+                    f.write(np.ascontiguousarray(rates[column], dtype=dtype).tobytes())
+            self.length += len(rates)
+        return len(rates)
+
+    def search(self, t, side='left'):
+        # Binary search on the time column
+        return int(np.searchsorted(self.columns()['time'], t, side=side))
+
+    def index_range(self, start_time=None, end_time=None):
+        start = 0 if start_time is None else self.search(start_time)
+        end = self.length if end_time is None else self.search(end_time)
+        return start, end
+
+    def slice(self, start_time=None, end_time=None):
+        # Zero-copy column views for bars with start_time <= time < end_time
+        start, end = self.index_range(start_time, end_time)
+        return {column: values[start:end] for column, values in self.columns().items()}
+
+    def rates(self, start_time=None, end_time=None):
+        # Same range as slice(), copied into the RATE_DTYPE layout used elsewhere
+        return self._copy(*self.index_range(start_time, end_time))
+
+    def tail(self, count):
+        return self._copy(max(self.length - count, 0), self.length)
+
+    def _copy(self, start, end):
+        out = np.zeros(max(end - start, 0), dtype=RATE_DTYPE)
+        for column, values in self.columns().items():
+            out[column] = values[start:end]
+        return out
+
+
+# --- Store of All Series Under One Root Directory ---
+class BarStore:
+    def __init__(self, root='data/bars'):
+        self.root = root
+        self.series_by_key = {}
+
+    def series(self, symbol, timeframe):
+        key = (symbol, timeframe)
+        if key not in self.series_by_key:
+            self.series_by_key[key] = BarSeries(os.path.join(self.root, symbol, timeframe_name(timeframe)))
+        return self.series_by_key[key]
+
+    def append(self, symbol, timeframe, rates):
+        return self.series(symbol, timeframe).append(rates)
+
+    def slice(self, symbol, timeframe, start_time=None, end_time=None):
+        return self.series(symbol, timeframe).slice(start_time, end_time)
+
+    def rates(self, symbol, timeframe, start_time=None, end_time=None):
+        return self.series(symbol, timeframe).rates(start_time, end_time)
+
+
+# --- Backfill from the Terminal ---
+def backfill(mt5, store, symbol, timeframe, start, end, chunk_days=30):
+    # Pull history in chunks with copy_rates_range, resuming after the last stored bar.
+    # The final (forming) bar is left out so only closed bars are stored.
+    series = store.series(symbol, timeframe)
+    series.refresh()
+    last = series.last_time()
+    if last is not None:
+        start = max(start, datetime.fromtimestamp(last + 1, tz=timezone.utc))
+    total = 0
+    while start < end:
+        stop = min(start + timedelta(days=chunk_days), end)
+        data = mt5.copy_rates_range(symbol, timeframe, start, stop)
+        if data is not None and len(data):
+            if stop == end:
+                data = data[:-1]
+            total += series.append(data)
+        start = stop
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill the local bar store from MetaTrader 5.")
+    parser.add_argument('symbol')
+    parser.add_argument('--timeframe', default='M1')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--root', default='data/bars')
+    args = parser.parse_args()
+
+    import MetaTrader5 as mt5
+    mt5.initialize()
+    try:
+        store = BarStore(args.root)
+        end = datetime.now(timezone.utc)
+        timeframe = getattr(mt5, f"TIMEFRAME_{args.timeframe.upper()}")
+        count = backfill(mt5, store, args.symbol.upper(), timeframe, end - timedelta(days=args.days), end)
+        print(f"Stored {count} new {args.timeframe.upper()} bars for {args.symbol.upper()} "
+              f"({len(store.series(args.symbol.upper(), timeframe))} total)")
+    finally:
+        mt5.shutdown()
+
+
+if __name__ == '__main__':
+    main()
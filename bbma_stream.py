@@ -0,0 +1,200 @@
+"""Streaming BBMA indicator engine.
+
+Keeps rolling sums for BB(20,2), MA5, MA10, SMA200 and Wilder ATR(14) so each
+closed bar costs O(1) regardless of lookback, and produces the same
+Reentry/Momentum/Signal/Take_Profit values as the pandas `analyze_bbma`.
+With a RegimeFilter (bbma_quantile) rows also carry Filtered_Signal, whose
+thresholds come from per-bar estimators rather than the fetched window.
+"""
+import math
+from collections import deque
+
+NAN = float('nan')
+
+
+# --- Rolling Window with Running Sum and Sum of Squares ---
+class RollingWindow:
+    def __init__(self, window, resync_every=4096):
+        self.window = window
+        self.resync_every = resync_every
+        self.values = deque(maxlen=window)
+        self.anchor = None  # Sums are kept relative to this price for precision
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.pushes = 0
+
+    def push(self, value):
+        if self.anchor is None:
+            self.anchor = value
+        if len(self.values) == self.window:
+            old = self.values[0] - self.anchor
+            self.total -= old
+            self.total_sq -= old * old
+        x = value - self.anchor
+        self.values.append(value)
+        self.total += x
+        self.total_sq += x * x
+        self.pushes += 1
+        if self.pushes % self.resync_every == 0:
+            self._resync()
+
+    def _resync(self):
+        # Re-sum from scratch now and then so floating-point drift cannot build up
+        self.anchor = self.values[-1]
+        diffs = [v - self.anchor for v in self.values]
+        self.total = math.fsum(diffs)
+        self.total_sq = math.fsum(d * d for d in diffs)
+
+    def mean_std(self, value=None):
+        # Mean and population std of the window, optionally with `value` as the newest element
+        total, total_sq, n = self.total, self.total_sq, len(self.values)
+        if value is not None:
+            anchor = value if self.anchor is None else self.anchor
+            if n == self.window:
+                old = self.values[0] - anchor
+                total -= old
+                total_sq -= old * old
+                n -= 1
+            x = value - anchor
+            total += x
+            total_sq += x * x
+            n += 1
+        else:
+            anchor = self.anchor
+        if n < self.window:
+            return NAN, NAN
+        mean = total / n
+        var = max(total_sq / n - mean * mean, 0.0)
+        return anchor + mean, math.sqrt(var)
+
+    def mean(self, value=None):
+        return self.mean_std(value)[0]
+
+
+# --- Wilder Average True Range (same seeding as ta.volatility.AverageTrueRange) ---
+class WilderATR:
+    def __init__(self, window=14):
+        self.window = window
+        self.prev_close = None
+        self.count = 0
+        self.tr_sum = 0.0
+        self.atr = 0.0
+
+    def _true_range(self, high, low):
+        if self.prev_close is None:
+            return high - low
+        return max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+
+    def _next(self, tr):
+        count = self.count + 1
+        if count < self.window:
+            return count, self.tr_sum + tr, 0.0
+        if count == self.window:
+            tr_sum = self.tr_sum + tr
+            return count, tr_sum, tr_sum / self.window
+        return count, self.tr_sum, (self.atr * (self.window - 1) + tr) / float(self.window)
+
+    def push(self, high, low, close):
+        self.count, self.tr_sum, self.atr = self._next(self._true_range(high, low))
+        self.prev_close = close
+        return self.atr
+
+    def peek(self, high, low):
+        return self._next(self._true_range(high, low))[2]
+
+
+# --- Streaming BBMA Engine ---
+class BBMAStream:
+    def __init__(self, bb_window=20, bb_dev=2, ma_fast=5, ma_slow=10, trend_window=200,
+                 atr_window=14, reentry='MA5_High', regime=None):
+        self.bb_dev = bb_dev
+        self.reentry = reentry  # 'MA5_High' (analisa_bbma, learn_trade) or 'Mid_BB' (bbma_signal)
+        self.regime = regime  # Optional bbma_quantile.RegimeFilter adding Trending, Ranging and Filtered_Signal
+        self.bb = RollingWindow(bb_window)
+        self.ma_fast = RollingWindow(ma_fast)
+        self.ma_slow = RollingWindow(ma_slow)
+        self.trend = RollingWindow(trend_window)
+        self.atr = WilderATR(atr_window)
+        self.prev_close = None
+        self.last_time = None
+        self.last_row = None
+        self.bars_pushed = 0
+
+    def _evaluate(self, bar, commit):
+        close = float(bar['close'])
+        high = float(bar['high'])
+        low = float(bar['low'])
+        if commit:
+            for window in (self.bb, self.ma_fast, self.ma_slow, self.trend):
+                window.push(close)
+            mid, std = self.bb.mean_std()
+            ma5, ma10, sma200 = self.ma_fast.mean(), self.ma_slow.mean(), self.trend.mean()
+            atr = self.atr.push(high, low, close)
+        else:
+            mid, std = self.bb.mean_std(close)
+            ma5, ma10, sma200 = self.ma_fast.mean(close), self.ma_slow.mean(close), self.trend.mean(close)
+            atr = self.atr.peek(high, low)
+
+        upper = mid + self.bb_dev * std
+        lower = mid - self.bb_dev * std
+        ref = ma5 if self.reentry == 'MA5_High' else mid
+        prev = NAN if self.prev_close is None else self.prev_close
+
+        reentry = (close < upper and close > ref) or (close > lower and close < ref)
+        momentum = (close > upper and prev < upper) or (close < lower and prev > lower)
+
+        signal = 'Hold'
+        take_profit = NAN
+        if reentry and momentum:
+            signal = 'Buy'
+            take_profit = close + (upper - mid)
+        elif reentry:
+            signal = 'Sell'
+            take_profit = close - (mid - lower)
+
+        row = {
+            'time': bar['time'],
+            'close': close,
+            'BB_Upper': upper,
+            'BB_Lower': lower,
+            'Mid_BB': mid,
+            'MA5_High': ma5,
+            'MA10_High': ma10,
+            'SMA200': sma200,
+            'ATR': atr,
+            'Reentry': reentry,
+            'Momentum': momentum,
+            'Signal': signal,
+            'Take_Profit': take_profit,
+        }
+        if commit:
+            self.prev_close = close
+            self.last_time = bar['time']
+            self.bars_pushed += 1
+        if self.regime is not None:
+            if commit:
+                self.regime.push(row)
+            self.regime.apply(row)
+        self.last_row = row
+        return row
+
+    def push(self, bar):
+        # Commit a closed bar
+        return self._evaluate(bar, commit=True)
+
+    def peek(self, bar):
+        # Evaluate the forming bar without committing it
+        return self._evaluate(bar, commit=False)
+
+    def sync(self, rates):
+        # Feed rates ordered oldest -> newest whose last entry is the forming bar;
+        # only bars newer than the last committed one are pushed. Walking back from
+        # the end keeps the cost proportional to the number of new bars.
+        if rates is None or len(rates) == 0:
+            return None
+        start = len(rates) - 1
+        while start > 0 and (self.last_time is None or rates[start - 1]['time'] > self.last_time):
+            start -= 1
+        for i in range(start, len(rates) - 1):
+            self.push(rates[i])
+        return self.peek(rates[-1])
@@ -0,0 +1,308 @@
+"""Parallel parameter sweep for the BBMA rules over stored M1 history.
+
+Searches the whole grid, or a random sample of it (--samples), over:
+  - the BB window and deviation;
+  - the MA5 re-entry window;
+  - the ATR window and quantile cut-off of the filtered rules;
+  - the set of timeframes that must all agree.
+Each configuration is backtested with bbma_backtest.simulate, and the
+results are ranked. MA10 and SMA200 feed no rule, so they are not swept.
+
+The parent process resamples each timeframe once. For each one it computes
+the prefix sums of the closes and the as-of index of its closed bars on the
+M1 timeline. With prefix sums, a rolling window of any length is a
+difference of two entries. All of these arrays go into one shared-memory
+block, and workers attach read-only views, so the history is never pickled
+or copied per worker. Configurations are grouped by BB window and deviation.
+Per timeframe, a worker computes the bands, the ranging threshold and each
+ATR once per group.
+
+Usage: python bbma_sweep.py EURUSD_M1.npy [--workers N] [--samples N] [--sort total_pnl]
+       python bbma_sweep.py --symbol EURUSD [--start 2023-01-01] [--bb-window 14,20,26] [--timeframes "M1;M1,M15,H1"]
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from bbma_backtest import M1, load_rates, simulate, summarize
+from bbma_cache import TIMEFRAMES, as_rates, timeframe_seconds
+from bbma_resample import closed_bar_index, resample_rates
+from bbma_vector import HOLD, average_true_range, bbma_signals, consensus, prefix_sums, rolling_quantile
+
+SUM_KEYS = ('anchor', 'sum', 'sum_sq', 'count')
+
+
+# --- Shared Read-Only Arrays ---
+class SharedArrays:
+    # Named arrays copied once into a single shared-memory block; `spec` is what workers need to attach
+    def __init__(self, arrays):
+        layout = []
+        size = 0
+        for key, array in arrays.items():
+            layout.append((key, array.dtype, array.shape, size))
+            size += (array.nbytes + 63) // 64 * 64
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for (key, dtype, shape, offset), array in zip(layout, arrays.values()):
+            np.ndarray(shape, dtype, self.shm.buf, offset)[...] = array
+        self.spec = (self.shm.name, layout)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def attach(spec):
+    name, layout = spec
+    shm = shared_memory.SharedMemory(name=name)
+    arrays = {}
+    for key, dtype, shape, offset in layout:
+        view = np.ndarray(shape, dtype, shm.buf, offset)
+        view.flags.writeable = False
+        arrays[key] = view
+    return shm, arrays
+
+
+def prepare(rates, names):
+    # M1 bars plus, per timeframe, its high/low/close, the prefix sums of its closes and its
+    # as-of index on the M1 timeline (M15 is always included for the TP/SL bands)
+    rates = as_rates(rates)
+    arrays = {'rates': np.ascontiguousarray(rates)}
+    for name in sorted(set(names) | {'M15'}, key=lambda name: timeframe_seconds(TIMEFRAMES[name])):
+        timeframe = TIMEFRAMES[name]
+        bars = rates if timeframe == M1 else resample_rates(rates, timeframe)
+        for column in ('high', 'low', 'close'):
+            arrays[f"{name}.{column}"] = np.ascontiguousarray(bars[column])
+        for key, value in prefix_sums(bars['close']).items():
+            arrays[f"{name}.{key}"] = value
+        if timeframe != M1:
+            arrays[f"{name}.index"] = closed_bar_index(bars['time'], timeframe_seconds(timeframe),
+                                                       rates['time'], timeframe_seconds(M1))
+    return arrays
+
+
+# --- Configurations ---
+def build_grid(rules, timeframe_sets, bb_windows, bb_devs, ma_fasts, atr_windows, atr_quantiles):
+    configs = []
+    for rule, timeframes, bb_window, bb_dev in itertools.product(rules, timeframe_sets, bb_windows, bb_devs):
+        base = {'rules': rule, 'timeframes': tuple(timeframes), 'bb_window': bb_window, 'bb_dev': bb_dev,
+                'ma_fast': None, 'atr_window': None, 'atr_quantile': None}
+        if rule == 'signal':  # Re-entry against MA5_High; the ATR filter does not apply
+            configs.extend(dict(base, ma_fast=ma_fast) for ma_fast in ma_fasts)
+        else:  # Re-entry against Mid_BB, as in bbma_signal.py
+            configs.extend(dict(base, atr_window=window, atr_quantile=q) for window, q in itertools.product(atr_windows, atr_quantiles))
+    return configs
+
+
+def make_tasks(configs, workers, per_worker=4):
+    # Group by BB parameters so the shared intermediates are computed once per group; large
+    # groups are split so every worker gets about `per_worker` tasks
+    groups = {}
+    for config in configs:
+        groups.setdefault((config['bb_window'], config['bb_dev']), []).append(config)
+    chunk = max(len(configs) // max(workers * per_worker, 1), 1)
+    tasks = []
+    for group in groups.values():
+        group.sort(key=lambda c: (c['rules'], c['atr_window'] or 0, c['timeframes'], c['ma_fast'] or 0, c['atr_quantile'] or 0))
+        tasks.extend(group[i:i + chunk] for i in range(0, len(group), chunk))
+    return tasks
+
+
+# --- Evaluation ---
+def timeframe_signals(arrays, name, config, cache, lookback, stride):
+    close = arrays[f"{name}.close"]
+    sums = {key: arrays[f"{name}.{key}"] for key in SUM_KEYS}
+    bb_window, bb_dev = config['bb_window'], config['bb_dev']
+    if config['rules'] == 'signal':
+        result = bbma_signals(close, bb_window, bb_dev, ma_fast=config['ma_fast'], sums=sums)
+        return result['Signal'], result['Take_Profit']
+    # Same steps as bbma_vector.filtered_signals, with the parts that do not depend on the ATR settings cached
+    if (name, 'bands') not in cache:
+        result = bbma_signals(close, bb_window, bb_dev, reentry='Mid_BB', sums=sums)
+        upper_median = rolling_quantile(result['BB_Upper'], lookback, 0.5, stride)
+        with np.errstate(invalid='ignore'):
+            ranging = result['BB_Upper'] - result['BB_Lower'] < upper_median
+        cache[(name, 'bands')] = result['Signal'], result['Take_Profit'], ranging
+    signal, take_profit, ranging = cache[(name, 'bands')]
+    atr_key = (name, 'atr', config['atr_window'])
+    if atr_key not in cache:
+        cache[atr_key] = average_true_range(arrays[f"{name}.high"], arrays[f"{name}.low"], close, config['atr_window'])
+    atr = cache[atr_key]
+    with np.errstate(invalid='ignore'):
+        volatile = atr > rolling_quantile(atr, lookback, config['atr_quantile'], stride)
+    filtered = signal.copy()
+    filtered[ranging | volatile] = HOLD
+    return filtered, take_profit
+
+
+def aligned(arrays, name, values, fill):
+    # Per-M1-bar values of the latest closed bar of `name` (no lookahead)
+    if name == 'M1':
+        return values
+    index = arrays[f"{name}.index"]
+    return np.where(index >= 0, values[np.maximum(index, 0)], fill)
+
+
+def evaluate(arrays, configs, options):
+    rates = arrays['rates']
+    cache = {}
+    results = []
+    for config in configs:
+        # TP/SL levels: the bands of the last closed M15 bar, as in learn_trade.py, with this BB setting
+        band_key = ('M15', 'levels', config['bb_window'], config['bb_dev'])
+        if band_key not in cache:
+            sums = {key: arrays[f"M15.{key}"] for key in SUM_KEYS}
+            bands = bbma_signals(arrays['M15.close'], config['bb_window'], config['bb_dev'], sums=sums)
+            cache[band_key] = (aligned(arrays, 'M15', bands['BB_Upper'], np.nan),
+                               aligned(arrays, 'M15', bands['BB_Lower'], np.nan))
+        upper, lower = cache[band_key]
+
+        codes = []
+        take_profit = None
+        for name in config['timeframes']:  # Ordered shortest first; its Take_Profit is used for tp_mode='take_profit'
+            signal, tp = timeframe_signals(arrays, name, config, cache, options['lookback'], options['stride'])
+            codes.append(aligned(arrays, name, signal, HOLD))
+            if take_profit is None:
+                take_profit = aligned(arrays, name, tp, np.nan)
+        signals = codes[0] if len(codes) == 1 else consensus(codes)
+
+        trades = simulate(rates, signals, take_profit, upper, lower, options['tp_mode'], options['point'], options['ambiguous'])
+        results.append(dict(config, timeframes=','.join(config['timeframes']), **summarize(trades)))
+    return results
+
+
+_worker_arrays = None
+
+
+def _init_worker(spec):
+    global _worker_arrays
+    _worker_arrays = attach(spec)  # (shm, arrays); the block must stay mapped for the worker's lifetime
+
+
+def _evaluate_task(configs, options):
+    return evaluate(_worker_arrays[1], configs, options)
+
+
+def sweep(rates, configs, workers=None, tp_mode='m15_band', point=0.0, ambiguous='sl', lookback=1000, stride=60, progress=None):
+    # Returns one result dict per configuration (the configuration plus the backtest summary)
+    workers = os.cpu_count() if workers is None else workers
+    options = {'tp_mode': tp_mode, 'point': point, 'ambiguous': ambiguous, 'lookback': lookback, 'stride': stride}
+    arrays = prepare(rates, {name for config in configs for name in config['timeframes']})
+    tasks = make_tasks(configs, workers)
+    results = []
+    if workers <= 1:
+        for task in tasks:
+            results.extend(evaluate(arrays, task, options))
+            if progress:
+                progress(len(results), len(configs))
+        return results
+    shared = SharedArrays(arrays)
+    del arrays
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared.spec,)) as pool:
+            for task_results in pool.map(_evaluate_task, tasks, itertools.repeat(options)):
+                results.extend(task_results)
+                if progress:
+                    progress(len(results), len(configs))
+    finally:
+        shared.close()
+    return results
+
+
+# --- Command Line ---
+def parse_values(text, cast):
+    return [cast(value) for value in text.split(',') if value]
+
+
+def parse_timeframe_sets(text):
+    sets = []
+    for group in text.split(';'):
+        names = [name.strip().upper() for name in group.split(',') if name.strip()]
+        unknown = [name for name in names if name not in TIMEFRAMES]
+        if unknown:
+            raise argparse.ArgumentTypeError(f"unknown timeframe(s): {', '.join(unknown)}")
+        sets.append(sorted(names, key=lambda name: timeframe_seconds(TIMEFRAMES[name])))
+    return sets
+
+
+def print_top(results, sort, count):
+    print(f"{'rules':<9}{'timeframes':<24}{'bb':>8}{'ma5':>5}{'atr':>5}{'q':>6}{'trades':>8}{'win%':>7}{'pnl':>11}{'pf':>7}{'maxdd':>10}")
+    for r in results[:count]:
+        pf = '-' if r['profit_factor'] is None else f"{r['profit_factor']:.2f}"
+        print(f"{r['rules']:<9}{r['timeframes']:<24}{r['bb_window']:>4}/{r['bb_dev']:<3}{r['ma_fast'] or '-':>5}"
+              f"{r['atr_window'] or '-':>5}{r['atr_quantile'] or '-':>6}{r['trades']:>8}{r['win_rate'] * 100:>7.1f}"
+              f"{r['total_pnl']:>11.5f}{pf:>7}{r['max_drawdown']:>10.5f}")
+    print(f"(sorted by {sort})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep BBMA parameters over M1 history in parallel.")
+    parser.add_argument('path', nargs='?', help="M1 rates saved with numpy.save (fields as returned by copy_rates_*)")
+    parser.add_argument('--symbol', help="Read M1 bars for this symbol from the bar store instead of a file")
+    parser.add_argument('--store', default='data/bars', help="Bar store root directory")
+    parser.add_argument('--start', help="First date to test (YYYY-MM-DD, server time)")
+    parser.add_argument('--end', help="Date to stop before (YYYY-MM-DD, server time)")
+    parser.add_argument('--rules', default='signal,filtered', help="Comma-separated: signal, filtered")
+    parser.add_argument('--timeframes', type=parse_timeframe_sets, default='M1;M1,M15,H1;M1,M5,M15,H1,H4,D1',
+                        help="Semicolon-separated timeframe sets that must all agree")
+    parser.add_argument('--bb-window', default='14,20,26,34')
+    parser.add_argument('--bb-dev', default='1.5,2,2.5')
+    parser.add_argument('--ma-fast', default='3,5,8')
+    parser.add_argument('--atr-window', default='10,14,20')
+    parser.add_argument('--atr-quantile', default='0.8,0.9,0.95')
+    parser.add_argument('--samples', type=int, help="Evaluate this many random configurations instead of the full grid")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes (1 runs in this process)")
+    parser.add_argument('--tp', choices=['m15_band', 'take_profit'], default='m15_band')
+    parser.add_argument('--point', type=float, default=0.0, help="Symbol point size; enables spread costs")
+    parser.add_argument('--ambiguous', choices=['sl', 'tp', 'nearest'], default='sl')
+    parser.add_argument('--lookback', type=int, default=1000, help="Bars in the filter quantile windows")
+    parser.add_argument('--stride', type=int, default=60, help="Bars between filter threshold updates")
+    parser.add_argument('--sort', default='total_pnl', choices=['total_pnl', 'profit_factor', 'win_rate', 'avg_pnl', 'trades'])
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--out', default='data/sweep', help="Directory for result files")
+    args = parser.parse_args()
+
+    if not (args.path or args.symbol):
+        parser.error("either a rates file or --symbol is required")
+    rates = load_rates(args.path, args.symbol, args.store, args.start, args.end)
+    configs = build_grid(args.rules.split(','), args.timeframes, parse_values(args.bb_window, int), parse_values(args.bb_dev, float),
+                         parse_values(args.ma_fast, int), parse_values(args.atr_window, int), parse_values(args.atr_quantile, float))
+    if args.samples and args.samples < len(configs):
+        configs = random.Random(args.seed).sample(configs, args.samples)
+    print(f"Sweeping {len(configs)} configurations over {len(rates)} M1 bars with {args.workers} worker(s)")
+
+    def progress(done, total):
+        print(f"\r{done}/{total} configurations", end='', flush=True)
+
+    started = time.perf_counter()
+    results = sweep(rates, configs, args.workers, args.tp, args.point, args.ambiguous, args.lookback, args.stride, progress)
+    elapsed = time.perf_counter() - started
+    print(f"\rEvaluated {len(results)} configurations in {elapsed:.1f}s ({len(results) / elapsed:.1f}/s)")
+    results.sort(key=lambda r: float('-inf') if r[args.sort] is None else r[args.sort], reverse=True)  # No profit factor ranks last
+    print_top(results, args.sort, args.top)
+
+    os.makedirs(args.out, exist_ok=True)
+    label = args.symbol.upper() if args.symbol else os.path.splitext(os.path.basename(args.path))[0]
+    path = os.path.join(args.out, f"{label}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, 'w') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'bars': len(rates),
+            'options': {'tp': args.tp, 'point': args.point, 'ambiguous': args.ambiguous,
+                        'lookback': args.lookback, 'stride': args.stride, 'start': args.start, 'end': args.end},
+            'seconds': round(elapsed, 3),
+            'results': results,
+        }, f, indent=1)
+    print(f"Saved {path}")
+
+
+if __name__ == '__main__':
+    main()
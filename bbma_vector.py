@@ -0,0 +1,205 @@
+"""Vectorized BBMA rules over NumPy arrays.
+
+Every function works along the last axis, so a 1-D close series and a 2-D
+(symbols x bars) stack are handled the same way. Rolling windows come from
+prefix sums, which makes the cost independent of the window length.
+Signals are encoded as BUY/SELL/HOLD integers; SIGNAL_NAMES maps them back
+to the 'Buy'/'Sell'/'Hold' strings used by analyze_bbma.
+"""
+import numpy as np
+
+BUY, SELL, HOLD = 1, -1, 0
+SIGNAL_NAMES = {BUY: 'Buy', SELL: 'Sell', HOLD: 'Hold'}
+
+
+# --- Prefix Sums (NaN-Aware, Shifted by the First Valid Value for Precision) ---
+def prefix_sums(values):
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    if values.shape[-1]:
+        first = np.expand_dims(valid.argmax(axis=-1), -1)
+        anchor = np.nan_to_num(np.take_along_axis(values, first, axis=-1))
+    else:
+        anchor = np.zeros(values.shape[:-1] + (1,))
+    x = np.where(valid, values - anchor, 0.0)
+    pad = [(0, 0)] * (values.ndim - 1) + [(1, 0)]
+    return {
+        'anchor': anchor,
+        'sum': np.pad(np.cumsum(x, axis=-1), pad),
+        'sum_sq': np.pad(np.cumsum(x * x, axis=-1), pad),
+        'count': np.pad(np.cumsum(valid, axis=-1), pad),
+    }
+
+
+def rolling_mean_std(values, window, sums=None):
+    # Rolling mean and population std (ddof=0, as ta's BollingerBands); NaN until the window is full
+    sums = prefix_sums(values) if sums is None else sums
+    n = sums['sum'].shape[-1] - 1
+    out_shape = sums['sum'].shape[:-1] + (n,)
+    mean = np.full(out_shape, np.nan)
+    std = np.full(out_shape, np.nan)
+    if n < window:
+        return mean, std
+    total = sums['sum'][..., window:] - sums['sum'][..., :-window]
+    total_sq = sums['sum_sq'][..., window:] - sums['sum_sq'][..., :-window]
+    count = sums['count'][..., window:] - sums['count'][..., :-window]
+    m = total / window
+    var = np.maximum(total_sq / window - m * m, 0.0)
+    full = count == window
+    mean[..., window - 1:] = np.where(full, sums['anchor'] + m, np.nan)
+    std[..., window - 1:] = np.where(full, np.sqrt(var), np.nan)
+    return mean, std
+
+
+def rolling_mean(values, window, sums=None):
+    return rolling_mean_std(values, window, sums)[0]
+
+
+def shift(values, periods=1):
+    out = np.full(values.shape, np.nan)
+    if periods < values.shape[-1]:
+        out[..., periods:] = values[..., :-periods]
+    return out
+
+
+# --- BBMA Rules (Same Logic as analyze_bbma) ---
+def bbma_signals(close, bb_window=20, bb_dev=2, ma_fast=5, ma_slow=10, reentry='MA5_High', sums=None):
+    close = np.asarray(close, dtype=np.float64)
+    sums = prefix_sums(close) if sums is None else sums
+    mid, std = rolling_mean_std(close, bb_window, sums)
+    upper = mid + bb_dev * std
+    lower = mid - bb_dev * std
+    ma5 = rolling_mean(close, ma_fast, sums)
+    ma10 = rolling_mean(close, ma_slow, sums)
+    ref = ma5 if reentry == 'MA5_High' else mid
+    prev = shift(close)
+
+    with np.errstate(invalid='ignore'):
+        reentry_mask = ((close < upper) & (close > ref)) | ((close > lower) & (close < ref))
+        momentum = ((close > upper) & (prev < upper)) | ((close < lower) & (prev > lower))
+
+    signal = np.full(close.shape, HOLD, dtype=np.int8)
+    signal[reentry_mask & momentum] = BUY
+    signal[reentry_mask & ~momentum] = SELL
+    take_profit = np.where(signal == BUY, close + (upper - mid),
+                           np.where(signal == SELL, close - (mid - lower), np.nan))
+    return {
+        'BB_Upper': upper,
+        'BB_Lower': lower,
+        'Mid_BB': mid,
+        'MA5_High': ma5,
+        'MA10_High': ma10,
+        'Reentry': reentry_mask,
+        'Momentum': momentum,
+        'Signal': signal,
+        'Take_Profit': take_profit,
+    }
+
+
+def stack_tails(series, length):
+    # Right-align the last `length` values of each 1-D series into one 2-D array, NaN-padded on the left
+    out = np.full((len(series), length), np.nan)
+    for i, values in enumerate(series):
+        tail = values[-length:]
+        if len(tail):
+            out[i, length - len(tail):] = tail
+    return out
+
+
+# --- All-Timeframes-Agree Consensus ---
+def consensus(signals):
+    # `signals` is a (timeframes x ...) array of codes; BUY/SELL only where every timeframe agrees
+    signals = np.asarray(signals)
+    decision = np.full(signals.shape[1:], HOLD, dtype=np.int8)
+    decision[(signals == BUY).all(axis=0)] = BUY
+    decision[(signals == SELL).all(axis=0)] = SELL
+    return decision
+
+
+# --- Wilder Average True Range (Same Seeding as ta.volatility.AverageTrueRange) ---
+def true_range(high, low, close):
+    high, low, close = (np.asarray(a, dtype=np.float64) for a in (high, low, close))
+    prev = shift(close)
+    with np.errstate(invalid='ignore'):
+        tr = np.fmax(high - low, np.fmax(np.abs(high - prev), np.abs(low - prev)))
+    return tr
+
+
+def wilder_smooth(values, window, block=256):
+    # out[window-1] = mean of the first `window` values, then out[i] = (out[i-1]*(window-1) + values[i]) / window.
+    # The recursion is solved block by block in closed form; within a block every term is
+    # positive, so rescaling by decay powers loses no precision.
+    values = np.asarray(values, dtype=np.float64)
+    out = np.zeros(len(values))
+    if len(values) < window:
+        return out
+    decay = (window - 1) / window
+    powers = decay ** np.arange(block + 1)
+    inverse = decay ** -np.arange(block)
+    carry = values[:window].mean()
+    out[window - 1] = carry
+    for start in range(window, len(values), block):
+        chunk = values[start:start + block]
+        m = len(chunk)
+        local = powers[:m] * np.cumsum(chunk * inverse[:m]) / window
+        smoothed = powers[1:m + 1] * carry + local
+        out[start:start + m] = smoothed
+        carry = smoothed[-1]
+    return out
+
+
+def average_true_range(high, low, close, window=14):
+    return wilder_smooth(true_range(high, low, close), window)
+
+
+# --- Trailing-Window Quantile, Sampled Every `stride` Bars and Carried Forward ---
+def rolling_quantile(values, lookback, q, stride=1, chunk_rows=2048):
+    # Matches Series.quantile over the last `lookback` values; windows that still contain
+    # NaN (indicator warm-up) are left as NaN
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) == 0:
+        return out
+    first = valid[0] + lookback - 1
+    if first >= len(values):
+        return out
+    windows = np.lib.stride_tricks.sliding_window_view(values, lookback)
+    ends = np.arange(first, len(values), stride)
+    sampled = np.empty(len(ends))
+    for i in range(0, len(ends), chunk_rows):
+        rows = windows[ends[i:i + chunk_rows] - lookback + 1]
+        sampled[i:i + chunk_rows] = np.quantile(rows, q, axis=1)
+    out[ends] = sampled
+    # Carry each sampled threshold forward until the next sample
+    filled = np.where(~np.isnan(out), np.arange(len(out)), 0)
+    np.maximum.accumulate(filled, out=filled)
+    out[first:] = out[filled[first:]]
+    return out
+
+
+# --- Filtered Signal (bbma_signal.py: Ranging and High-Volatility Bars Are Held) ---
+def filtered_signals(high, low, close, lookback=1000, stride=1, bb_window=20, bb_dev=2,
+                     atr_window=14, trend_window=200, atr_quantile=0.9, sums=None):
+    close = np.asarray(close, dtype=np.float64)
+    sums = prefix_sums(close) if sums is None else sums
+    result = bbma_signals(close, bb_window, bb_dev, reentry='Mid_BB', sums=sums)
+    atr = average_true_range(high, low, close, atr_window)
+    sma200 = rolling_mean(close, trend_window, sums)
+    # Same comparison as bbma_signal.py: band width against the median of BB_Upper
+    upper_median = rolling_quantile(result['BB_Upper'], lookback, 0.5, stride)
+    atr_threshold = rolling_quantile(atr, lookback, atr_quantile, stride)
+    with np.errstate(invalid='ignore'):
+        ranging = result['BB_Upper'] - result['BB_Lower'] < upper_median
+        volatile = atr > atr_threshold
+        trending = close > sma200
+    filtered = result['Signal'].copy()
+    filtered[ranging | volatile] = HOLD
+    result.update({
+        'ATR': atr,
+        'SMA200': sma200,
+        'Trending': trending,
+        'Ranging': ranging,
+        'Filtered_Signal': filtered,
+    })
+    return result
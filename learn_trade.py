@@ -1,207 +1,221 @@
-import pandas as pd
-import numpy as np
-import MetaTrader5 as mt5
-import joblib
 import time
-import os
-import xgboost as xgb
+import pandas as pd
 import colorama
+from functools import partial
 from colorama import Fore, Style
-from ta.volatility import BollingerBands
-from ta.trend import SMAIndicator
-
-# Initialize colorama
-colorama.init(autoreset=True)
+from bbma_core import MT5Connection, SignalEngine
+from bbma_store import BarStore
+from bbma_learn import TradeLog, IncrementalTrainer, SignalScorer
+from bbma_deals import DealSync
+from bbma_monitor import PositionMonitor
+from bbma_metrics import Metrics
+from bbma_orders import OrderRouter
 
-# Initialize MetaTrader 5
-mt5.initialize()
-
-# User Input
-symbol = input("Enter currency pair (e.g., EURUSD, XAUUSD, BTCUSD): ").strip().upper()
-timeframes = {'M1': mt5.TIMEFRAME_M1, 'M5': mt5.TIMEFRAME_M5, 'M15': mt5.TIMEFRAME_M15, 'H1': mt5.TIMEFRAME_H1, 'H4': mt5.TIMEFRAME_H4, 'D1': mt5.TIMEFRAME_D1}
 num_candles = 1000
-
-# File Paths
-trade_history_file = f"data/trade_history_{symbol}.csv"
-learning_model_file = f"data/learning_{symbol}.joblib"
-
-# Load or Initialize Model
-def load_model():
-    if os.path.exists(learning_model_file):
-        return joblib.load(learning_model_file)
-    return xgb.XGBRegressor()
-
-model = load_model()
-
-def fetch_data(timeframe):
-    data = mt5.copy_rates_from_pos(symbol, timeframe, 0, num_candles)
-    df = pd.DataFrame(data)
-    df['time'] = pd.to_datetime(df['time'], unit='s')
-    df.set_index('time', inplace=True)
-    return df
-
-def analyze_bbma(df):
-    bb = BollingerBands(close=df['close'], window=20, window_dev=2)
-    df['BB_Upper'] = bb.bollinger_hband()
-    df['BB_Lower'] = bb.bollinger_lband()
-    df['Mid_BB'] = bb.bollinger_mavg()
-    df['MA5_High'] = SMAIndicator(df['close'], window=5).sma_indicator()
-    df['MA10_High'] = SMAIndicator(df['close'], window=10).sma_indicator()
-
-    df['Reentry'] = ((df['close'] < df['BB_Upper']) & (df['close'] > df['MA5_High'])) | ((df['close'] > df['BB_Lower']) & (df['close'] < df['MA5_High']))
-    df['Momentum'] = ((df['close'] > df['BB_Upper']) & (df['close'].shift(1) < df['BB_Upper'])) | ((df['close'] < df['BB_Lower']) & (df['close'].shift(1) > df['BB_Lower']))
-
-    df['Signal'] = 'Hold'
-    df.loc[df['Reentry'] & df['Momentum'], 'Signal'] = 'Buy'
-    df.loc[df['Reentry'] & (~df['Momentum']), 'Signal'] = 'Sell'
-    return df
-
-def record_trade():
-    # Fetch latest trade history from MetaTrader 5
-    history_orders = mt5.history_deals_get(time_from=0, time_to=time.time())
-    if not history_orders:
-        print("No trade history found.")
-        return
-    
-    latest_trade = history_orders[-1]  # Get the most recent trade
-    trade_type = 'BUY' if latest_trade.type == mt5.ORDER_TYPE_BUY else 'SELL'
-    entry_price = latest_trade.price_open
-    tp = latest_trade.price_tp
-    sl = latest_trade.price_sl
-    result = 'win' if latest_trade.profit > 0 else 'loss'
-    
-    os.makedirs('data', exist_ok=True)
-    trade_data = pd.DataFrame([[trade_type, entry_price, tp, sl, result]], 
-                               columns=['Trade Type', 'Entry Price', 'TP', 'SL', 'Result'])
-    if os.path.exists(trade_history_file):
-        trade_data.to_csv(trade_history_file, mode='a', header=False, index=False)
-    else:
-        trade_data.to_csv(trade_history_file, mode='w', header=True, index=False)
-    # Wait for trade to close
-    while True:
-        history_orders = mt5.history_deals_get(position=open_trade)
-        if history_orders:
-            break
-        time.sleep(5)
-    
-    # Check if trade hit TP or SL
-    for deal in history_orders:
-        if deal.profit > 0:
-            result = 'win'
-        else:
-            result = 'loss'
-    
-    os.makedirs('data', exist_ok=True)
-    trade_data = pd.DataFrame([[entry_price, tp, sl, result]], columns=['Entry Price', 'TP', 'SL', 'Result'])
-    if os.path.exists(trade_history_file):
-        trade_data.to_csv(trade_history_file, mode='a', header=False, index=False)
-    else:
-        trade_data.to_csv(trade_history_file, mode='w', header=True, index=False)
-    os.makedirs('data', exist_ok=True)
-    trade_data = pd.DataFrame([[entry_price, tp, sl, result]], columns=['Entry Price', 'TP', 'SL', 'Result'])
-    if os.path.exists(trade_history_file):
-        trade_data.to_csv(trade_history_file, mode='a', header=False, index=False)
-    else:
-        trade_data.to_csv(trade_history_file, mode='w', header=True, index=False)
-
-def retrain_model():
-    if os.path.exists(trade_history_file):
-        df = pd.read_csv(trade_history_file)
-        if len(df) >= 30:
-            X = df[['Entry Price', 'TP', 'SL']]
-            y = df['Result'].apply(lambda x: 1 if x == 'win' else 0)
-            model.fit(X, y)
-            joblib.dump(model, learning_model_file)
-
-def modify_trade(tp, sl):
+verify_interval = 60  # Cycles between drift checks against terminal-native bars (0 disables)
+wake_mode = 'bar_close'  # 'bar_close' wakes right after each M1 close (server time); 'tick' polls for new ticks
+data_hub = None  # Name of a running bbma_hub.py to read bars and ticks from (None polls the terminal directly)
+score_timeframes = ['M15']  # Candidate TP/SL setups (each timeframe's Bollinger Bands) scored together before an order
+score_threshold = 0.5  # Minimum model score to place an order (ignored until the model has trained)
+magic_number = 123456
+deviation = 10  # Points a fill may differ from the request price
+order_deadline = 2.0  # Seconds after the signal during which requoted orders are re-priced and sent again
+max_order_attempts = 5
+max_open_trades = 3  # New entries are skipped while this many positions are open
+dynamic_stops = True  # Let the position monitor move TP/SL to the latest bands of the entry timeframe
+metrics_port = None  # Serve Prometheus metrics on http://127.0.0.1:<port>/metrics (None disables)
+metrics_interval = 60  # Seconds between snapshots appended to the metrics JSONL file (0 disables)
+
+def check_drift(engine):
+    for tf_name, mismatches in engine.check_drift().items():
+        print(f"{Fore.RED}Warning: {tf_name} bars drifted from terminal data at {len(mismatches)} points, e.g. {mismatches[0]}{Style.RESET_ALL}")
+
+def record_trade(trade_log, outcome, info):
+    # Called from the position monitor thread when a tracked position closes; the model
+    # learns from the TP/SL the trade was scored with, not the adjusted ones
+    print(f"\nTrade {outcome['position']} closed by {outcome['reason']}: {'win' if outcome['win'] else 'loss'} ({outcome['profit']:.2f})")
+    trade_log.append(outcome['close_time'], outcome['position'], outcome['direction'], outcome['entry_price'],
+                     info['entry_tp'], info['entry_sl'], outcome['win'])
+
+def retrain_model(trainer, scorer, metrics):
+    # No-op unless trades were logged since the last update
+    with metrics.stage('retrain'):
+        learned = trainer.update()
+    if learned:
+        print(f"{Fore.CYAN}Model updated with {learned} new trade(s), {trainer.trained_rows} in total.{Style.RESET_ALL}")
+        scorer.warm()
+
+def modify_trade(mt5, router, metrics, position, tp, sl):
+    tp, sl = router.normalize_price(tp), router.normalize_price(sl)  # Bands are raw floats; the server wants the tick grid
     request = {
         "action": mt5.TRADE_ACTION_SLTP,
-        "position": open_trade,
+        "position": position,
         "sl": sl,
         "tp": tp,
     }
-    result = mt5.order_send(request)
-    if result.retcode == mt5.TRADE_RETCODE_DONE:
-        print(f"{Fore.GREEN}Updated TP: {tp}, SL: {sl} for open trade.{Style.RESET_ALL}")
-    else:
-        print(f"{Fore.RED}Failed to update TP/SL. Retcode: {result.retcode}{Style.RESET_ALL}")
-        print(f"{Fore.RED}Last Error: {mt5.last_error()}{Style.RESET_ALL}")
-
-def countdown_timer(seconds):
-    for remaining in range(seconds, 0, -1):
-        print(f"{Fore.YELLOW}Next analysis will be in {remaining} seconds...{Style.RESET_ALL}", end="\r", flush=True)
-        time.sleep(1)
+    with metrics.stage('order_modify'):
+        result = mt5.order_send(request)
+    retcode = None if result is None else result.retcode  # None when the request never reached the server
+    metrics.inc('orders', action='modify', retcode=retcode)
+    if retcode == mt5.TRADE_RETCODE_DONE:
+        print(f"{Fore.GREEN}Updated TP: {tp}, SL: {sl} for trade {position}.{Style.RESET_ALL}")
+        return True
+    print(f"{Fore.RED}Failed to update TP/SL for trade {position}. Retcode: {retcode}{Style.RESET_ALL}")
+    print(f"{Fore.RED}Last Error: {mt5.last_error()}{Style.RESET_ALL}")
+    return False
+
+def adjust_levels(engine, position, info):
+    # New TP/SL for an open trade: the current bands of the timeframe it was entered on
+    row = engine.rows.get(info['timeframe'])
+    if row is None or pd.isna(row['BB_Upper']) or pd.isna(row['BB_Lower']):
+        return None
+    return (row['BB_Upper'], row['BB_Lower']) if info['direction'] == 'BUY' else (row['BB_Lower'], row['BB_Upper'])
+
+def countdown_timer(remaining):
+    print(f"{Fore.YELLOW}Next analysis will be in {int(round(remaining))} seconds...{Style.RESET_ALL}", end="\r", flush=True)
+
+def wait_for_next_bar(engine):
+    closed = engine.scheduler.wait(progress=countdown_timer)
     print("\n")
+    return closed
 
-open_trade = None
-
-while True:
-    signals = {}
-    tp, sl = None, None
-    timestamp = pd.Timestamp.now()
-    print("\n========================================")
-    print(f"{Fore.CYAN}Timestamp: {timestamp}{Style.RESET_ALL}")
-    print(f"{Fore.YELLOW}Fetching and analyzing data...{Style.RESET_ALL}")
-    
-    for tf_name, tf_value in timeframes.items():
-        df = fetch_data(tf_value)
-        df = analyze_bbma(df)
-        signals[tf_name] = df['Signal'].iloc[-1]
-    
-    print("Signals:", signals)
-    print(f"Suggested TP: {tp if tp else 'N/A'}, Suggested SL: {sl if sl else 'N/A'}")
-    print(f"Suggested TP: {tp}, Suggested SL: {sl}")
-    
-    if all(sig == 'Buy' for sig in signals.values()):
-        final_decision = 'BUY'
-    elif all(sig == 'Sell' for sig in signals.values()):
-        final_decision = 'SELL'
-    else:
-        final_decision = 'HOLD'
-    
-    print(f"{Fore.CYAN}Final Decision: {final_decision}{Style.RESET_ALL}")
-    
-    if open_trade:
-        print(f"{Fore.YELLOW}Trade still floating. Adjusting TP and SL dynamically.{Style.RESET_ALL}")
-        countdown_timer(60)
-        continue
-    
-    if final_decision in ['BUY', 'SELL']:
-        entry_price = mt5.symbol_info_tick(symbol).bid
-        df_m15 = fetch_data(mt5.TIMEFRAME_M15)
-        df_m15 = analyze_bbma(df_m15)
-        latest_m15 = df_m15.iloc[-1]
-
-        if final_decision == 'BUY':
-            tp = latest_m15['BB_Upper']
-            sl = latest_m15['BB_Lower']
-        else:
-            tp = latest_m15['BB_Lower']
-            sl = latest_m15['BB_Upper']
-        
-        print(f"Executing {final_decision} trade for {symbol} with TP: {tp} and SL: {sl}")
-        request = {
-            "action": mt5.TRADE_ACTION_DEAL,
-            "symbol": symbol,
-            "volume": 0.01,
-            "type": mt5.ORDER_TYPE_BUY if final_decision == 'BUY' else mt5.ORDER_TYPE_SELL,
-            "price": entry_price,
-            "sl": sl,
-            "tp": tp,
-            "deviation": 10,
-            "magic": 123456,
-            "comment": f"Learning {symbol}",
-            "type_filling": mt5.ORDER_FILLING_FOK
-        }
-        result = mt5.order_send(request)
-        if result.retcode == mt5.TRADE_RETCODE_DONE:
-            open_trade = result.order
-            print(f"{Fore.GREEN}Trade executed successfully!{Style.RESET_ALL}")
-            record_trade()
-        else:
-            print(f"{Fore.RED}Trade execution failed. Retcode: {result.retcode}{Style.RESET_ALL}")
-            print(f"{Fore.RED}Last Error: {mt5.last_error()}{Style.RESET_ALL}")
-    
-    retrain_model()
-    print("Waiting for the next analysis cycle...")
-    countdown_timer(60)
+def run(engine, router, scorer, trainer, monitor, metrics):
+    symbol = engine.symbol
+    cycle = 0
+
+    while True:
+        tp, sl = None, None
+        timestamp = pd.Timestamp.now()
+        cycle += 1
+        print("\n========================================")
+        print(f"{Fore.CYAN}Timestamp: {timestamp}{Style.RESET_ALL}")
+        print(f"{Fore.YELLOW}Fetching and analyzing data...{Style.RESET_ALL}")
+
+        with metrics.stage('fetch'):
+            rates = engine.fetch()
+        with metrics.stage('indicators'):
+            # Timeframes whose bar closed since the last wake-up commit it; the rest re-evaluate their forming bar
+            for tf_name, pushed in engine.analyze(rates).items():
+                metrics.inc('bars_processed', pushed, timeframe=tf_name)
+        signals = engine.signals()
+        if verify_interval and cycle % verify_interval == 0:
+            check_drift(engine)
+
+        print("Signals:", signals)
+        print(f"Suggested TP: {tp if tp else 'N/A'}, Suggested SL: {sl if sl else 'N/A'}")
+        print(f"Suggested TP: {tp}, Suggested SL: {sl}")
+
+        final_decision = engine.decision()
+        signal_at = time.perf_counter()
+
+        print(f"{Fore.CYAN}Final Decision: {final_decision}{Style.RESET_ALL}")
+        if final_decision != 'HOLD':
+            metrics.inc('signals_emitted', signal=final_decision)
+        print(f"Signal latency: {engine.scheduler.mark_signal():.2f}s after bar close")
+
+        open_trades = len(monitor)
+        if open_trades:
+            print(f"{Fore.YELLOW}{open_trades} trade(s) still floating. Adjusting TP and SL dynamically.{Style.RESET_ALL}")
+
+        if final_decision in ['BUY', 'SELL'] and open_trades >= max_open_trades:
+            print(f"{Fore.YELLOW}{final_decision} skipped: {open_trades} trade(s) already open.{Style.RESET_ALL}")
+        elif final_decision in ['BUY', 'SELL']:
+            entry_price = router.quote(final_decision)  # Ask for a buy, bid for a sell
+            candidates = []
+            for tf_name in score_timeframes:
+                row = engine.rows[tf_name]  # Evaluated from this cycle's fetch
+                upper, lower = row['BB_Upper'], row['BB_Lower']
+                tp, sl = (upper, lower) if final_decision == 'BUY' else (lower, upper)
+                candidates.append({'timeframe': tf_name, 'entry': entry_price, 'tp': tp, 'sl': sl})
+            with metrics.stage('score'):
+                choice = scorer.select(candidates)
+            latency = scorer.latency.summary()
+            if latency:
+                print(f"Scoring latency p50: {latency['p50'] * 1000:.2f}ms, p99: {latency['p99'] * 1000:.2f}ms, over budget: {scorer.overruns}")
+            if choice is None:
+                print(f"{Fore.YELLOW}{final_decision} skipped: model score below {score_threshold}.{Style.RESET_ALL}")
+                retrain_model(trainer, scorer, metrics)
+                wait_for_next_bar(engine)
+                continue
+            candidate, score, volume = choice
+            tp, sl = candidate['tp'], candidate['sl']
+
+            print(f"Executing {final_decision} trade for {symbol} with TP: {tp} and SL: {sl}"
+                  + (f" (score {score:.2f}, {candidate['timeframe']} bands, volume {volume})" if score is not None else ""))
+            # Checked, sent with a filling mode the symbol allows and re-priced after requotes
+            fill = router.market_order(final_decision, volume, sl=sl, tp=tp, reference=entry_price,
+                                       signal_at=signal_at, comment=f"Learning {symbol}")
+            if fill['done']:
+                print(f"{Fore.GREEN}Trade executed successfully at {fill['price']} ({fill['filling']}, {fill['attempts']} attempt(s), "
+                      f"{fill['latency'] * 1000:.1f}ms after the signal, slippage {fill['slippage']:+.1f} points){Style.RESET_ALL}")
+                monitor.track(fill['order'], tp=tp, sl=sl, entry_tp=tp, entry_sl=sl,
+                              direction=final_decision, timeframe=candidate['timeframe'])
+            else:
+                print(f"{Fore.RED}Trade execution failed. Retcode: {fill['retcode']}{Style.RESET_ALL}")
+                print(f"{Fore.RED}Reason: {fill['reason']}{Style.RESET_ALL}")
+
+        retrain_model(trainer, scorer, metrics)
+        print("Waiting for the next analysis cycle...")
+        wait_for_next_bar(engine)
+
+def main():
+    # Initialize colorama
+    colorama.init(autoreset=True)
+
+    # Connect to MetaTrader 5 (shut down on exit)
+    with MT5Connection(hub=data_hub) as mt5:
+        # User Input
+        symbol = input("Enter currency pair (e.g., EURUSD, XAUUSD, BTCUSD): ").strip().upper()
+
+        # File Paths
+        trade_history_file = f"data/trade_history_{symbol}.csv"  # Old CSV history, imported once into the trade log
+        trade_log_file = f"data/trades_{symbol}.bin"
+        learning_model_file = f"data/learning_{symbol}.joblib"
+        metrics_file = f"data/metrics_{symbol}.jsonl"
+        orders_file = f"data/orders_{symbol}.jsonl"
+
+        # Metrics: per-stage durations (fetch, indicators, retrain, score, order_send) and counters
+        metrics = Metrics(labels={'symbol': symbol, 'script': 'learn_trade'})
+        if metrics_port:
+            metrics.serve(metrics_port)
+        if metrics_interval:
+            metrics.start_jsonl(metrics_file, metrics_interval)
+
+        # Trade log (append-only binary records) and incremental trainer; the model
+        # only trains when new trades were logged and keeps boosting from its last checkpoint
+        trade_log = TradeLog(trade_log_file)
+        trade_log.import_csv(trade_history_file)
+        trainer = IncrementalTrainer(learning_model_file, trade_log)
+
+        # Scorer: gates and sizes orders with the warm model; inference latency is tracked per call
+        scorer = SignalScorer(trainer, threshold=score_threshold)
+        scorer.warm()
+
+        # Signal engine: delta-fetched M1 bars (closed bars go to the local bar store), M5..D1 built
+        # locally from them, one streaming BBMA per timeframe and a bar-close scheduler
+        engine = SignalEngine(mt5, symbol, mt5.timeframes(), capacity=num_candles,
+                              bar_store=BarStore('data/bars'), wake_mode=wake_mode)
+
+        # Order router: side price, supported filling mode, order_check first, requote retries;
+        # signal-to-fill latency and slippage of every order go to metrics and the orders file
+        router = OrderRouter(mt5, symbol, magic=magic_number, deviation=deviation, deadline=order_deadline,
+                             max_attempts=max_order_attempts, metrics=metrics, log_path=orders_file)
+        router.refresh()
+
+        # Deal sync: only deals newer than the last one seen are fetched, indexed by position and magic
+        deal_sync = DealSync(mt5, magic=magic_number)
+
+        # Position monitor: tracks every open trade in a background thread, applies TP/SL
+        # adjustments and logs closed trades, so the analysis loop never waits on a position.
+        # Its terminal calls share the connection's lock with the engine and the order router.
+        monitor = PositionMonitor(deal_sync, on_close=partial(record_trade, trade_log),
+                                  adjust=partial(adjust_levels, engine) if dynamic_stops else None,
+                                  modify=partial(modify_trade, mt5, router, metrics), min_change=router.info().point)
+        monitor.start()
+        try:
+            run(engine, router, scorer, trainer, monitor, metrics)
+        finally:
+            monitor.stop()
+
+if __name__ == '__main__':
+    main()
@@ -35,7 +35,8 @@ dependencies = [
     "MetaTrader5",
     "joblib",
     "xgboost",
-    "colorama"
+    "colorama",
+    "tzdata"
 ]
 
 total_packages = len(essential_packages) + len(dependencies)